@@ -0,0 +1,193 @@
+import boto3
+import hashlib
+import json
+import os
+import subprocess
+import tarfile
+import time
+
+# Build avoidance for the CodeBuild step: the WAR is keyed on a content hash of
+# the inputs that go into it (src/ and pom.xml). If a WAR for the same hash was
+# already built and uploaded to the artifact bucket it is downloaded into
+# target/ instead of running Maven.
+#
+# With CACHE_TARGET_TREE=1 (the Compile shard of the parallel pipeline) the
+# whole target/ tree (classes, test-classes, WAR) is cached as a tarball under
+# the same hash, so the test shards that start from it do not recompile.
+
+REGION = os.environ.get("AWS_REGION", "ap-south-1")
+ARTIFACT_BUCKET = os.environ.get("ARTIFACT_BUCKET", "dmanup-aws-codeartifact-bucket")
+CACHE_PREFIX = os.environ.get("BUILD_CACHE_PREFIX", "build-cache")
+BUILD_COMMAND = os.environ.get("BUILD_COMMAND", "mvn clean install")
+CACHE_TARGET_TREE = os.environ.get("CACHE_TARGET_TREE") == "1"
+WAR_PATH = os.path.join("target", "vprofile-v2.war")
+HASH_INPUTS = ["pom.xml", "src"]
+STATS_KEY = f"{CACHE_PREFIX}/stats.json"
+
+
+def normalized_properties(file_path):
+    # Comment and blank lines in .properties files do not change the behaviour
+    # of the WAR (e.g. the dummy comments appended by commit_code_change.py),
+    # so they are left out of the hash.
+    with open(file_path, 'rb') as file:
+        lines = file.read().splitlines()
+    return b"\n".join(line.strip() for line in lines
+                      if line.strip() and not line.lstrip().startswith((b'#', b'!')))
+
+
+def compute_source_hash(root_dir, inputs=HASH_INPUTS):
+    digest = hashlib.sha256()
+    for entry in inputs:
+        path = os.path.join(root_dir, entry)
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = []
+            for dir_path, dir_names, file_names in os.walk(path):
+                dir_names.sort()
+                files.extend(os.path.join(dir_path, name) for name in sorted(file_names))
+
+        for file_path in files:
+            relative_path = os.path.relpath(file_path, root_dir).replace(os.sep, '/')
+            if file_path.endswith('.properties'):
+                content = normalized_properties(file_path)
+            else:
+                with open(file_path, 'rb') as file:
+                    content = file.read()
+            digest.update(relative_path.encode('utf-8') + b'\0')
+            digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+def cache_key(source_hash):
+    return f"{CACHE_PREFIX}/{source_hash}/vprofile-v2.war"
+
+
+def tree_cache_key(source_hash):
+    return f"{CACHE_PREFIX}/{source_hash}/target.tar.gz"
+
+
+def lookup_cached_war(s3, bucket, source_hash, key=None):
+    key = key or cache_key(source_hash)
+    name = os.path.basename(key)
+    try:
+        response = s3.head_object(Bucket=bucket, Key=key)
+        print(f"Found cached {name} for source hash {source_hash}.")
+        return response.get('Metadata', {})
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            print(f"No cached {name} for source hash {source_hash}.")
+            return None
+        raise
+
+
+def pack_target_tree(root_dir, tarball_path):
+    with tarfile.open(tarball_path, 'w:gz') as tarball:
+        tarball.add(os.path.join(root_dir, 'target'), arcname='target')
+
+
+def unpack_target_tree(root_dir, tarball_path):
+    # The 'data' filter rejects members that would land outside root_dir
+    # (absolute paths, '..', links) if the cache object was tampered with.
+    # Python builds without it (before 3.9.17) get the same check by hand.
+    with tarfile.open(tarball_path, 'r:gz') as tarball:
+        if hasattr(tarfile, 'data_filter'):
+            tarball.extractall(root_dir, filter='data')
+        else:
+            root = os.path.realpath(root_dir)
+            for member in tarball.getmembers():
+                path = os.path.realpath(os.path.join(root, member.name))
+                if os.path.commonpath([root, path]) != root or member.issym() or member.islnk() or \
+                        not (member.isfile() or member.isdir()):
+                    raise Exception(f"Refusing to extract {member.name} from {tarball_path}")
+            tarball.extractall(root_dir)
+    # The fresh checkout is newer than the archived classes; touch them so
+    # Maven's stale-source check does not recompile everything
+    now = time.time()
+    for dir_path, _, file_names in os.walk(os.path.join(root_dir, 'target')):
+        for name in file_names:
+            os.utime(os.path.join(dir_path, name), (now, now))
+
+
+def load_stats(s3, bucket):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=STATS_KEY)
+        return json.loads(response['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return {"hits": 0, "misses": 0, "time_saved_seconds": 0.0}
+
+
+def save_stats(s3, bucket, stats):
+    s3.put_object(Bucket=bucket, Key=STATS_KEY, Body=json.dumps(stats).encode('utf-8'),
+                  ContentType='application/json')
+
+
+def publish_metrics(cache_hit, time_saved, hit_ratio, region):
+    cloudwatch = boto3.client('cloudwatch', region_name=region)
+    cloudwatch.put_metric_data(
+        Namespace='VProfile/BuildCache',
+        MetricData=[
+            {'MetricName': 'CacheHit', 'Value': 1 if cache_hit else 0, 'Unit': 'Count'},
+            {'MetricName': 'TimeSaved', 'Value': time_saved, 'Unit': 'Seconds'},
+            {'MetricName': 'HitRatio', 'Value': hit_ratio * 100, 'Unit': 'Percent'}
+        ]
+    )
+
+
+def build_with_cache(root_dir, bucket, region):
+    s3 = boto3.client('s3', region_name=region)
+    source_hash = compute_source_hash(root_dir)
+    print(f"Source tree hash: {source_hash}")
+
+    war_path = os.path.join(root_dir, WAR_PATH)
+    tarball_path = os.path.join(root_dir, 'target.tar.gz')
+    key = tree_cache_key(source_hash) if CACHE_TARGET_TREE else cache_key(source_hash)
+    metadata = lookup_cached_war(s3, bucket, source_hash, key)
+    start = time.time()
+
+    if metadata is not None:
+        if CACHE_TARGET_TREE:
+            s3.download_file(bucket, key, tarball_path)
+            unpack_target_tree(root_dir, tarball_path)
+            os.remove(tarball_path)
+        else:
+            os.makedirs(os.path.dirname(war_path), exist_ok=True)
+            s3.download_file(bucket, key, war_path)
+        elapsed = time.time() - start
+        build_seconds = float(metadata.get('build-seconds', 0))
+        time_saved = max(build_seconds - elapsed, 0.0)
+        print(f"Reused cached WAR in {elapsed:.1f}s, skipped a {build_seconds:.1f}s Maven build.")
+    else:
+        subprocess.run(BUILD_COMMAND, shell=True, check=True, cwd=root_dir)
+        elapsed = time.time() - start
+        time_saved = 0.0
+        s3.upload_file(war_path, bucket, cache_key(source_hash),
+                       ExtraArgs={'Metadata': {'build-seconds': f"{elapsed:.1f}"}})
+        print(f"Built WAR in {elapsed:.1f}s and stored it in s3://{bucket}/{cache_key(source_hash)}")
+        if CACHE_TARGET_TREE:
+            pack_target_tree(root_dir, tarball_path)
+            s3.upload_file(tarball_path, bucket, key, ExtraArgs={'Metadata': {'build-seconds': f"{elapsed:.1f}"}})
+            os.remove(tarball_path)
+            print(f"Stored the target/ tree in s3://{bucket}/{key}")
+
+    cache_hit = metadata is not None
+    stats = load_stats(s3, bucket)
+    stats['hits' if cache_hit else 'misses'] += 1
+    stats['time_saved_seconds'] += time_saved
+    save_stats(s3, bucket, stats)
+
+    hit_ratio = stats['hits'] / (stats['hits'] + stats['misses'])
+    print(f"Build cache {'HIT' if cache_hit else 'MISS'}; time saved this run: {time_saved:.1f}s")
+    print(f"Build cache hit ratio: {hit_ratio:.1%} ({stats['hits']} hits, {stats['misses']} misses), "
+          f"total time saved: {stats['time_saved_seconds']:.1f}s")
+
+    try:
+        publish_metrics(cache_hit, time_saved, hit_ratio, region)
+    except Exception as e:
+        print(f"Could not publish build cache metrics: {e}")
+
+    return cache_hit
+
+
+if __name__ == '__main__':
+    build_with_cache(os.getcwd(), ARTIFACT_BUCKET, REGION)
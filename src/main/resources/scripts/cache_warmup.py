@@ -0,0 +1,210 @@
+import argparse
+import gzip
+import os
+import time
+
+import boto3
+import pymysql
+import pymysql.cursors
+
+from java_serialization import read_class, serialize_object
+from memcached_client import MemcachedClient, MemcachedError
+from properties_file import db_settings_from_properties, read_properties
+
+# Warms a fresh memcached cluster from the accounts database so the first
+# logins after create_elasticache.py do not all miss the cache and fall
+# through to RDS.
+#
+# Entries are written exactly as the app writes them in MemcachedUtils:
+#   key     - the user id as a string (UserController caches under the path id)
+#   value   - a Java-serialized com.visualpathit.account.model.User, roles
+#             left null (Role is not Serializable), flags 1 and gzip above
+#             16 KiB like spymemcached's SerializingTranscoder
+#   expiry  - 900 seconds
+#   node    - String.hashCode() modulo the node count, in the order returned
+#             by ElastiCache auto-discovery, which is how the cluster client's
+#             default ArrayModNodeLocator places keys
+#
+# The memcached nodes are only reachable from inside the VPC, so run this from
+# a Beanstalk instance or a VPC-attached build. Works against a local MySQL
+# and memcached as well.
+
+DEFAULT_PROPERTIES_FILE = 'src/main/resources/application.properties'
+USER_CLASS = 'com.visualpathit.account.model.User'
+DEFAULT_CLASS_FILES = ['target/vprofile-v2.war', 'target/classes/com/visualpathit/account/model/User.class']
+CACHE_EXPIRE = 900  # MemcachedUtils.memcachedSetData expireTime
+SERIALIZED_FLAG = 1
+COMPRESSED_FLAG = 2
+COMPRESSION_THRESHOLD = 16384
+PROGRESS_INTERVAL = 5
+
+
+def java_string_hash(value):
+    # java.lang.String.hashCode() over UTF-16 code units, as an unsigned 32-bit
+    # value (spymemcached's NATIVE_HASH)
+    units = value.encode('utf-16-be', 'surrogatepass')
+    result = 0
+    for index in range(0, len(units), 2):
+        result = (31 * result + ((units[index] << 8) | units[index + 1])) & 0xFFFFFFFF
+    return result
+
+
+def discover_nodes(host, port):
+    # Returns [(host, port), ...] for every node behind a configuration
+    # endpoint, or the endpoint itself for a plain memcached server
+    with MemcachedClient(host, port) as client:
+        try:
+            config = client.config_get('cluster')
+        except MemcachedError:
+            return [(host, port)]
+    if not config:
+        return [(host, port)]
+    nodes = []
+    for entry in config.decode().split('\n')[1].split():
+        hostname, ip_address, node_port = entry.split('|')
+        nodes.append((ip_address or hostname, int(node_port)))
+    return nodes
+
+
+def encode_user(class_desc, row):
+    value = serialize_object(class_desc, row)
+    flags = SERIALIZED_FLAG
+    if len(value) > COMPRESSION_THRESHOLD:
+        value = gzip.compress(value)
+        flags |= COMPRESSED_FLAG
+    return value, flags
+
+
+def hot_users_query(roles, limit):
+    # Users that can log in (have at least one role), newest accounts first
+    role_filter = f" AND r.name IN ({', '.join(['%s'] * len(roles))})" if roles else ""
+    query = ("SELECT u.* FROM user u WHERE EXISTS (SELECT 1 FROM user_role ur JOIN role r ON r.id = ur.role_id "
+             f"WHERE ur.user_id = u.id{role_filter}) ORDER BY u.id DESC")
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return query, list(roles or [])
+
+
+def publish_metrics(namespace, warmed, seconds, region):
+    cloudwatch = boto3.client('cloudwatch', region_name=region)
+    cloudwatch.put_metric_data(
+        Namespace=namespace,
+        MetricData=[
+            {'MetricName': 'ItemsWarmed', 'Value': warmed, 'Unit': 'Count'},
+            {'MetricName': 'WarmupDuration', 'Value': seconds, 'Unit': 'Seconds'},
+            {'MetricName': 'WarmupRate', 'Value': warmed / seconds if seconds else 0, 'Unit': 'Count/Second'}
+        ]
+    )
+
+
+class WarmupProgress:
+
+    def __init__(self, total):
+        self.total = total
+        self.read = 0
+        self.stored = 0
+        self.failed = 0
+        self.bytes = 0
+        self.start = time.time()
+        self.last_report = self.start
+
+    def rate(self):
+        elapsed = time.time() - self.start
+        return self.read / elapsed if elapsed else 0.0
+
+    def report(self, force=False):
+        now = time.time()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        rate = self.rate()
+        eta = f", ETA {(self.total - self.read) / rate:.0f}s" if rate and self.total > self.read else ""
+        print(f"Warm-up: {self.read}/{self.total} rows, {self.stored} stored, {self.failed} failed, "
+              f"{self.bytes / 1024 / 1024:.1f} MiB, {rate:,.0f} items/s{eta}")
+
+
+def warm_cache(db, memcached_endpoint, class_desc, roles=None, limit=None, batch_size=200, rate_limit=0,
+               expire=CACHE_EXPIRE):
+    # db: dict with host, port, user, password, database. Returns WarmupProgress.
+    nodes = discover_nodes(*memcached_endpoint)
+    print(f"Warming {len(nodes)} memcached node(s): {', '.join(f'{host}:{port}' for host, port in nodes)}")
+    clients = [MemcachedClient(host, port) for host, port in nodes]
+
+    query, params = hot_users_query(roles, limit)
+    connection = pymysql.connect(**db, cursorclass=pymysql.cursors.SSDictCursor)
+    try:
+        with connection.cursor(pymysql.cursors.Cursor) as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM ({query}) hot", params)
+            progress = WarmupProgress(cursor.fetchone()[0])
+
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                batches = [[] for _ in clients]
+                for row in rows:
+                    key = str(row['id'])
+                    value, flags = encode_user(class_desc, row)
+                    batches[java_string_hash(key) % len(clients)].append((key, value, flags))
+                    progress.bytes += len(value)
+                for client, batch in zip(clients, batches):
+                    for flags in {item[2] for item in batch}:
+                        items = [(key, value) for key, value, item_flags in batch if item_flags == flags]
+                        stored = client.set_many(items, expire=expire, flags=flags)
+                        progress.stored += stored
+                        progress.failed += len(items) - stored
+                progress.read += len(rows)
+
+                # Simple rate limiter: never run ahead of rate_limit items/s
+                if rate_limit:
+                    ahead = progress.read / rate_limit - (time.time() - progress.start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+                progress.report()
+    finally:
+        connection.close()
+        for client in clients:
+            client.close()
+    progress.report(force=True)
+    return progress
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Warm the memcached cluster with users from the accounts database")
+    parser.add_argument('--properties', default=DEFAULT_PROPERTIES_FILE,
+                        help="application.properties with the jdbc.* and memcached.active.* endpoints")
+    parser.add_argument('--memcached', help="host[:port], overrides memcached.active.host/port")
+    parser.add_argument('--class-file', help="User.class or the WAR containing it (default: target/)")
+    parser.add_argument('--serial-version-uid', type=int,
+                        help="serialVersionUID of User if it cannot be computed from the class file")
+    parser.add_argument('--roles', nargs='+', help="only warm users with these roles, e.g. ROLE_USER")
+    parser.add_argument('--limit', type=int, help="maximum number of users to warm")
+    parser.add_argument('--batch-size', type=int, default=200, help="keys per pipelined multi-set")
+    parser.add_argument('--rate', type=int, default=0, help="maximum items per second (0 = unlimited)")
+    parser.add_argument('--expire', type=int, default=CACHE_EXPIRE, help="TTL in seconds")
+    parser.add_argument('--metrics-namespace', help="also publish the result to this CloudWatch namespace")
+    parser.add_argument('--region', default='ap-south-1')
+    args = parser.parse_args()
+
+    properties = read_properties(args.properties)
+    if args.memcached:
+        host, _, port = args.memcached.partition(':')
+        memcached_endpoint = (host, int(port or 11211))
+    else:
+        memcached_endpoint = (properties['memcached.active.host'], int(properties['memcached.active.port']))
+
+    class_file = args.class_file or next((path for path in DEFAULT_CLASS_FILES if os.path.exists(path)), None)
+    if not class_file:
+        raise SystemExit("User.class not found; build the WAR first or pass --class-file.")
+    class_desc = read_class(class_file, USER_CLASS, args.serial_version_uid)
+    print(f"Serializing {USER_CLASS} from {class_file} (serialVersionUID {class_desc['serial_version_uid']})")
+
+    progress = warm_cache(db_settings_from_properties(properties), memcached_endpoint, class_desc, args.roles,
+                          args.limit, args.batch_size, args.rate, args.expire)
+    elapsed = time.time() - progress.start
+    print(f"Warmed {progress.stored} of {progress.read} users in {elapsed:.1f}s ({progress.rate():,.0f} items/s).")
+    if args.metrics_namespace:
+        publish_metrics(args.metrics_namespace, progress.stored, elapsed, args.region)
+    raise SystemExit(0 if not progress.failed else 1)
@@ -0,0 +1,147 @@
+import boto3
+import json
+import time
+from datetime import datetime
+
+# Rollout settings shared by create_codepipeline.py and the deployment config
+# benchmark below (run this file directly to benchmark).
+REGION = "ap-south-1"
+DEPLOY_APP_NAME = "dmanup-aws-codedeploy-demo-app"
+DEPLOY_GROUP_NAME = "dmanup-aws-codedeploy-demo-group"
+BEANSTALK_ENV_NAME = "dmanup-aws-codecomit-demo-env"
+
+# Deployment config used by the deployment group. Any of the built-in
+# CodeDeployDefault.* configs or one of CUSTOM_DEPLOYMENT_CONFIGS below.
+DEPLOYMENT_CONFIG_NAME = "CodeDeployDefault.HalfAtATime"
+
+# Custom deployment configs: name -> minimum healthy hosts as a fleet percentage
+CUSTOM_DEPLOYMENT_CONFIGS = {
+    "vprofile-min-healthy-75pct": 75,
+    "vprofile-min-healthy-66pct": 66,
+    "vprofile-min-healthy-25pct": 25
+}
+
+# Configurations rolled out one after another in benchmark mode
+BENCHMARK_DEPLOYMENT_CONFIGS = [
+    "CodeDeployDefault.OneAtATime",
+    "vprofile-min-healthy-75pct",
+    "CodeDeployDefault.HalfAtATime",
+    "vprofile-min-healthy-25pct",
+    "CodeDeployDefault.AllAtOnce"
+]
+BENCHMARK_RESULTS_FILE = "deployment_config_benchmark.json"
+
+
+def create_custom_deployment_configs(codedeploy, configs=CUSTOM_DEPLOYMENT_CONFIGS):
+    for config_name, min_healthy_percent in configs.items():
+        try:
+            codedeploy.create_deployment_config(
+                deploymentConfigName=config_name,
+                minimumHealthyHosts={'type': 'FLEET_PERCENT', 'value': min_healthy_percent},
+                computePlatform='Server'
+            )
+            print(f"Created CodeDeploy deployment config: {config_name} ({min_healthy_percent}% healthy)")
+        except codedeploy.exceptions.DeploymentConfigAlreadyExistsException:
+            print(f"CodeDeploy deployment config {config_name} already exists.")
+
+
+def get_beanstalk_auto_scaling_groups(env_name, region):
+    elasticbeanstalk = boto3.client('elasticbeanstalk', region_name=region)
+    try:
+        resources = elasticbeanstalk.describe_environment_resources(EnvironmentName=env_name)
+        auto_scaling_groups = [group['Name'] for group in resources['EnvironmentResources']['AutoScalingGroups']]
+        print(f"Auto Scaling groups for Beanstalk environment {env_name}: {auto_scaling_groups}")
+        return auto_scaling_groups
+    except elasticbeanstalk.exceptions.ClientError as e:
+        print(f"Could not fetch Auto Scaling groups for Beanstalk environment {env_name}: {e}")
+        return []
+
+
+def deployment_group_targets(env_name, region):
+    # Target the Beanstalk Auto Scaling group when it exists, otherwise fall
+    # back to the EC2 tag filter used before.
+    auto_scaling_groups = get_beanstalk_auto_scaling_groups(env_name, region)
+    if auto_scaling_groups:
+        return {'autoScalingGroups': auto_scaling_groups, 'ec2TagFilters': []}
+    return {
+        'autoScalingGroups': [],
+        'ec2TagFilters': [{'Key': 'Name', 'Value': 'CodeDeployDemo', 'Type': 'KEY_AND_VALUE'}]
+    }
+
+
+def run_deployment(codedeploy, app_name, group_name, config_name, revision):
+    codedeploy.update_deployment_group(
+        applicationName=app_name,
+        currentDeploymentGroupName=group_name,
+        deploymentConfigName=config_name
+    )
+    deployment_id = codedeploy.create_deployment(
+        applicationName=app_name,
+        deploymentGroupName=group_name,
+        deploymentConfigName=config_name,
+        revision=revision,
+        description=f"Rollout benchmark with {config_name}"
+    )['deploymentId']
+    print(f"Started deployment {deployment_id} with {config_name}")
+
+    while True:
+        info = codedeploy.get_deployment(deploymentId=deployment_id)['deploymentInfo']
+        status = info['status']
+        if status in ('Succeeded', 'Failed', 'Stopped'):
+            break
+        print(f"Current Deployment Status: {status}")
+        time.sleep(15)
+
+    overview = info.get('deploymentOverview', {})
+    duration = (info.get('completeTime', datetime.now(info['createTime'].tzinfo)) - info['createTime']).total_seconds()
+    result = {
+        'deploymentConfigName': config_name,
+        'deploymentId': deployment_id,
+        'status': status,
+        'durationSeconds': round(duration, 1),
+        'instancesSucceeded': overview.get('Succeeded', 0),
+        'instancesFailed': overview.get('Failed', 0)
+    }
+    print(f"Deployment {deployment_id} with {config_name}: {status} in {duration:.1f}s")
+    return result
+
+
+def benchmark_deployment_configs(app_name, group_name, config_names, region, results_file=BENCHMARK_RESULTS_FILE):
+    codedeploy = boto3.client('codedeploy', region_name=region)
+    create_custom_deployment_configs(codedeploy)
+
+    group_info = codedeploy.get_deployment_group(applicationName=app_name,
+                                                 deploymentGroupName=group_name)['deploymentGroupInfo']
+    original_config = group_info['deploymentConfigName']
+    revision = group_info.get('targetRevision')
+    if not revision:
+        raise Exception(f"Deployment group {group_name} has no previous revision to redeploy")
+
+    results = []
+    try:
+        for config_name in config_names:
+            results.append(run_deployment(codedeploy, app_name, group_name, config_name, revision))
+    finally:
+        codedeploy.update_deployment_group(
+            applicationName=app_name,
+            currentDeploymentGroupName=group_name,
+            deploymentConfigName=original_config
+        )
+        print(f"Restored deployment config {original_config} on {group_name}")
+
+    with open(results_file, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    print(f"{'Deployment config':<36} {'Status':<10} {'Duration (s)':>12}")
+    for result in sorted(results, key=lambda r: r['durationSeconds']):
+        print(f"{result['deploymentConfigName']:<36} {result['status']:<10} {result['durationSeconds']:>12}")
+    succeeded = [result for result in results if result['status'] == 'Succeeded']
+    if succeeded:
+        fastest = min(succeeded, key=lambda r: r['durationSeconds'])
+        print(f"Fastest successful rollout: {fastest['deploymentConfigName']} ({fastest['durationSeconds']}s)")
+    print(f"Saved benchmark results to {results_file}")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_deployment_configs(DEPLOY_APP_NAME, DEPLOY_GROUP_NAME, BENCHMARK_DEPLOYMENT_CONFIGS, REGION)
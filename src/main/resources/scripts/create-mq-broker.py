@@ -1,41 +1,126 @@
+import base64
 import boto3
 import json
 import time
 import requests
+from urllib.parse import quote
+from secrets_cache import get_or_create_secret
+
+# Sustained msgs/s per broker node for ~1 KB persistent messages with
+# publisher confirms. Rough starting points only; replace them with numbers
+# measured by rabbitmq_benchmark.py for our own message profile.
+BROKER_INSTANCE_THROUGHPUT = [
+    ('mq.t3.micro', 1000),
+    ('mq.m5.large', 10000),
+    ('mq.m5.xlarge', 20000),
+    ('mq.m5.2xlarge', 40000),
+    ('mq.m5.4xlarge', 80000)
+]
+CLUSTER_UNSUPPORTED_INSTANCE_TYPES = ('mq.t3.micro',)
+THROUGHPUT_HEADROOM = 0.7
+CLUSTER_MAX_SUBNETS = 3
+
+# rabbitmq.conf keys that Amazon MQ accepts in a broker configuration
+BROKER_CONFIGURATION_DATA = """consumer_timeout = 1800000
+heartbeat = 60
+"""
+
+# Policies cannot be set through a broker configuration, so they are applied
+# with the management API once the broker runs. Only one policy applies per
+# queue, and this one outranks the AWS-owned ha-all policy of cluster brokers,
+# so it repeats the mirroring settings for CLUSTER_MULTI_AZ.
+BROKER_POLICY_NAME = 'vprofile-performance'
+BROKER_POLICY = {
+    'pattern': '^(?!amq\\.).*',
+    'apply-to': 'queues',
+    'priority': 1,
+    'definition': {
+        'queue-mode': 'lazy',
+        'max-length': 1000000,
+        'overflow': 'reject-publish'
+    }
+}
+CLUSTER_MIRRORING = {'ha-mode': 'all', 'ha-sync-mode': 'automatic'}
+
+
+def select_broker_instance_type(target_msgs_per_second, deployment_mode):
+    # Smallest instance type whose estimated throughput covers the target with
+    # headroom. A cluster does not scale a single queue beyond one node, so the
+    # per-node figure is used for both deployment modes.
+    candidates = [(instance_type, throughput) for instance_type, throughput in BROKER_INSTANCE_THROUGHPUT
+                  if deployment_mode != 'CLUSTER_MULTI_AZ' or instance_type not in CLUSTER_UNSUPPORTED_INSTANCE_TYPES]
+    for instance_type, throughput in candidates:
+        if throughput * THROUGHPUT_HEADROOM >= target_msgs_per_second:
+            return instance_type
+    print(f"No instance type covers {target_msgs_per_second} msgs/s, using the largest one.")
+    return candidates[-1][0]
+
+
+def select_subnets(subnets, deployment_mode):
+    # One subnet for SINGLE_INSTANCE; one subnet per AZ (up to three) so the
+    # cluster nodes are spread across AZs for CLUSTER_MULTI_AZ
+    if deployment_mode == 'SINGLE_INSTANCE':
+        return [subnets[0]['SubnetId']]
+    by_az = {}
+    for subnet in sorted(subnets, key=lambda subnet: subnet['SubnetId']):
+        by_az.setdefault(subnet['AvailabilityZone'], subnet['SubnetId'])
+    subnet_ids = [by_az[az] for az in sorted(by_az)][:CLUSTER_MAX_SUBNETS]
+    if len(subnet_ids) < 2:
+        print("Only one availability zone available; the cluster will not survive an AZ outage.")
+    return subnet_ids
+
+
+def create_or_update_broker_configuration(configuration_name, engine_version, data, region):
+    # Returns {'Id': ..., 'Revision': ...} of a configuration holding data,
+    # adding a revision only when the content changed
+    mq = boto3.client('mq', region_name=region)
+    configurations = mq.list_configurations(MaxResults=100)['Configurations']
+    existing = next((configuration for configuration in configurations
+                     if configuration['Name'] == configuration_name), None)
+    if existing:
+        configuration_id = existing['Id']
+        revision = existing['LatestRevision']['Revision']
+        current = mq.describe_configuration_revision(ConfigurationId=configuration_id,
+                                                     ConfigurationRevision=str(revision))['Data']
+        if base64.b64decode(current).decode() == data:
+            print(f"Broker configuration {configuration_name} is up to date (revision {revision}).")
+            return {'Id': configuration_id, 'Revision': revision}
+    else:
+        configuration_id = mq.create_configuration(
+            EngineType='RABBITMQ',
+            EngineVersion=engine_version,
+            Name=configuration_name,
+            AuthenticationStrategy='SIMPLE'
+        )['Id']
+        print(f"Created broker configuration {configuration_name}: {configuration_id}")
+
+    response = mq.update_configuration(ConfigurationId=configuration_id,
+                                       Data=base64.b64encode(data.encode()).decode())
+    revision = response['LatestRevision']['Revision']
+    print(f"Broker configuration {configuration_name} is now at revision {revision}.")
+    return {'Id': configuration_id, 'Revision': revision}
+
+
+def apply_broker_policy(broker_id, username, password, deployment_mode, region):
+    # The management API is only reachable from inside the VPC for private
+    # brokers; outside it the policy is reported and skipped
+    mq = boto3.client('mq', region_name=region)
+    console_url = mq.describe_broker(BrokerId=broker_id)['BrokerInstances'][0]['ConsoleURL']
+    policy = json.loads(json.dumps(BROKER_POLICY))
+    if deployment_mode == 'CLUSTER_MULTI_AZ':
+        policy['definition'].update(CLUSTER_MIRRORING)
+    url = f"{console_url}/api/policies/{quote('/', safe='')}/{BROKER_POLICY_NAME}"
+    try:
+        response = requests.put(url, json=policy, auth=(username, password), timeout=10)
+        response.raise_for_status()
+        print(f"Applied policy {BROKER_POLICY_NAME}: {json.dumps(policy['definition'])}")
+    except requests.RequestException as e:
+        print(f"Could not apply policy {BROKER_POLICY_NAME} through {console_url} ({e}). "
+              f"Re-run from inside the VPC to apply it.")
 
 
-def get_or_create_secret(secret_name, region):
-    client = boto3.client('secretsmanager', region_name=region)
-
-    try:
-        # Check if the secret already exists
-        response = client.describe_secret(SecretId=secret_name)
-        # Fetch the secret value
-        secret_response = client.get_secret_value(SecretId=secret_name)
-        secret = json.loads(secret_response['SecretString'])
-        print(f"Secret {secret_name} already exists.")
-    except client.exceptions.ResourceNotFoundException:
-        # Generate a secure password
-        import secrets
-        password = ''.join(secrets.choice(
-            'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*+,-./:;<=>?@[]^_`{|}~') for i in
-                           range(16))
-        secret = {
-            "username": "admin",
-            "password": password
-        }
-        # Store the secret in AWS Secrets Manager
-        client.create_secret(
-            Name=secret_name,
-            Description="MQ broker credentials",
-            SecretString=json.dumps(secret)
-        )
-        print(f"Stored new secret {secret_name} in AWS Secrets Manager.")
-
-    return secret
-
-
-def create_or_get_mq_broker(broker_name, broker_instance_type, engine_version, subnet_id, security_group_id, region):
+def create_or_get_mq_broker(broker_name, broker_instance_type, engine_version, subnet_ids, security_group_id, region,
+                            deployment_mode='SINGLE_INSTANCE', configuration=None):
     mq = boto3.client('mq', region_name=region)
 
     # Check if the broker already exists
@@ -43,25 +128,35 @@ def create_or_get_mq_broker(broker_name, broker_instance_type, engine_version, s
         response = mq.describe_broker(BrokerId=broker_name)
         broker_id = response['BrokerId']
         print(f"MQ Broker {broker_name} already exists with ID: {broker_id}")
+        if response['DeploymentMode'] != deployment_mode:
+            print(f"Broker runs as {response['DeploymentMode']}; the deployment mode cannot be changed in place.")
+        current_configuration = response.get('Configurations', {}).get('Current', {})
+        if configuration and (current_configuration.get('Id'), current_configuration.get('Revision')) != \
+                (configuration['Id'], configuration['Revision']):
+            mq.update_broker(BrokerId=broker_id, Configuration=configuration)
+            print(f"Attached configuration revision {configuration['Revision']}; "
+                  f"it takes effect at the next reboot or maintenance window.")
         return broker_id
     except mq.exceptions.NotFoundException:
         print(f"MQ Broker {broker_name} does not exist, creating a new one.")
 
-    secret = get_or_create_secret('RabbitMQ_Credentials', region)
+    secret = get_or_create_secret('RabbitMQ_Credentials', region, "MQ broker credentials")
     username = secret['username']
     password = secret['password']
 
     broker_params = {
         'BrokerName': broker_name,
-        'DeploymentMode': 'SINGLE_INSTANCE',
+        'DeploymentMode': deployment_mode,
         'EngineType': 'RabbitMQ',
         'EngineVersion': engine_version,
         'HostInstanceType': broker_instance_type,
-        'SubnetIds': [subnet_id],
+        'SubnetIds': subnet_ids,
         'SecurityGroups': [security_group_id],
         'Users': [{"Username": username, "Password": password}],
         'PubliclyAccessible': False
     }
+    if configuration:
+        broker_params['Configuration'] = configuration
 
     #print("Broker parameters:")
     #print(json.dumps(broker_params, indent=2))
@@ -84,8 +179,11 @@ def create_or_get_mq_broker(broker_name, broker_instance_type, engine_version, s
 
 region = 'ap-south-1'
 broker_name = 'dmanup-aws-codecomit-demo-mq-broker'
-broker_instance_type = 'mq.t3.micro'
+deployment_mode = 'SINGLE_INSTANCE'  # or 'CLUSTER_MULTI_AZ'
+target_msgs_per_second = 500  # peak publish rate the broker has to sustain
+broker_instance_type = select_broker_instance_type(target_msgs_per_second, deployment_mode)
 engine_version = '3.8.22'
+configuration_name = f"{broker_name}-config"
 security_group_name = 'dmanup-aws-codecomit-backend-secgrp'
 
 # Fetch the security group ID
@@ -101,13 +199,17 @@ else:
 vpc_id = ec2.describe_vpcs()['Vpcs'][0]['VpcId']
 print(f"VPC ID: {vpc_id}")
 
-# Fetch Subnet IDs
-subnet_ids = [subnet['SubnetId'] for subnet in
-              ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['Subnets']]
+# Fetch subnets and select one per AZ for the deployment mode
+subnets = ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['Subnets']
+subnet_ids = select_subnets(subnets, deployment_mode)
 print(f"Subnet IDs: {subnet_ids}")
+print(f"Broker: {deployment_mode} on {broker_instance_type} for {target_msgs_per_second} msgs/s")
 
-# Select a single subnet for SINGLE_INSTANCE deployment mode
-subnet_id = subnet_ids[0]
+# Create or get the broker configuration and the MQ broker
+configuration = create_or_update_broker_configuration(configuration_name, engine_version,
+                                                      BROKER_CONFIGURATION_DATA, region)
+broker_id = create_or_get_mq_broker(broker_name, broker_instance_type, engine_version, subnet_ids, security_group_id,
+                                    region, deployment_mode, configuration)
 
-# Create or get the MQ broker
-create_or_get_mq_broker(broker_name, broker_instance_type, engine_version, subnet_id, security_group_id, region)
+secret = get_or_create_secret('RabbitMQ_Credentials', region, "MQ broker credentials")
+apply_broker_policy(broker_id, secret['username'], secret['password'], deployment_mode, region)
@@ -11,45 +11,30 @@
 
 import boto3
 import pymysql
-import json
 import time
 import os
 import requests
-
-
-def get_or_create_secret(secret_name, region):
-    client = boto3.client('secretsmanager', region_name=region)
-
-    try:
-        # Check if the secret already exists
-        response = client.describe_secret(SecretId=secret_name)
-        # Fetch the secret value
-        secret_response = client.get_secret_value(SecretId=secret_name)
-        secret = json.loads(secret_response['SecretString'])
-        print(f"Secret {secret_name} already exists.")
-    except client.exceptions.ResourceNotFoundException:
-        # Generate a secure password
-        import secrets
-        password = ''.join(secrets.choice(
-            'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*+,-./:;<=>?@[]^_`{|}~') for i in
-                           range(16))
-        secret = {
-            "username": "admin",
-            "password": password
-        }
-        # Store the secret in AWS Secrets Manager
-        client.create_secret(
-            Name=secret_name,
-            Description="RDS MySQL DB credentials",
-            SecretString=json.dumps(secret)
-        )
-        print(f"Stored new secret {secret_name} in AWS Secrets Manager.")
-
-    return secret
-
-
-def create_or_get_rds_instance(db_instance_identifier, db_instance_class, engine, master_username, master_user_password,
-                               db_name, subnet_group_name, security_group_id, parameter_group_name, region):
+from secrets_cache import get_or_create_secret
+from readiness_probes import probe_mysql, wait_until_ready
+from rds_tuning import apply_tuning_profile
+from rds_sizing import size_database, create_arguments, apply_sizing, print_sizing
+from index_advisor import advise_indexes
+from golden_snapshot import (dump_hash, find_golden_snapshot, restore_from_golden_snapshot, tag_instance_dump_hash,
+                             create_golden_snapshot)
+from vpc_seeding import check_seedable, seed_in_vpc, seed_manifest_in_vpc
+from db_export import execute_file, load_manifest, manifest_hash
+from rds_insights import monitoring_arguments, apply_monitoring, enable_slow_query_log
+
+
+def create_or_get_rds_instance(db_instance_identifier, sizing, engine, master_username, master_user_password,
+                               db_name, subnet_group_name, security_group_id, parameter_group_name, region,
+                               resize_existing=True, monitoring=None, tuning_profile=None, publicly_accessible=False,
+                               backup_retention_days=0):
+    # sizing comes from rds_sizing.size_database: instance class, storage type,
+    # IOPS/throughput and the autoscaling limit; monitoring from
+    # rds_insights.monitoring_arguments. New instances are private unless
+    # publicly_accessible is set for seeding over the internet.
+    monitoring = monitoring or {}
     rds = boto3.client('rds', region_name=region)
 
     # Check if the RDS instance already exists
@@ -57,26 +42,31 @@ def create_or_get_rds_instance(db_instance_identifier, db_instance_class, engine
         response = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)
         endpoint = response['DBInstances'][0]['Endpoint']['Address']
         print(f"RDS Instance {db_instance_identifier} already exists with endpoint: {endpoint}")
+        # Existing instances get the sizing differences previewed and applied,
+        # and the parameter group tuned once the new class is in effect
+        apply_sizing(db_instance_identifier, sizing, region, dry_run=not resize_existing,
+                     tuning_profile=tuning_profile)
+        if monitoring and apply_monitoring(db_instance_identifier, monitoring, region):
+            rds.get_waiter('db_instance_available').wait(DBInstanceIdentifier=db_instance_identifier)
         return endpoint
     except rds.exceptions.DBInstanceNotFoundFault:
         print(f"RDS Instance {db_instance_identifier} does not exist, creating a new one.")
 
     response = rds.create_db_instance(
         DBInstanceIdentifier=db_instance_identifier,
-        DBInstanceClass=db_instance_class,
         Engine=engine,
         MasterUsername=master_username,
         MasterUserPassword=master_user_password,
-        AllocatedStorage=20,
         DBSubnetGroupName=subnet_group_name,
         VpcSecurityGroupIds=[security_group_id],
         DBParameterGroupName=parameter_group_name,
-        BackupRetentionPeriod=0,
-        PubliclyAccessible=True,  # Ensure the RDS instance is publicly accessible
+        BackupRetentionPeriod=backup_retention_days,  # read replicas need automated backups
+        PubliclyAccessible=publicly_accessible,
         Port=3306,
         DBName=db_name,
         EngineVersion='8.0',
-        StorageType='gp2'
+        **create_arguments(sizing),
+        **monitoring
     )
 
     rds.get_waiter('db_instance_available').wait(DBInstanceIdentifier=db_instance_identifier)
@@ -86,6 +76,68 @@ def create_or_get_rds_instance(db_instance_identifier, db_instance_class, engine
     return endpoint
 
 
+def rds_instance_exists(db_instance_identifier, region):
+    rds = boto3.client('rds', region_name=region)
+    try:
+        rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)
+        return True
+    except rds.exceptions.DBInstanceNotFoundFault:
+        return False
+
+
+def enable_automated_backups(db_instance_identifier, region, retention_days=1):
+    # Read replicas need automated backups (and so binary logging) on the source
+    rds = boto3.client('rds', region_name=region)
+    instance = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0]
+    if instance['BackupRetentionPeriod'] > 0:
+        return
+    rds.modify_db_instance(
+        DBInstanceIdentifier=db_instance_identifier,
+        BackupRetentionPeriod=retention_days,
+        ApplyImmediately=True
+    )
+    rds.get_waiter('db_instance_available').wait(DBInstanceIdentifier=db_instance_identifier)
+    print(f"Enabled automated backups on RDS instance {db_instance_identifier} for read replicas")
+
+
+def create_read_replicas(db_instance_identifier, db_instance_class, replica_count, availability_zones,
+                         parameter_group_name, region):
+    # Starts creating the missing replicas without waiting for them, so they
+    # build while the primary is being seeded. Replicas are spread over the
+    # availability zones and stay private. Returns all replica identifiers.
+    rds = boto3.client('rds', region_name=region)
+    replica_ids = [f"{db_instance_identifier}-replica-{index + 1}" for index in range(replica_count)]
+    existing = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0][
+        'ReadReplicaDBInstanceIdentifiers']
+    for index, replica_id in enumerate(replica_ids):
+        if replica_id in existing:
+            print(f"Read replica {replica_id} already exists.")
+            continue
+        rds.create_db_instance_read_replica(
+            DBInstanceIdentifier=replica_id,
+            SourceDBInstanceIdentifier=db_instance_identifier,
+            DBInstanceClass=db_instance_class,
+            DBParameterGroupName=parameter_group_name,
+            AvailabilityZone=availability_zones[index % len(availability_zones)],
+            PubliclyAccessible=False
+        )
+        print(f"Creating read replica {replica_id} in {availability_zones[index % len(availability_zones)]}")
+    return replica_ids
+
+
+def wait_for_read_replicas(replica_ids, region):
+    # One waiter over all replicas instead of one wait per replica
+    if not replica_ids:
+        return []
+    rds = boto3.client('rds', region_name=region)
+    filters = [{'Name': 'db-instance-id', 'Values': replica_ids}]
+    rds.get_waiter('db_instance_available').wait(Filters=filters, WaiterConfig={'Delay': 30, 'MaxAttempts': 120})
+    replicas = rds.describe_db_instances(Filters=filters)['DBInstances']
+    endpoints = [replica['Endpoint']['Address'] for replica in replicas]
+    print(f"Read replicas available: {', '.join(endpoints)}")
+    return endpoints
+
+
 def modify_public_access(db_instance_identifier, public_access, region):
     rds = boto3.client('rds', region_name=region)
     response = rds.modify_db_instance(
@@ -153,7 +205,7 @@ def remove_inbound_rule(security_group_id, ip_address, region):
     print(f"Removed inbound rule from Security Group ID: {security_group_id} for IP: {ip_address}")
 
 
-def run_sql_file(endpoint, username, password, db_name, sql_file_path):
+def run_sql_file(endpoint, username, password, db_name, sql_file_path, region):
     connection = pymysql.connect(
         host=endpoint,
         user=username,
@@ -162,14 +214,10 @@ def run_sql_file(endpoint, username, password, db_name, sql_file_path):
     )
     cursor = connection.cursor()
 
-    with open(sql_file_path, 'r') as file:
-        sql_commands = file.read().split(';')
-
-    for command in sql_commands:
-        if command.strip():
-            cursor.execute(command)
-
-    connection.commit()
+    # Streams the dump (.sql, .sql.gz or .sql.zst, local or s3://) statement by
+    # statement, so nothing is written to disk and memory stays small
+    executed = execute_file(connection, sql_file_path, region)
+    print(f"Executed {executed} statements from {sql_file_path}")
 
     # Validate SQL execution by running "SHOW TABLES"
     cursor.execute("SHOW TABLES;")
@@ -184,25 +232,68 @@ def run_sql_file(endpoint, username, password, db_name, sql_file_path):
 region = 'ap-south-1'
 secret_name = 'RDSDB_Credentials1'
 db_instance_identifier = 'dmanup-aws-codecomit-demo-rdsdb'
-db_instance_class = 'db.t3.micro'
 engine = 'mysql'
 db_name = 'accounts'
 subnet_group_name = 'dmanup-aws-codecomit-demo-db-subnt'
 parameter_group_name = 'dmanup-aws-codecomit-demo-rds-db-param-grp'
+read_replica_count = 0  # Read replicas to create, e.g. 2 for the login lookups; 0 to skip
+tuning_profile = 'read-heavy'  # See rds_tuning.WORKLOAD_PROFILES
+# Sizing inputs, see rds_sizing.size_database
+data_size_gib = 0.5  # db_backup.sql is tiny; set to the real data size
+annual_growth = 0.5
+target_iops = 500
+target_throughput_mibps = 10
+target_connections = 50
+resize_existing = True  # False only previews the changes for an existing instance
+apply_index_suggestions = True  # False only reports the index advisor's suggestions
+use_golden_snapshot = True  # Restore new instances from the golden snapshot of db_backup.sql
+seeding_mode = 'vpc'  # 'vpc' loads the dump from inside the VPC, 'public' over the internet from here
+dump_location = None  # .sql, .sql.gz or (seeding_mode 'public' only) .sql.zst dump, local or s3://
+dump_manifest = None  # db_export.py export (directory, manifest or s3://...) to load instead of db_backup.sql
+load_threads = 8  # parallel chunk loads of a db_export.py export
+performance_insights = True  # skipped for instance classes without Performance Insights
+monitoring_interval = 60  # enhanced monitoring granularity in seconds; 0 disables it
+export_slow_query_log = True  # slow query and error logs to CloudWatch Logs, see rds_insights.py slow-log
+long_query_time = 0.5  # seconds
+
+# Decide up front whether the instance gets seeded, so a dump the in-VPC
+# seeding cannot load fails before any resource is created
+sql_file_path = dump_location or os.path.join(os.getcwd(), 'src', 'main', 'resources', 'db_backup.sql')
+sql_hash = manifest_hash(dump_manifest, region) if dump_manifest else dump_hash(sql_file_path, region)
+instance_exists = rds_instance_exists(db_instance_identifier, region)
+golden_snapshot_id = find_golden_snapshot(db_instance_identifier, sql_hash, region) if use_golden_snapshot else None
+restored = bool(golden_snapshot_id) and not instance_exists
+if seeding_mode == 'vpc' and not restored:
+    check_seedable(sql_file_path, dump_manifest, region)
 
 # Fetch credentials from Secrets Manager or create new ones
-secret = get_or_create_secret(secret_name, region)
+secret = get_or_create_secret(secret_name, region, "RDS MySQL DB credentials")
 master_username = secret['username']
 master_user_password = secret['password']
 
 # Create or get the RDS instance
 ec2 = boto3.client('ec2', region_name=region)
 vpc_id = ec2.describe_vpcs()['Vpcs'][0]['VpcId']
-subnet_ids = [subnet['SubnetId'] for subnet in
-              ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['Subnets']]
+subnets = ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['Subnets']
+subnet_ids = [subnet['SubnetId'] for subnet in subnets]
+availability_zones = sorted({subnet['AvailabilityZone'] for subnet in subnets})
+
+sizing = size_database(data_size_gib, annual_growth, target_iops, target_throughput_mibps, target_connections,
+                       profile=tuning_profile)
+print_sizing(sizing)
+db_instance_class = sizing['DBInstanceClass']
 
 create_subnet_group(subnet_group_name, subnet_ids, region)
 create_parameter_group(parameter_group_name, region)
+# New instances start with the tuned values. An existing instance is tuned by
+# create_or_get_rds_instance after its class change, never ahead of it.
+if not instance_exists:
+    apply_tuning_profile(parameter_group_name, db_instance_class, tuning_profile, region,
+                         storage_iops=sizing['SizedIops'])
+if export_slow_query_log:
+    enable_slow_query_log(parameter_group_name, region, long_query_time)
+monitoring = monitoring_arguments(db_instance_class, region, performance_insights, monitoring_interval,
+                                  export_slow_query_log, engine)
 
 # Fetch the security group ID
 security_group = ec2.describe_security_groups(
@@ -213,25 +304,79 @@ if security_group['SecurityGroups']:
 else:
     raise Exception("Security group 'dmanup-aws-codecomit-backend-secgrp' not found")
 
-rds_endpoint = create_or_get_rds_instance(db_instance_identifier, db_instance_class, engine, master_username,
-                                          master_user_password, db_name, subnet_group_name, security_group_id,
-                                          parameter_group_name, region)
-
-# Modify RDS instance to enable public access
-modify_public_access(db_instance_identifier, True, region)
-
-# Get public IP address
-local_ip = requests.get('https://checkip.amazonaws.com').text.strip()
+# Fast path: restore a new instance from the golden snapshot of the current
+# dump, which skips the seeding and both public access changes
+if restored:
+    restore_from_golden_snapshot(db_instance_identifier, golden_snapshot_id, sizing, subnet_group_name,
+                                 security_group_id, parameter_group_name, 1 if read_replica_count else 0, region)
+    tag_instance_dump_hash(db_instance_identifier, sql_hash, region)
 
-# Add inbound rule to security group for local IP
-add_inbound_rule(security_group_id, local_ip, region)
-
-# Run SQL file to set up the database
-sql_file_path = os.path.join(os.getcwd(), 'src', 'main', 'resources', 'db_backup.sql')
-run_sql_file(rds_endpoint, master_username, master_user_password, db_name, sql_file_path)
-
-# Remove local IP from the security group
-remove_inbound_rule(security_group_id, local_ip, region)
-
-# Modify RDS instance to disable public access
-modify_public_access(db_instance_identifier, False, region)
+# For a restored instance this only adds the storage autoscaling limit
+rds_endpoint = create_or_get_rds_instance(db_instance_identifier, sizing, engine, master_username,
+                                          master_user_password, db_name, subnet_group_name, security_group_id,
+                                          parameter_group_name, region, resize_existing, monitoring,
+                                          tuning_profile, publicly_accessible=seeding_mode == 'public',
+                                          backup_retention_days=1 if read_replica_count else 0)
+
+if read_replica_count:
+    # Only an existing instance can still have them off
+    enable_automated_backups(db_instance_identifier, region)
+
+# Seeding over the internet needs the instance public for the duration
+seed_publicly = not restored and seeding_mode == 'public'
+if seed_publicly and instance_exists:
+    # A new instance is created public for this; an existing one is switched
+    modify_public_access(db_instance_identifier, True, region)
+
+# Replicas build in parallel with the seeding below and pick the data up
+# through replication
+replica_ids = create_read_replicas(db_instance_identifier, db_instance_class, read_replica_count, availability_zones,
+                                   parameter_group_name, region)
+
+if seed_publicly:
+    # Get public IP address
+    local_ip = requests.get('https://checkip.amazonaws.com').text.strip()
+
+    # Add inbound rule to security group for local IP
+    add_inbound_rule(security_group_id, local_ip, region)
+
+    # Wait until the database accepts connections from this machine before seeding
+    if not wait_until_ready({'mysql': (probe_mysql, (rds_endpoint, 3306, master_username, master_user_password,
+                                                     db_name))}, timeout=300):
+        raise Exception(f"RDS instance {db_instance_identifier} is not accepting connections")
+
+    # Run SQL file to set up the database, or load the chunked export in parallel
+    if dump_manifest:
+        load_manifest(dump_manifest, {'host': rds_endpoint, 'user': master_username, 'password': master_user_password,
+                                      'database': db_name, 'charset': 'utf8mb4'}, load_threads, region)
+    else:
+        run_sql_file(rds_endpoint, master_username, master_user_password, db_name, sql_file_path, region)
+
+    # Index the login lookups (username, email) while the schema is still empty of traffic
+    advise_indexes({'host': rds_endpoint, 'user': master_username, 'password': master_user_password,
+                    'database': db_name}, apply=apply_index_suggestions)
+
+    # Remove local IP from the security group
+    remove_inbound_rule(security_group_id, local_ip, region)
+elif not restored and dump_manifest:
+    seed_manifest_in_vpc(dump_manifest, rds_endpoint, master_username, master_user_password, db_name, vpc_id,
+                         subnet_ids, security_group_id, region, apply_indexes=apply_index_suggestions,
+                         parallelism=load_threads)
+elif not restored:
+    # Load the dump and index the login lookups from inside the VPC; the
+    # instance never becomes public
+    seed_in_vpc(sql_file_path, rds_endpoint, master_username, master_user_password, db_name, vpc_id, subnet_ids,
+                security_group_id, region, apply_indexes=apply_index_suggestions)
+
+# The primary cannot be modified while replicas are still being created
+wait_for_read_replicas(replica_ids, region)
+
+if seed_publicly:
+    # Modify RDS instance to disable public access
+    modify_public_access(db_instance_identifier, False, region)
+
+if not restored:
+    # Record the dump this instance holds and snapshot it for the next environments
+    tag_instance_dump_hash(db_instance_identifier, sql_hash, region)
+    if use_golden_snapshot and not golden_snapshot_id:
+        create_golden_snapshot(db_instance_identifier, sql_hash, region, wait=False)
@@ -1,5 +1,7 @@
 import boto3
 import json
+from codedeploy_rollout import DEPLOYMENT_CONFIG_NAME, BEANSTALK_ENV_NAME, create_custom_deployment_configs, \
+    deployment_group_targets
 
 # Set the region and repository details
 REGION = "ap-south-1"
@@ -9,6 +11,65 @@ DEPLOY_APP_NAME = "dmanup-aws-codedeploy-demo-app"
 DEPLOY_GROUP_NAME = "dmanup-aws-codedeploy-demo-group"
 PIPELINE_NAME = "dmanup-aws-codepipeline-demo"
 ARTIFACT_BUCKET = "dmanup-aws-codeartifact-bucket"
+SCRIPTS_DIR = "src/main/resources/scripts"
+SOURCE_BRANCH = "main"
+
+# Pipeline type and execution mode. V1 pipelines only support SUPERSEDED;
+# V2 pipelines can also run in QUEUED or PARALLEL mode.
+PIPELINE_TYPE = "V2"
+EXECUTION_MODE = "QUEUED"
+
+# Git trigger filters. CodePipeline only honours git triggers for
+# CodeStarSourceConnection sources, so they are applied when
+# SOURCE_CONNECTION_ARN is set. The CodeCommit source is started by an
+# EventBridge rule filtered on SOURCE_BRANCH instead.
+SOURCE_CONNECTION_ARN = None
+SOURCE_FULL_REPOSITORY_ID = None  # e.g. "owner/vprofile-project"
+TRIGGER_BRANCHES = [SOURCE_BRANCH]
+TRIGGER_FILE_PATHS_INCLUDES = ["src/**", "pom.xml"]
+TRIGGER_FILE_PATHS_EXCLUDES = []
+EVENT_RULE_NAME = f"{PIPELINE_NAME}-codecommit-trigger"
+
+# Build stage layout mirroring the Jenkinsfile stages. The Compile shard runs
+# first and publishes the WAR (BuildOutput, used by Deploy) plus the compiled
+# target/ tree (CompiledOutput). The remaining shards run in parallel on top of
+# CompiledOutput, so the stage takes as long as Compile plus the slowest shard.
+# Set PARALLEL_BUILD to False to fall back to the single `mvn clean install` action.
+PARALLEL_BUILD = True
+BUILD_SHARDS = [
+    {
+        'name': 'Compile',
+        'runOrder': 1,
+        # Caches the whole target/ tree, so a cache hit still hands classes and
+        # test-classes to the test shards
+        'commands': [f"CACHE_TARGET_TREE=1 BUILD_COMMAND='mvn clean install -DskipTests' "
+                     f"python3 {SCRIPTS_DIR}/build_cache.py"],
+        'outputArtifacts': {
+            'BuildOutput': ['target/vprofile-v2.war'],
+            'CompiledOutput': ['target/**/*']
+        }
+    },
+    {
+        'name': 'UnitTest',
+        'runOrder': 2,
+        'commands': ['mvn test'],
+        'reports': ['target/surefire-reports/*.xml']
+    },
+    {
+        'name': 'IntegrationTest',
+        'runOrder': 2,
+        'commands': ['mvn verify -DskipUnitTests']
+    },
+    {
+        'name': 'StaticAnalysis',
+        'runOrder': 2,
+        'commands': [
+            'mvn checkstyle:checkstyle',
+            'if [ -n "$SONAR_HOST_URL" ]; then mvn sonar:sonar -Dsonar.projectKey=vprofile '
+            '-Dsonar.host.url="$SONAR_HOST_URL" -Dsonar.login="$SONAR_TOKEN"; fi'
+        ]
+    }
+]
 
 # Initialize boto3 clients
 codecommit = boto3.client('codecommit', region_name=REGION)
@@ -16,6 +77,7 @@ codebuild = boto3.client('codebuild', region_name=REGION)
 codedeploy = boto3.client('codedeploy', region_name=REGION)
 codepipeline = boto3.client('codepipeline', region_name=REGION)
 iam = boto3.client('iam', region_name=REGION)
+events = boto3.client('events', region_name=REGION)
 s3 = boto3.client('s3', region_name=REGION)
 
 # Function to create a CodeCommit repository
@@ -40,17 +102,23 @@ def create_s3_bucket(bucket_name):
         print(f"S3 bucket {bucket_name} already exists.")
 
 # Function to create a CodeBuild project
-def create_codebuild_project(project_name, artifact_bucket, role_arn):
+def create_codebuild_project(project_name, artifact_bucket, role_arn, buildspec=None):
+    source = {'type': 'CODECOMMIT', 'location': f"https://git-codecommit.{REGION}.amazonaws.com/v1/repos/{REPO_NAME}"}
+    if buildspec:
+        source['buildspec'] = buildspec
     try:
         codebuild.create_project(
             name=project_name,
-            source={'type': 'CODECOMMIT', 'location': f"https://git-codecommit.{REGION}.amazonaws.com/v1/repos/{REPO_NAME}"},
+            source=source,
             artifacts={'type': 'S3', 'location': artifact_bucket},
             environment={
                 'type': 'LINUX_CONTAINER',
                 'image': 'aws/codebuild/standard:5.0',
                 'computeType': 'BUILD_GENERAL1_SMALL',
-                'environmentVariables': []
+                'environmentVariables': [
+                    # Used by build_cache.py to look up previously built WARs
+                    {'name': 'ARTIFACT_BUCKET', 'value': artifact_bucket, 'type': 'PLAINTEXT'}
+                ]
             },
             serviceRole=role_arn
         )
@@ -58,6 +126,79 @@ def create_codebuild_project(project_name, artifact_bucket, role_arn):
     except codebuild.exceptions.ResourceAlreadyExistsException:
         print(f"CodeBuild project {project_name} already exists.")
 
+# Function to generate the buildspec for one build shard
+def build_shard_buildspec(shard):
+    commands = []
+    if shard['runOrder'] > 1:
+        # Reuse the target/ tree compiled by the Compile shard instead of recompiling
+        commands.append('cp -r "$CODEBUILD_SRC_DIR_CompiledOutput/target" .')
+    commands.extend(shard['commands'])
+
+    buildspec = {
+        'version': 0.2,
+        'phases': {
+            'install': {
+                'runtime-versions': {'java': 'corretto11', 'python': 3.9},
+                'commands': ['pip3 install --quiet boto3']
+            },
+            'build': {'commands': commands}
+        }
+    }
+    if 'outputArtifacts' in shard:
+        buildspec['artifacts'] = {
+            'secondary-artifacts': {
+                name: {'files': files, 'discard-paths': 'no'}
+                for name, files in shard['outputArtifacts'].items()
+            }
+        }
+    if 'reports' in shard:
+        buildspec['reports'] = {
+            f"{shard['name']}Reports": {'files': shard['reports'], 'file-format': 'JUNITXML'}
+        }
+    # JSON is valid YAML, so the buildspec can be passed inline without a YAML dependency
+    return json.dumps(buildspec, indent=2)
+
+# Function to generate the Build stage actions
+def build_stage_actions():
+    if not PARALLEL_BUILD:
+        return [
+            {
+                'name': 'Build',
+                'actionTypeId': {
+                    'category': 'Build',
+                    'owner': 'AWS',
+                    'provider': 'CodeBuild',
+                    'version': '1'
+                },
+                'inputArtifacts': [{'name': 'SourceOutput'}],
+                'outputArtifacts': [{'name': 'BuildOutput'}],
+                'configuration': {'ProjectName': BUILD_PROJECT_NAME},
+                'runOrder': 1
+            }
+        ]
+
+    actions = []
+    for shard in BUILD_SHARDS:
+        action = {
+            'name': shard['name'],
+            'actionTypeId': {
+                'category': 'Build',
+                'owner': 'AWS',
+                'provider': 'CodeBuild',
+                'version': '1'
+            },
+            'inputArtifacts': [{'name': 'SourceOutput'}],
+            'configuration': {'ProjectName': f"{BUILD_PROJECT_NAME}-{shard['name'].lower()}"},
+            'runOrder': shard['runOrder']
+        }
+        if shard['runOrder'] > 1:
+            action['inputArtifacts'].append({'name': 'CompiledOutput'})
+            action['configuration']['PrimarySource'] = 'SourceOutput'
+        if 'outputArtifacts' in shard:
+            action['outputArtifacts'] = [{'name': name} for name in shard['outputArtifacts']]
+        actions.append(action)
+    return actions
+
 # Function to create a CodeDeploy application and deployment group
 def create_codedeploy_app_and_group(app_name, group_name, role_arn):
     try:
@@ -66,95 +207,170 @@ def create_codedeploy_app_and_group(app_name, group_name, role_arn):
     except codedeploy.exceptions.ApplicationAlreadyExistsException:
         print(f"CodeDeploy application {app_name} already exists.")
 
+    create_custom_deployment_configs(codedeploy)
+    targets = deployment_group_targets(BEANSTALK_ENV_NAME, REGION)
+
     # Create deployment group
     try:
         codedeploy.create_deployment_group(
             applicationName=app_name,
             deploymentGroupName=group_name,
             serviceRoleArn=role_arn,
-            deploymentConfigName='CodeDeployDefault.OneAtATime',
-            ec2TagFilters=[{'Key': 'Name', 'Value': 'CodeDeployDemo', 'Type': 'KEY_AND_VALUE'}],
-            autoScalingGroups=[],
+            deploymentConfigName=DEPLOYMENT_CONFIG_NAME,
+            ec2TagFilters=targets['ec2TagFilters'],
+            autoScalingGroups=targets['autoScalingGroups'],
             deploymentStyle={'deploymentType': 'IN_PLACE', 'deploymentOption': 'WITHOUT_TRAFFIC_CONTROL'}
         )
-        print(f"Created CodeDeploy deployment group: {group_name}")
+        print(f"Created CodeDeploy deployment group: {group_name} ({DEPLOYMENT_CONFIG_NAME})")
     except codedeploy.exceptions.DeploymentGroupAlreadyExistsException:
-        print(f"CodeDeploy deployment group {group_name} already exists.")
+        codedeploy.update_deployment_group(
+            applicationName=app_name,
+            currentDeploymentGroupName=group_name,
+            deploymentConfigName=DEPLOYMENT_CONFIG_NAME,
+            ec2TagFilters=targets['ec2TagFilters'],
+            autoScalingGroups=targets['autoScalingGroups']
+        )
+        print(f"CodeDeploy deployment group {group_name} already exists, updated to {DEPLOYMENT_CONFIG_NAME}.")
+
+# Function to generate the Source stage action
+def source_stage_action():
+    if SOURCE_CONNECTION_ARN:
+        return {
+            'name': 'Source',
+            'actionTypeId': {
+                'category': 'Source',
+                'owner': 'AWS',
+                'provider': 'CodeStarSourceConnection',
+                'version': '1'
+            },
+            'outputArtifacts': [{'name': 'SourceOutput'}],
+            'configuration': {
+                'ConnectionArn': SOURCE_CONNECTION_ARN,
+                'FullRepositoryId': SOURCE_FULL_REPOSITORY_ID,
+                'BranchName': SOURCE_BRANCH,
+                'DetectChanges': 'false'  # Runs are started by the pipeline triggers below
+            },
+            'runOrder': 1
+        }
+    return {
+        'name': 'Source',
+        'actionTypeId': {
+            'category': 'Source',
+            'owner': 'AWS',
+            'provider': 'CodeCommit',
+            'version': '1'
+        },
+        'outputArtifacts': [{'name': 'SourceOutput'}],
+        'configuration': {
+            'RepositoryName': REPO_NAME,
+            'BranchName': SOURCE_BRANCH,
+            'PollForSourceChanges': 'false'  # Triggered by the EventBridge rule from create_codecommit_trigger_rule
+        },
+        'runOrder': 1
+    }
+
+# Function to generate the git push triggers (V2 pipelines with a connection source only)
+def pipeline_triggers():
+    file_paths = {}
+    if TRIGGER_FILE_PATHS_INCLUDES:
+        file_paths['includes'] = TRIGGER_FILE_PATHS_INCLUDES
+    if TRIGGER_FILE_PATHS_EXCLUDES:
+        file_paths['excludes'] = TRIGGER_FILE_PATHS_EXCLUDES
+
+    push_filter = {'branches': {'includes': TRIGGER_BRANCHES}}
+    if file_paths:
+        push_filter['filePaths'] = file_paths
+    return [
+        {
+            'providerType': 'CodeStarSourceConnection',
+            'gitConfiguration': {
+                'sourceActionName': 'Source',
+                'push': [push_filter]
+            }
+        }
+    ]
 
 # Function to create a CodePipeline
 def create_codepipeline(pipeline_name, role_arn, artifact_bucket):
-    try:
-        response = codepipeline.create_pipeline(
-            pipeline={
-                'name': pipeline_name,
-                'roleArn': role_arn,
-                'artifactStore': {'type': 'S3', 'location': artifact_bucket},
-                'stages': [
-                    {
-                        'name': 'Source',
-                        'actions': [
-                            {
-                                'name': 'Source',
-                                'actionTypeId': {
-                                    'category': 'Source',
-                                    'owner': 'AWS',
-                                    'provider': 'CodeCommit',
-                                    'version': '1'
-                                },
-                                'outputArtifacts': [{'name': 'SourceOutput'}],
-                                'configuration': {
-                                    'RepositoryName': REPO_NAME,
-                                    'BranchName': 'main',
-                                    'PollForSourceChanges': 'false'  # Automatically trigger on changes
-                                },
-                                'runOrder': 1
-                            }
-                        ]
-                    },
-                    {
-                        'name': 'Build',
-                        'actions': [
-                            {
-                                'name': 'Build',
-                                'actionTypeId': {
-                                    'category': 'Build',
-                                    'owner': 'AWS',
-                                    'provider': 'CodeBuild',
-                                    'version': '1'
-                                },
-                                'inputArtifacts': [{'name': 'SourceOutput'}],
-                                'outputArtifacts': [{'name': 'BuildOutput'}],
-                                'configuration': {'ProjectName': BUILD_PROJECT_NAME},
-                                'runOrder': 1
-                            }
-                        ]
-                    },
+    if PIPELINE_TYPE == 'V1' and EXECUTION_MODE != 'SUPERSEDED':
+        raise ValueError(f"Execution mode {EXECUTION_MODE} requires a V2 pipeline")
+
+    pipeline = {
+        'name': pipeline_name,
+        'roleArn': role_arn,
+        'artifactStore': {'type': 'S3', 'location': artifact_bucket},
+        'pipelineType': PIPELINE_TYPE,
+        'executionMode': EXECUTION_MODE,
+        'stages': [
+            {
+                'name': 'Source',
+                'actions': [source_stage_action()]
+            },
+            {
+                'name': 'Build',
+                'actions': build_stage_actions()
+            },
+            {
+                'name': 'Deploy',
+                'actions': [
                     {
                         'name': 'Deploy',
-                        'actions': [
-                            {
-                                'name': 'Deploy',
-                                'actionTypeId': {
-                                    'category': 'Deploy',
-                                    'owner': 'AWS',
-                                    'provider': 'CodeDeploy',
-                                    'version': '1'
-                                },
-                                'inputArtifacts': [{'name': 'BuildOutput'}],
-                                'configuration': {
-                                    'ApplicationName': DEPLOY_APP_NAME,
-                                    'DeploymentGroupName': DEPLOY_GROUP_NAME
-                                },
-                                'runOrder': 1
-                            }
-                        ]
+                        'actionTypeId': {
+                            'category': 'Deploy',
+                            'owner': 'AWS',
+                            'provider': 'CodeDeploy',
+                            'version': '1'
+                        },
+                        'inputArtifacts': [{'name': 'BuildOutput'}],
+                        'configuration': {
+                            'ApplicationName': DEPLOY_APP_NAME,
+                            'DeploymentGroupName': DEPLOY_GROUP_NAME
+                        },
+                        'runOrder': 1
                     }
                 ]
             }
-        )
-        print(f"Created CodePipeline: {pipeline_name}")
+        ]
+    }
+    if PIPELINE_TYPE == 'V2' and SOURCE_CONNECTION_ARN:
+        pipeline['triggers'] = pipeline_triggers()
+
+    try:
+        codepipeline.create_pipeline(pipeline=pipeline)
+        print(f"Created CodePipeline: {pipeline_name} ({PIPELINE_TYPE}, {EXECUTION_MODE})")
     except codepipeline.exceptions.PipelineNameInUseException:
-        print(f"CodePipeline {pipeline_name} already exists.")
+        # Apply type, execution mode and trigger changes to the existing pipeline
+        pipeline['version'] = codepipeline.get_pipeline(name=pipeline_name)['pipeline']['version']
+        codepipeline.update_pipeline(pipeline=pipeline)
+        print(f"CodePipeline {pipeline_name} already exists, updated to {PIPELINE_TYPE}, {EXECUTION_MODE}.")
+
+# Function to start the pipeline on pushes to the CodeCommit branch
+def create_codecommit_trigger_rule(rule_name, pipeline_name, role_arn):
+    account_id = boto3.client('sts').get_caller_identity().get('Account')
+    events.put_rule(
+        Name=rule_name,
+        EventPattern=json.dumps({
+            'source': ['aws.codecommit'],
+            'detail-type': ['CodeCommit Repository State Change'],
+            'resources': [f"arn:aws:codecommit:{REGION}:{account_id}:{REPO_NAME}"],
+            'detail': {
+                'event': ['referenceCreated', 'referenceUpdated'],
+                'referenceType': ['branch'],
+                'referenceName': TRIGGER_BRANCHES
+            }
+        }),
+        State='ENABLED',
+        Description=f"Start {pipeline_name} on pushes to {REPO_NAME}"
+    )
+    events.put_targets(
+        Rule=rule_name,
+        Targets=[{
+            'Id': 'codepipeline',
+            'Arn': f"arn:aws:codepipeline:{REGION}:{account_id}:{pipeline_name}",
+            'RoleArn': role_arn
+        }]
+    )
+    print(f"Created EventBridge rule {rule_name} for CodeCommit repository {REPO_NAME}.")
 
 # Create IAM roles for CodeBuild, CodeDeploy, and CodePipeline
 def create_iam_role(role_name, policy_arn, service_principal):
@@ -171,7 +387,8 @@ def create_iam_role(role_name, policy_arn, service_principal):
             RoleName=role_name,
             AssumeRolePolicyDocument=assume_role_policy_document,
         )
-        iam.attach_role_policy(RoleName=role_name, PolicyArn=policy_arn)
+        if policy_arn:
+            iam.attach_role_policy(RoleName=role_name, PolicyArn=policy_arn)
         print(f"Created IAM Role: {role_name}")
     except iam.exceptions.EntityAlreadyExistsException:
         print(f"IAM Role {role_name} already exists.")
@@ -227,11 +444,57 @@ custom_policy_document = {
 }
 attach_custom_policy_to_role('codepipeline-service-role', 'CodePipelineCodeCommitAccessPolicy', custom_policy_document)
 
-# Create CodeBuild project
-create_codebuild_project(BUILD_PROJECT_NAME, ARTIFACT_BUCKET, codebuild_role_arn)
+# Attach build cache policy to codebuild-service-role (WAR cache in the artifact bucket + cache metrics)
+build_cache_policy_document = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Action": [
+                "s3:GetObject",
+                "s3:PutObject",
+                "s3:ListBucket"
+            ],
+            "Resource": [
+                f"arn:aws:s3:::{ARTIFACT_BUCKET}",
+                f"arn:aws:s3:::{ARTIFACT_BUCKET}/*"
+            ]
+        },
+        {
+            "Effect": "Allow",
+            "Action": ["cloudwatch:PutMetricData"],
+            "Resource": "*"
+        }
+    ]
+}
+attach_custom_policy_to_role('codebuild-service-role', 'CodeBuildBuildCacheAccessPolicy', build_cache_policy_document)
+
+# Create CodeBuild project (one per build shard when the Build stage runs in parallel)
+if PARALLEL_BUILD:
+    for shard in BUILD_SHARDS:
+        create_codebuild_project(f"{BUILD_PROJECT_NAME}-{shard['name'].lower()}", ARTIFACT_BUCKET,
+                                 codebuild_role_arn, build_shard_buildspec(shard))
+else:
+    create_codebuild_project(BUILD_PROJECT_NAME, ARTIFACT_BUCKET, codebuild_role_arn)
 
 # Create CodeDeploy application and deployment group
 create_codedeploy_app_and_group(DEPLOY_APP_NAME, DEPLOY_GROUP_NAME, codedeploy_role_arn)
 
 # Create CodePipeline
 create_codepipeline(PIPELINE_NAME, codepipeline_role_arn, ARTIFACT_BUCKET)
+
+# Start the pipeline on CodeCommit pushes, since PollForSourceChanges is disabled
+if not SOURCE_CONNECTION_ARN:
+    events_role_arn = create_iam_role('codepipeline-events-role', None, 'events.amazonaws.com')
+    events_policy_document = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": ["codepipeline:StartPipelineExecution"],
+                "Resource": f"arn:aws:codepipeline:{REGION}:{boto3.client('sts').get_caller_identity().get('Account')}:{PIPELINE_NAME}"
+            }
+        ]
+    }
+    attach_custom_policy_to_role('codepipeline-events-role', 'CodePipelineEventsStartPolicy', events_policy_document)
+    create_codecommit_trigger_rule(EVENT_RULE_NAME, PIPELINE_NAME, events_role_arn)
@@ -1,45 +1,77 @@
 import boto3
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def cluster_endpoint(cluster):
+    # Memcached clusters expose a configuration endpoint that auto-discovery
+    # clients use to find every node; fall back to the first node otherwise.
+    return cluster.get('ConfigurationEndpoint') or cluster.get('CacheNodes', [{}])[0].get('Endpoint')
+
+
+def preferred_availability_zones(availability_zones, num_cache_nodes):
+    # Spreads the nodes round-robin across the available AZs
+    return [availability_zones[index % len(availability_zones)] for index in range(num_cache_nodes)]
 
 
 def create_or_get_elasticache_cluster(cluster_id, node_type, engine, num_cache_nodes, subnet_group_name,
-                                      security_group_id, region):
-    elasticache = boto3.client('elasticache', region_name=region)
+                                      security_group_id, region, availability_zones=None):
+    elasticache = boto3.session.Session().client('elasticache', region_name=region)
+    az_mode = 'cross-az' if availability_zones and num_cache_nodes > 1 else 'single-az'
 
     # Check if the Elasticache cluster already exists
     try:
         response = elasticache.describe_cache_clusters(CacheClusterId=cluster_id, ShowCacheNodeInfo=True)
-        endpoint = response['CacheClusters'][0].get('CacheNodes', [{}])[0].get('Endpoint')
-        if endpoint:
-            print(
-                f"Elasticache Cluster {cluster_id} already exists with endpoint: {endpoint['Address']}:{endpoint['Port']}")
-            return endpoint
+        cluster = response['CacheClusters'][0]
+        if cluster['NumCacheNodes'] < num_cache_nodes and cluster['CacheClusterStatus'] == 'available':
+            # Scale out the existing cluster, adding the new nodes in the least used AZs
+            new_nodes = num_cache_nodes - cluster['NumCacheNodes']
+            params = {}
+            if availability_zones:
+                used_zones = [node.get('CustomerAvailabilityZone') for node in cluster.get('CacheNodes', [])]
+                zones = sorted(availability_zones, key=used_zones.count)
+                params['NewAvailabilityZones'] = preferred_availability_zones(zones, new_nodes)
+                params['AZMode'] = 'cross-az'
+            elasticache.modify_cache_cluster(CacheClusterId=cluster_id, NumCacheNodes=num_cache_nodes,
+                                             ApplyImmediately=True, **params)
+            print(f"Scaling Elasticache Cluster {cluster_id} from {cluster['NumCacheNodes']} to {num_cache_nodes} nodes.")
         else:
-            print(f"Elasticache Cluster {cluster_id} already exists but endpoint information is not available yet.")
-            return None
+            endpoint = cluster_endpoint(cluster)
+            if endpoint:
+                print(
+                    f"Elasticache Cluster {cluster_id} already exists with endpoint: {endpoint['Address']}:{endpoint['Port']}")
+                return endpoint
+            else:
+                print(f"Elasticache Cluster {cluster_id} already exists but endpoint information is not available yet.")
+                return None
     except elasticache.exceptions.CacheClusterNotFoundFault:
         print(f"Elasticache Cluster {cluster_id} does not exist, creating a new one.")
 
-    # Create the Elasticache cluster
-    response = elasticache.create_cache_cluster(
-        CacheClusterId=cluster_id,
-        CacheNodeType=node_type,
-        Engine=engine,
-        NumCacheNodes=num_cache_nodes,
-        CacheSubnetGroupName=subnet_group_name,
-        SecurityGroupIds=[security_group_id],
-        EngineVersion='1.6.17',
-        Port=11211
-    )
+        params = {}
+        if az_mode == 'cross-az':
+            params['PreferredAvailabilityZones'] = preferred_availability_zones(availability_zones, num_cache_nodes)
+        # Create the Elasticache cluster
+        response = elasticache.create_cache_cluster(
+            CacheClusterId=cluster_id,
+            CacheNodeType=node_type,
+            Engine=engine,
+            NumCacheNodes=num_cache_nodes,
+            CacheSubnetGroupName=subnet_group_name,
+            SecurityGroupIds=[security_group_id],
+            EngineVersion='1.6.17',
+            Port=11211,
+            AZMode=az_mode,
+            **params
+        )
 
     # Wait for the cluster to become available
     while True:
         response = elasticache.describe_cache_clusters(CacheClusterId=cluster_id, ShowCacheNodeInfo=True)
         status = response['CacheClusters'][0]['CacheClusterStatus']
-        print(f"Current Elasticache Cluster Status: {status}")
+        print(f"Current Elasticache Cluster {cluster_id} Status: {status}")
         if status == 'available':
-            endpoint = response['CacheClusters'][0].get('CacheNodes', [{}])[0].get('Endpoint')
+            endpoint = cluster_endpoint(response['CacheClusters'][0])
             if endpoint:
                 print(
                     f"Elasticache Cluster {cluster_id} is now available with endpoint: {endpoint['Address']}:{endpoint['Port']}")
@@ -49,12 +81,13 @@ def create_or_get_elasticache_cluster(cluster_id, node_type, engine, num_cache_n
                 return None
         time.sleep(30)
 
-
 region = 'ap-south-1'
 cluster_id = 'dmanup-aws-codecomit-demo-elasticache'
 node_type = 'cache.t3.micro'
 engine = 'memcached'
-num_cache_nodes = 1
+num_cache_nodes = 3  # Nodes are spread across the AZs of the VPC subnets
+standby_cluster_id = f"{cluster_id}-standby"  # Written to memcached.standBy.host
+standby_num_cache_nodes = 2  # Set to 0 to skip the standby pool
 security_group_name = 'dmanup-aws-codecomit-backend-secgrp'
 subnet_group_name = 'dmanup-aws-codecomit-demo-elasticache-subnet-group'
 
@@ -71,10 +104,12 @@ else:
 vpc_id = ec2.describe_vpcs()['Vpcs'][0]['VpcId']
 print(f"VPC ID: {vpc_id}")
 
-# Fetch Subnet IDs
-subnet_ids = [subnet['SubnetId'] for subnet in
-              ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['Subnets']]
+# Fetch Subnet IDs and their availability zones
+subnets = ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['Subnets']
+subnet_ids = [subnet['SubnetId'] for subnet in subnets]
+availability_zones = sorted({subnet['AvailabilityZone'] for subnet in subnets})
 print(f"Subnet IDs: {subnet_ids}")
+print(f"Availability Zones: {availability_zones}")
 
 # Create the subnet group
 elasticache = boto3.client('elasticache', region_name=region)
@@ -89,6 +124,13 @@ except elasticache.exceptions.CacheSubnetGroupNotFoundFault:
     )
     print(f"Created subnet group: {subnet_group_name}")
 
-# Create or get the Elasticache cluster
-create_or_get_elasticache_cluster(cluster_id, node_type, engine, num_cache_nodes, subnet_group_name, security_group_id,
-                                  region)
+# Create or get the active and standby Elasticache clusters; both are provisioned in parallel
+with ThreadPoolExecutor(max_workers=2) as executor:
+    futures = [executor.submit(create_or_get_elasticache_cluster, cluster_id, node_type, engine, num_cache_nodes,
+                               subnet_group_name, security_group_id, region, availability_zones)]
+    if standby_num_cache_nodes:
+        futures.append(executor.submit(create_or_get_elasticache_cluster, standby_cluster_id, node_type, engine,
+                                       standby_num_cache_nodes, subnet_group_name, security_group_id, region,
+                                       availability_zones))
+    for future in futures:
+        future.result()
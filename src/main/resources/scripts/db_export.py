@@ -0,0 +1,306 @@
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+import pymysql.cursors
+
+from dump_storage import (COMPRESSION_SUFFIXES, CompressedWriter, iter_lines, join_location, open_input, read_bytes,
+                          write_bytes)
+from properties_file import db_settings_from_properties, read_properties
+from vpc_seed_loader import iter_statements
+
+# Parallel logical export of the accounts database, and the matching loader.
+#
+# export - every table is split into chunks by ranges of the first primary key
+#          column (sized from the row estimate so a chunk holds about
+#          --chunk-rows rows) and the chunks are dumped by --threads
+#          connections at once. Rows are read with an unbuffered cursor and
+#          written as multi-row INSERTs through gzip/zstd straight into local
+#          files or S3 multipart uploads, so memory stays bounded however big
+#          the table is. manifest.json lists the schema file and chunks of each
+#          table with their row counts and sizes.
+# load   - runs the schema files, then loads the chunks in parallel.
+#
+# Each export connection reads from its own consistent snapshot, taken when it
+# starts. For an export that is consistent across tables, export from a
+# source without writes: a read replica with replication stopped
+# (CALL mysql.rds_stop_replication) or an instance restored from a snapshot.
+#
+# create-rds-db.py seeds from a manifest when dump_manifest is set.
+
+DEFAULT_PROPERTIES_FILE = 'src/main/resources/application.properties'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+INSERT_ROWS = 1000  # rows per INSERT statement
+INSERT_BYTES = 1024 * 1024  # and at most this much SQL, well below max_allowed_packet
+CHUNK_HEADER = "SET NAMES utf8mb4;\nSET foreign_key_checks = 0;\nSET unique_checks = 0;\n"
+INTEGER_TYPES = ('tinyint', 'smallint', 'mediumint', 'int', 'bigint')
+
+
+def list_tables(cursor, database):
+    # Returns [(table, estimated rows, [primary key columns], first key column type)]
+    try:
+        # MySQL 8 caches TABLE_ROWS for a day; right after a bulk load it is 0
+        # or stale. Servers without the variable report it live.
+        cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+    except pymysql.err.OperationalError:
+        pass
+    cursor.execute("SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s "
+                   "AND TABLE_TYPE = 'BASE TABLE' ORDER BY TABLE_NAME", (database,))
+    tables = cursor.fetchall()
+    cursor.execute("SELECT s.TABLE_NAME, s.COLUMN_NAME, c.DATA_TYPE FROM information_schema.STATISTICS s "
+                   "JOIN information_schema.COLUMNS c ON c.TABLE_SCHEMA = s.TABLE_SCHEMA "
+                   "AND c.TABLE_NAME = s.TABLE_NAME AND c.COLUMN_NAME = s.COLUMN_NAME "
+                   "WHERE s.TABLE_SCHEMA = %s AND s.INDEX_NAME = 'PRIMARY' ORDER BY s.TABLE_NAME, s.SEQ_IN_INDEX",
+                   (database,))
+    keys = {}
+    for table, column, data_type in cursor.fetchall():
+        keys.setdefault(table, []).append((column, data_type))
+    return [(table, rows or 0, [column for column, _ in keys.get(table, [])],
+             keys[table][0][1] if table in keys else None) for table, rows in tables]
+
+
+def plan_chunks(cursor, table, estimated_rows, key_columns, key_type, chunk_rows):
+    # Returns [(low, high)] ranges of the first key column (high exclusive),
+    # or [None] for a single chunk when the table has no integer key. Without
+    # a row estimate the keys are taken as dense, chunk_rows per range.
+    if not key_columns or key_type not in INTEGER_TYPES:
+        return [None]
+    key = key_columns[0]
+    cursor.execute(f"SELECT MIN(`{key}`), MAX(`{key}`) FROM `{table}`")
+    low, high = cursor.fetchone()
+    if low is None:
+        return []
+    span = high - low + 1
+    step = max(1, math.ceil(span * chunk_rows / estimated_rows) if estimated_rows > 0 else chunk_rows)
+    return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+
+class Exporter:
+
+    def __init__(self, db, output, compression, region, threads):
+        self.db = db
+        self.output = output
+        self.compression = compression
+        self.region = region
+        self.threads = threads
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.start = time.time()
+
+    def connection(self):
+        # One connection per worker thread, each in its own consistent snapshot
+        if not hasattr(self.local, 'connection'):
+            connection = pymysql.connect(**self.db)
+            with connection.cursor() as cursor:
+                cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return self.local.connection
+
+    def file_name(self, name):
+        return f"{name}.sql{COMPRESSION_SUFFIXES[self.compression]}"
+
+    def export_schema(self, table):
+        with self.connection().cursor() as cursor:
+            cursor.execute(f"SHOW CREATE TABLE `{table}`")
+            create_statement = cursor.fetchone()[1]
+        name = self.file_name(f"{table}-schema")
+        writer = CompressedWriter(join_location(self.output, name), self.compression, self.region)
+        writer.write((f"SET NAMES utf8mb4;\nSET foreign_key_checks = 0;\nDROP TABLE IF EXISTS `{table}`;\n"
+                      f"{create_statement};\n").encode())
+        writer.close()
+        return name
+
+    def export_chunk(self, table, index, key, key_range):
+        connection = self.connection()
+        name = self.file_name(f"{table}.{index:05d}")
+        query = f"SELECT * FROM `{table}`"
+        if key_range:
+            query += f" WHERE `{key}` >= {int(key_range[0])} AND `{key}` < {int(key_range[1])} ORDER BY `{key}`"
+        writer = CompressedWriter(join_location(self.output, name), self.compression, self.region)
+        rows = 0
+        try:
+            writer.write(CHUNK_HEADER.encode())
+            cursor = connection.cursor(pymysql.cursors.SSCursor)
+            cursor.execute(query)
+            columns = ', '.join(f"`{column[0]}`" for column in cursor.description)
+            prefix = f"INSERT INTO `{table}` ({columns}) VALUES\n"
+            values = []
+            size = 0
+            for row in cursor:
+                value = f"({','.join(connection.escape(item) for item in row)})"
+                values.append(value)
+                size += len(value)
+                rows += 1
+                if len(values) >= INSERT_ROWS or size >= INSERT_BYTES:
+                    writer.write((prefix + ',\n'.join(values) + ';\n').encode())
+                    values, size = [], 0
+            if values:
+                writer.write((prefix + ',\n'.join(values) + ';\n').encode())
+            cursor.close()
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        with self.lock:
+            self.rows += rows
+            rate = self.rows / (time.time() - self.start)
+        print(f"Exported {name}: {rows} rows ({self.rows:,} total, {rate:,.0f} rows/s)")
+        return {'file': name, 'rows': rows, 'bytes': writer.size,
+                'range': list(key_range) if key_range else None}
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+def export_database(db, output, compression='gzip', threads=4, chunk_rows=500000, region=None, tables=None):
+    # Returns the manifest, which is also written to output/manifest.json
+    exporter = Exporter(db, output, compression, region, threads)
+    try:
+        with exporter.connection().cursor() as cursor:
+            table_list = [entry for entry in list_tables(cursor, db['database'])
+                          if not tables or entry[0] in tables]
+            plans = [(table, key_columns[0] if key_columns else None,
+                      plan_chunks(cursor, table, rows, key_columns, key_type, chunk_rows))
+                     for table, rows, key_columns, key_type in table_list]
+        print(f"Exporting {len(plans)} tables in {sum(len(chunks) for _, _, chunks in plans)} chunks "
+              f"with {threads} connections")
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            schemas = {table: executor.submit(exporter.export_schema, table) for table, _, _ in plans}
+            chunks = {table: [executor.submit(exporter.export_chunk, table, index, key, key_range)
+                              for index, key_range in enumerate(chunks)]
+                      for table, key, chunks in plans}
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'database': db['database'],
+                'source': db['host'],
+                'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'compression': compression,
+                'tables': [{'name': table, 'schema': schemas[table].result(),
+                            'chunks': [future.result() for future in chunks[table]]}
+                           for table, _, _ in plans]
+            }
+    finally:
+        exporter.close()
+    for table in manifest['tables']:
+        table['rows'] = sum(chunk['rows'] for chunk in table['chunks'])
+    write_bytes(join_location(output, MANIFEST_NAME), json.dumps(manifest, indent=2).encode(), region)
+    elapsed = time.time() - exporter.start
+    print(f"Exported {exporter.rows:,} rows in {elapsed:.1f}s to {output}")
+    return manifest
+
+
+def manifest_location(location):
+    return location if location.endswith('.json') else join_location(location, MANIFEST_NAME)
+
+
+def read_manifest(location, region=None):
+    # Returns (manifest, base location of its files)
+    path = manifest_location(location)
+    base = path.rsplit('/', 1)[0] if '/' in path else '.'
+    return json.loads(read_bytes(path, region)), base
+
+
+def manifest_hash(location, region=None):
+    # The manifest lists every file with its row count and size, so its hash
+    # identifies the export like dump_hash does a single dump file
+    return hashlib.sha256(read_bytes(manifest_location(location), region)).hexdigest()
+
+
+def execute_file(connection, location, region=None):
+    stream = open_input(location, region)
+    executed = 0
+    try:
+        with connection.cursor() as cursor:
+            for statement in iter_statements(iter_lines(stream)):
+                cursor.execute(statement)
+                executed += 1
+        connection.commit()
+    finally:
+        stream.close()
+    return executed
+
+
+def load_manifest(location, db, threads=4, region=None):
+    # Creates the tables one by one, then loads all chunks in parallel
+    manifest, base = read_manifest(location, region)
+    start = time.time()
+    connection = pymysql.connect(**db)
+    try:
+        for table in manifest['tables']:
+            execute_file(connection, join_location(base, table['schema']), region)
+    finally:
+        connection.close()
+
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+    loaded = {'rows': 0}
+
+    def load_chunk(table, chunk):
+        if not hasattr(local, 'connection'):
+            local.connection = pymysql.connect(**db)
+            with lock:
+                connections.append(local.connection)
+        execute_file(local.connection, join_location(base, chunk['file']), region)
+        with lock:
+            loaded['rows'] += chunk['rows']
+            rate = loaded['rows'] / (time.time() - start)
+        print(f"Loaded {chunk['file']}: {chunk['rows']} rows ({loaded['rows']:,} total, {rate:,.0f} rows/s)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = [executor.submit(load_chunk, table['name'], chunk)
+                       for table in manifest['tables'] for chunk in table['chunks']]
+            for future in futures:
+                future.result()
+    finally:
+        for connection in connections:
+            connection.close()
+    print(f"Loaded {loaded['rows']:,} rows into {db['database']} in {time.time() - start:.1f}s")
+    return loaded['rows']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Parallel chunked export and load of the accounts database")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('export', 'load'):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument('--properties', default=DEFAULT_PROPERTIES_FILE,
+                               help="application.properties with the jdbc.* settings (used unless --host is given)")
+        subparser.add_argument('--host', help="MySQL host, e.g. 127.0.0.1 for a local server")
+        subparser.add_argument('--port', type=int, default=3306)
+        subparser.add_argument('--user', default='root')
+        subparser.add_argument('--password', default='')
+        subparser.add_argument('--database', default='accounts')
+        subparser.add_argument('--threads', type=int, default=4, help="parallel connections")
+        subparser.add_argument('--region', default='ap-south-1')
+        if name == 'export':
+            subparser.add_argument('--output', required=True, help="directory or s3://bucket/prefix")
+            subparser.add_argument('--compression', choices=sorted(COMPRESSION_SUFFIXES), default='gzip')
+            subparser.add_argument('--chunk-rows', type=int, default=500000, help="target rows per chunk file")
+            subparser.add_argument('--tables', nargs='+', help="only export these tables")
+        else:
+            subparser.add_argument('--manifest', required=True, help="manifest.json or the export location")
+    args = parser.parse_args()
+
+    if args.host:
+        db = {'host': args.host, 'port': args.port, 'user': args.user, 'password': args.password,
+              'database': args.database, 'charset': 'utf8mb4'}
+    else:
+        db = db_settings_from_properties(read_properties(args.properties))
+    if args.command == 'export':
+        export_database(db, args.output, args.compression, args.threads, args.chunk_rows, args.region, args.tables)
+    else:
+        load_manifest(args.manifest, db, args.threads, args.region)
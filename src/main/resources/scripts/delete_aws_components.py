@@ -12,11 +12,22 @@ elasticache = boto3.client('elasticache', region_name=REGION)
 elasticbeanstalk = boto3.client('elasticbeanstalk', region_name=REGION)
 codecommit = boto3.client('codecommit', region_name=REGION)
 codepipeline = boto3.client('codepipeline', region_name=REGION)
+events = boto3.client('events', region_name=REGION)
 s3 = boto3.client('s3', region_name=REGION)
+lambda_client = boto3.client('lambda', region_name=REGION)
 
 
 def delete_rds_instance(db_instance_identifier):
     try:
+        # Read replicas are deleted first, together, before the primary
+        replica_ids = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0][
+            'ReadReplicaDBInstanceIdentifiers']
+        for replica_id in replica_ids:
+            rds.delete_db_instance(DBInstanceIdentifier=replica_id, SkipFinalSnapshot=True)
+            print(f"Deleting RDS read replica: {replica_id}")
+        if replica_ids:
+            rds.get_waiter('db_instance_deleted').wait(Filters=[{'Name': 'db-instance-id', 'Values': replica_ids}])
+            print(f"RDS read replicas {', '.join(replica_ids)} deleted successfully.")
         rds.delete_db_instance(
             DBInstanceIdentifier=db_instance_identifier,
             SkipFinalSnapshot=True
@@ -40,6 +51,17 @@ def delete_mq_broker(broker_id):
         print(f"MQ broker {broker_id} not found.")
 
 
+def delete_mq_configuration(configuration_name):
+    # A configuration can only be deleted once no broker uses it
+    configurations = mq.list_configurations(MaxResults=100)['Configurations']
+    for configuration in configurations:
+        if configuration['Name'] == configuration_name:
+            mq.delete_configuration(ConfigurationId=configuration['Id'])
+            print(f"MQ configuration {configuration_name} deleted successfully.")
+            return
+    print(f"MQ configuration {configuration_name} not found.")
+
+
 def delete_elasticache_cluster(cluster_id):
     try:
         elasticache.delete_cache_cluster(CacheClusterId=cluster_id)
@@ -158,6 +180,17 @@ def delete_codepipeline(pipeline_name):
         print(f"CodePipeline {pipeline_name} not found.")
 
 
+def delete_eventbridge_rule(rule_name):
+    try:
+        targets = events.list_targets_by_rule(Rule=rule_name)['Targets']
+        if targets:
+            events.remove_targets(Rule=rule_name, Ids=[target['Id'] for target in targets])
+        events.delete_rule(Name=rule_name)
+        print(f"Deleted EventBridge rule: {rule_name}")
+    except events.exceptions.ResourceNotFoundException:
+        print(f"EventBridge rule {rule_name} not found.")
+
+
 def delete_s3_bucket(bucket_name):
     try:
         bucket = s3.Bucket(bucket_name)
@@ -170,22 +203,38 @@ def delete_s3_bucket(bucket_name):
         print(f"Error deleting S3 bucket {bucket_name}: {e}")
 
 
+def delete_lambda_function(function_name):
+    try:
+        lambda_client.delete_function(FunctionName=function_name)
+        print(f"Deleted Lambda function: {function_name}")
+    except lambda_client.exceptions.ResourceNotFoundException:
+        print(f"Lambda function {function_name} not found.")
+
+
 # Parameters
 DB_INSTANCE_IDENTIFIER = "dmanup-aws-codecomit-demo-rdsdb"
 BROKER_ID = "dmanup-aws-codecomit-demo-mq-broker"
+BROKER_CONFIGURATION_NAME = f"{BROKER_ID}-config"
 CACHE_CLUSTER_ID = "dmanup-aws-codecomit-demo-elasticache"
+STANDBY_CACHE_CLUSTER_ID = f"{CACHE_CLUSTER_ID}-standby"
 ENV_NAME = "dmanup-aws-codecomit-demo-env"
 APP_NAME = "dmanup-aws-codecomit-demo-app"
 BACKEND_SECURITY_GROUP_NAME = "dmanup-demo-aws-paas-backend-secgrp"
 REPO_NAME = "dmanup-aws-codecommit-demo-repo"
 PIPELINE_NAME = "dmanup-aws-codepipeline-demo"
+EVENT_RULE_NAME = f"{PIPELINE_NAME}-codecommit-trigger"
 S3_BUCKET_NAME = "dmanup-aws-paas-demo-bucket"
+SEED_LOADER_FUNCTION_NAME = "dmanup-aws-rds-seed-loader"
 
 # Delete components
 delete_rds_instance(DB_INSTANCE_IDENTIFIER)
+delete_lambda_function(SEED_LOADER_FUNCTION_NAME)
 delete_mq_broker(BROKER_ID)
+delete_mq_configuration(BROKER_CONFIGURATION_NAME)
 delete_elasticache_cluster(CACHE_CLUSTER_ID)
+delete_elasticache_cluster(STANDBY_CACHE_CLUSTER_ID)
 delete_elastic_beanstalk(ENV_NAME, APP_NAME, BACKEND_SECURITY_GROUP_NAME)
 delete_codecommit_repo(REPO_NAME)
 delete_codepipeline(PIPELINE_NAME)
+delete_eventbridge_rule(EVENT_RULE_NAME)
 delete_s3_bucket(S3_BUCKET_NAME)
@@ -0,0 +1,198 @@
+import gzip
+import io
+import os
+import time
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Compressed dump files on local disk or in S3, shared by the export and
+# seeding tools. Output is streamed: S3 objects are written with multipart
+# uploads part by part, so memory stays bounded by PART_SIZE whatever the dump
+# size. Reads from S3 go through ranged GETs, so a dump of any size streams
+# through a small buffer, and a dropped connection only retries the current
+# range instead of the whole object. zstd needs the zstandard package; gzip
+# always works.
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PART_SIZE = 8 * 1024 * 1024  # S3 multipart part size, at least 5 MiB
+RANGE_SIZE = 8 * 1024 * 1024  # bytes per ranged GET when reading from S3
+RANGE_RETRIES = 5
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+
+def is_s3(location):
+    return location.startswith('s3://')
+
+
+def split_s3(location):
+    bucket, _, key = location[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def join_location(base, name):
+    return f"{base.rstrip('/')}/{name}" if is_s3(base) else os.path.join(base, name)
+
+
+class S3MultipartWriter:
+    # File-like object that uploads what is written to it as an S3 object
+
+    def __init__(self, location, region=None):
+        self.bucket, self.key = split_s3(location)
+        self.s3 = boto3.client('s3', region_name=region)
+        self.upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        self.parts = []
+        self.buffer = bytearray()
+        self.size = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        if len(self.buffer) >= PART_SIZE:
+            self._upload_part()
+        return len(data)
+
+    def _upload_part(self):
+        number = len(self.parts) + 1
+        response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number,
+                                       Body=bytes(self.buffer))
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+        self.buffer = bytearray()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                          MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+class CompressedWriter:
+    # Compresses into a local file or an S3 object; size is the compressed size
+    # once closed
+
+    def __init__(self, location, compression='gzip', region=None):
+        if compression == 'zstd' and zstandard is None:
+            raise Exception("zstd compression needs the zstandard package (pip install zstandard)")
+        if is_s3(location):
+            self.raw = S3MultipartWriter(location, region)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(location)), exist_ok=True)
+            self.raw = open(location, 'wb')
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+        elif compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        self.size = 0
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def close(self):
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.size = self.raw.size if isinstance(self.raw, S3MultipartWriter) else self.raw.tell()
+        self.raw.close()
+
+    def abort(self):
+        if isinstance(self.raw, S3MultipartWriter):
+            self.raw.abort()
+        else:
+            self.raw.close()
+
+
+class S3RangeReader(io.RawIOBase):
+    # Sequential reader of an S3 object, one ranged GET of RANGE_SIZE bytes at
+    # a time; a failed GET is retried from the same offset
+
+    def __init__(self, location, region=None):
+        self.bucket, self.key = split_s3(location)
+        self.s3 = boto3.client('s3', region_name=region)
+        self.length = self.s3.head_object(Bucket=self.bucket, Key=self.key)['ContentLength']
+        self.offset = 0
+        self.block = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def _fetch(self):
+        end = min(self.offset + RANGE_SIZE, self.length) - 1
+        for attempt in range(RANGE_RETRIES):
+            try:
+                response = self.s3.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={self.offset}-{end}")
+                return response['Body'].read()
+            except (BotoCoreError, ClientError):
+                if attempt == RANGE_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def readinto(self, buffer):
+        if not self.block:
+            if self.offset >= self.length:
+                return 0
+            self.block = memoryview(self._fetch())
+            self.offset += len(self.block)
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+
+def open_input(location, region=None):
+    # Returns a readable binary stream of the decompressed content
+    if is_s3(location):
+        stream = io.BufferedReader(S3RangeReader(location, region), buffer_size=1024 * 1024)
+    else:
+        stream = open(location, 'rb')
+    if location.endswith('.gz'):
+        return gzip.GzipFile(fileobj=stream)
+    if location.endswith('.zst'):
+        if zstandard is None:
+            raise Exception(f"{location} is zstd-compressed; pip install zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    return stream
+
+
+def iter_lines(stream, chunk_size=1024 * 1024):
+    # Decoded lines of a binary stream, read in fixed-size chunks (S3 bodies and
+    # zstd readers do not iterate by line)
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8') + '\n'
+    if pending:
+        yield pending.decode('utf-8')
+
+
+def read_bytes(location, region=None):
+    stream = open_input(location, region)
+    try:
+        return stream.read()
+    finally:
+        stream.close()
+
+
+def write_bytes(location, data, region=None):
+    if is_s3(location):
+        bucket, key = split_s3(location)
+        boto3.client('s3', region_name=region).put_object(Bucket=bucket, Key=key, Body=data)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(location)), exist_ok=True)
+        with open(location, 'wb') as file:
+            file.write(data)
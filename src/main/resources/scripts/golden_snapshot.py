@@ -0,0 +1,170 @@
+import argparse
+import hashlib
+
+import boto3
+
+from dump_storage import is_s3, split_s3
+from rds_sizing import create_arguments, grown_storage
+
+# "Golden" snapshots of the seeded accounts database. A golden snapshot is an
+# RDS snapshot of an instance loaded from db_backup.sql, named and tagged with
+# the SHA-256 of the dump, so a new environment can restore it
+# (restore_db_instance_from_db_snapshot) instead of creating an empty instance,
+# opening it to the internet and seeding it. When the dump changes its hash
+# changes, no snapshot matches, and create-rds-db.py falls back to seeding
+# and takes a new golden snapshot.
+#
+#   status  - show whether a golden snapshot exists for the current dump
+#   refresh - snapshot an instance seeded with the current dump and delete the
+#             golden snapshots of older dumps
+#
+# create-rds-db.py tags the instance with the hash of the dump it loaded, and
+# refresh refuses to snapshot an instance whose tag does not match.
+
+DEFAULT_SQL_FILE = 'src/main/resources/db_backup.sql'
+DUMP_HASH_TAG = 'DumpSha256'
+GOLDEN_TAG = 'GoldenSnapshot'
+HASH_LENGTH = 16  # characters of the hash used in the snapshot identifier
+
+
+def dump_hash(sql_file_path, region=None):
+    # For a dump in S3 the object's ETag and size stand in for its content, so
+    # a multi-GB dump is not downloaded just to be hashed
+    if is_s3(sql_file_path):
+        bucket, key = split_s3(sql_file_path)
+        head = boto3.client('s3', region_name=region).head_object(Bucket=bucket, Key=key)
+        return hashlib.sha256(f"{head['ETag']}:{head['ContentLength']}".encode()).hexdigest()
+    digest = hashlib.sha256()
+    with open(sql_file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def golden_snapshot_identifier(db_instance_identifier, sql_hash):
+    return f"{db_instance_identifier}-golden-{sql_hash[:HASH_LENGTH]}"
+
+
+def find_golden_snapshot(db_instance_identifier, sql_hash, region):
+    # Returns the identifier of the available golden snapshot for the dump, or None
+    rds = boto3.client('rds', region_name=region)
+    snapshot_identifier = golden_snapshot_identifier(db_instance_identifier, sql_hash)
+    try:
+        snapshot = rds.describe_db_snapshots(DBSnapshotIdentifier=snapshot_identifier)['DBSnapshots'][0]
+    except rds.exceptions.DBSnapshotNotFoundFault:
+        return None
+    if snapshot['Status'] != 'available':
+        print(f"Golden snapshot {snapshot_identifier} is {snapshot['Status']}, not using it.")
+        return None
+    return snapshot_identifier
+
+
+def golden_snapshots(db_instance_identifier, region):
+    rds = boto3.client('rds', region_name=region)
+    snapshots = []
+    for page in rds.get_paginator('describe_db_snapshots').paginate(DBInstanceIdentifier=db_instance_identifier,
+                                                                    SnapshotType='manual'):
+        snapshots += [snapshot for snapshot in page['DBSnapshots']
+                      if snapshot['DBSnapshotIdentifier'].startswith(f"{db_instance_identifier}-golden-")]
+    return snapshots
+
+
+def instance_dump_hash(db_instance_identifier, region):
+    rds = boto3.client('rds', region_name=region)
+    instance = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0]
+    tags = {tag['Key']: tag['Value'] for tag in instance.get('TagList', [])}
+    return tags.get(DUMP_HASH_TAG)
+
+
+def tag_instance_dump_hash(db_instance_identifier, sql_hash, region):
+    # Records which dump the instance was seeded with
+    rds = boto3.client('rds', region_name=region)
+    instance_arn = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0][
+        'DBInstanceArn']
+    rds.add_tags_to_resource(ResourceName=instance_arn, Tags=[{'Key': DUMP_HASH_TAG, 'Value': sql_hash}])
+
+
+def create_golden_snapshot(db_instance_identifier, sql_hash, region, wait=True):
+    # Snapshots an instance seeded with the dump and deletes the golden
+    # snapshots of older dumps once the new one is available (or right away if
+    # not waiting). Returns the snapshot identifier.
+    rds = boto3.client('rds', region_name=region)
+    snapshot_identifier = golden_snapshot_identifier(db_instance_identifier, sql_hash)
+    existing = [snapshot['DBSnapshotIdentifier'] for snapshot in golden_snapshots(db_instance_identifier, region)]
+    previous = [identifier for identifier in existing if identifier != snapshot_identifier]
+    if snapshot_identifier in existing:
+        print(f"Golden snapshot {snapshot_identifier} already exists.")
+    else:
+        rds.create_db_snapshot(
+            DBSnapshotIdentifier=snapshot_identifier,
+            DBInstanceIdentifier=db_instance_identifier,
+            Tags=[{'Key': GOLDEN_TAG, 'Value': 'true'}, {'Key': DUMP_HASH_TAG, 'Value': sql_hash}]
+        )
+        print(f"Creating golden snapshot {snapshot_identifier}")
+    if wait:
+        rds.get_waiter('db_snapshot_available').wait(DBSnapshotIdentifier=snapshot_identifier,
+                                                      WaiterConfig={'Delay': 30, 'MaxAttempts': 120})
+        print(f"Golden snapshot {snapshot_identifier} is available.")
+    for old_identifier in previous:
+        rds.delete_db_snapshot(DBSnapshotIdentifier=old_identifier)
+        print(f"Deleted golden snapshot of an older dump: {old_identifier}")
+    return snapshot_identifier
+
+
+def restore_from_golden_snapshot(db_instance_identifier, snapshot_identifier, sizing, subnet_group_name,
+                                 security_group_id, parameter_group_name, backup_retention_period, region):
+    # The restored instance is private from the start and already seeded; the
+    # master credentials are those of the snapshot's source instance. Storage
+    # autoscaling may have grown that instance past the sizing, and a snapshot
+    # cannot be restored onto a smaller volume.
+    rds = boto3.client('rds', region_name=region)
+    snapshot = rds.describe_db_snapshots(DBSnapshotIdentifier=snapshot_identifier)['DBSnapshots'][0]
+    storage = grown_storage(create_arguments(sizing), snapshot['AllocatedStorage'])
+    storage.pop('MaxAllocatedStorage', None)
+    rds.restore_db_instance_from_db_snapshot(
+        DBInstanceIdentifier=db_instance_identifier,
+        DBSnapshotIdentifier=snapshot_identifier,
+        DBSubnetGroupName=subnet_group_name,
+        VpcSecurityGroupIds=[security_group_id],
+        DBParameterGroupName=parameter_group_name,
+        BackupRetentionPeriod=backup_retention_period,
+        PubliclyAccessible=False,
+        **storage
+    )
+    print(f"Restoring RDS instance {db_instance_identifier} from golden snapshot {snapshot_identifier}")
+    rds.get_waiter('db_instance_available').wait(DBInstanceIdentifier=db_instance_identifier,
+                                                  WaiterConfig={'Delay': 30, 'MaxAttempts': 120})
+    endpoint = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0]['Endpoint'][
+        'Address']
+    print(f"Restored RDS Endpoint: {endpoint}")
+    return endpoint
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Golden snapshots of the seeded accounts database")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('status', 'refresh'):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument('--db-instance', default='dmanup-aws-codecomit-demo-rdsdb',
+                               help="instance the golden snapshots are taken from")
+        subparser.add_argument('--sql-file', default=DEFAULT_SQL_FILE, help=".sql, .sql.gz or .sql.zst, local or s3://")
+        subparser.add_argument('--region', default='ap-south-1')
+    args = parser.parse_args()
+
+    sql_hash = dump_hash(args.sql_file, args.region)
+    print(f"{args.sql_file}: sha256 {sql_hash}")
+    current = find_golden_snapshot(args.db_instance, sql_hash, args.region)
+    if args.command == 'status':
+        for snapshot in golden_snapshots(args.db_instance, args.region):
+            marker = '*' if snapshot['DBSnapshotIdentifier'] == current else ' '
+            print(f" {marker} {snapshot['DBSnapshotIdentifier']}  {snapshot['Status']}  "
+                  f"{snapshot.get('SnapshotCreateTime', '')}")
+        print(f"Golden snapshot for this dump: {current or 'none'}")
+    elif current:
+        print(f"Golden snapshot {current} is up to date.")
+    else:
+        seeded_hash = instance_dump_hash(args.db_instance, args.region)
+        if seeded_hash != sql_hash:
+            raise SystemExit(f"{args.db_instance} was seeded with {seeded_hash or 'an unknown dump'}; "
+                             f"run create-rds-db.py to load the current dump first.")
+        create_golden_snapshot(args.db_instance, sql_hash, args.region)
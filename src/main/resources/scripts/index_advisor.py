@@ -0,0 +1,255 @@
+import argparse
+import re
+import time
+
+import pymysql
+import pymysql.cursors
+
+from latency_histogram import LatencyHistogram
+from login_load_test import FIND_ALL_ROLES, FIND_BY_USERNAME, ROLES_OF_USER, USER_COLUMNS
+from properties_file import db_settings_from_properties, read_properties
+
+# Index advisor for the accounts database. Runs the queries the app issues
+# through EXPLAIN, flags full table scans, full index scans, filesorts and
+# temporary tables, and proposes index DDL for the tables behind them: the
+# columns compared with '= %s' first, then the ORDER BY columns. Indexes that
+# already exist (as a prefix of an existing index) are not proposed again.
+#
+# With --measure the suggestions are tried on a scratch copy of the database
+# first, and the latency of every query is compared before and after; --apply
+# applies them to the database itself with online DDL. create-rds-db.py calls
+# advise_indexes() after seeding.
+
+DEFAULT_PROPERTIES_FILE = 'src/main/resources/application.properties'
+
+# name: (query, query returning sample parameters, parameters if there are none)
+QUERY_SET = {
+    'login_by_username': (FIND_BY_USERNAME, "SELECT username FROM user WHERE username IS NOT NULL LIMIT 1000",
+                          ('',)),
+    'roles_of_user': (ROLES_OF_USER, "SELECT user_id FROM user_role LIMIT 1000", (0,)),
+    'user_by_id': (f"SELECT {', '.join(USER_COLUMNS)} FROM user WHERE id = %s", "SELECT id FROM user LIMIT 1000",
+                   (0,)),
+    'user_by_email': (f"SELECT {', '.join(USER_COLUMNS)} FROM user WHERE userEmail = %s",
+                      "SELECT userEmail FROM user WHERE userEmail IS NOT NULL LIMIT 1000", ('',)),
+    'all_roles': (FIND_ALL_ROLES, None, ())
+}
+TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|INNER|LEFT|RIGHT|JOIN|ORDER|'
+                           r'GROUP|LIMIT)\b)(\w+))?', re.IGNORECASE)
+EQUALITY_PATTERN = re.compile(r'(?:`?(\w+)`?\.)?`?(\w+)`?\s*=\s*%s')
+ORDER_PATTERN = re.compile(r'\bORDER\s+BY\s+(.+?)(?:\s+LIMIT\b|$)', re.IGNORECASE | re.DOTALL)
+MEASURE_ITERATIONS = 500
+SCRATCH_SUFFIX = '_index_advisor'
+
+
+def query_tables(sql):
+    # Returns {alias: table}; tables without an alias map to themselves
+    aliases = {}
+    for table, alias in TABLE_PATTERN.findall(sql):
+        aliases[alias or table] = table
+        aliases[table] = table
+    return aliases
+
+
+def candidate_columns(sql):
+    # Returns {table: [columns]}: equality columns, then ORDER BY columns
+    aliases = query_tables(sql)
+    default_table = next(iter(aliases.values()), None)
+    candidates = {}
+    for alias, column in EQUALITY_PATTERN.findall(sql):
+        table = aliases.get(alias, default_table)
+        candidates.setdefault(table, [])
+        if column not in candidates[table]:
+            candidates[table].append(column)
+    order = ORDER_PATTERN.search(sql)
+    if order:
+        for term in order.group(1).split(','):
+            alias, _, column = term.split()[0].strip('`').rpartition('.')
+            table = aliases.get(alias, default_table)
+            candidates.setdefault(table, [])
+            if column not in candidates[table]:
+                candidates[table].append(column)
+    return candidates
+
+
+def existing_indexes(cursor, database):
+    # Returns {table: [[columns of each index in order], ...]}
+    cursor.execute("SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS "
+                   "WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX", (database,))
+    indexes = {}
+    for row in cursor.fetchall():
+        indexes.setdefault(row['TABLE_NAME'], {}).setdefault(row['INDEX_NAME'], []).append(row['COLUMN_NAME'])
+    return {table: list(by_name.values()) for table, by_name in indexes.items()}
+
+
+def is_covered(columns, indexes):
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+def sample_parameters(cursor, sample_query, default):
+    if not sample_query:
+        return [default]
+    cursor.execute(sample_query)
+    samples = [tuple(row.values()) for row in cursor.fetchall()]
+    return samples or [default]
+
+
+def explain_queries(cursor, query_set=QUERY_SET):
+    # Returns [(query name, EXPLAIN row, [problems])] for every plan step
+    plans = []
+    for name, (sql, sample_query, default) in query_set.items():
+        parameters = sample_parameters(cursor, sample_query, default)[0]
+        cursor.execute("EXPLAIN " + sql, parameters)
+        for row in cursor.fetchall():
+            extra = row.get('Extra') or ''
+            problems = []
+            if row['type'] == 'ALL':
+                problems.append('full table scan')
+            elif row['type'] == 'index':
+                problems.append('full index scan')
+            if 'Using filesort' in extra:
+                problems.append('filesort')
+            if 'Using temporary' in extra:
+                problems.append('temporary table')
+            plans.append((name, row, problems))
+    return plans
+
+
+def suggest_indexes(plans, indexes, query_set=QUERY_SET):
+    # Returns {(table, tuple(columns)): [query names]} for the flagged steps
+    suggestions = {}
+    for name, row, problems in plans:
+        if not problems:
+            continue
+        sql = query_set[name][0]
+        table = query_tables(sql).get(row['table'], row['table'])
+        columns = candidate_columns(sql).get(table)
+        if not columns or is_covered(columns, indexes.get(table, [])):
+            continue
+        suggestions.setdefault((table, tuple(columns)), []).append(name)
+    # An index that is a prefix of another suggestion on the same table is redundant
+    for table, columns in list(suggestions):
+        for other_table, other_columns in suggestions:
+            if other_table == table and len(other_columns) > len(columns) \
+                    and other_columns[:len(columns)] == columns:
+                suggestions[(other_table, other_columns)] += suggestions.pop((table, columns))
+                break
+    return suggestions
+
+
+def index_ddl(table, columns):
+    name = f"idx_{table}_{'_'.join(column.lower() for column in columns)}"[:64]
+    return (f"ALTER TABLE `{table}` ADD INDEX `{name}` ({', '.join(f'`{column}`' for column in columns)}), "
+            "ALGORITHM=INPLACE, LOCK=NONE")
+
+
+def print_report(plans, suggestions):
+    for name, row, problems in plans:
+        if problems:
+            print(f"{name}: {', '.join(problems)} on {row['table']} (~{row['rows']} rows examined)")
+    if not any(problems for _, _, problems in plans):
+        print("No full scans or filesorts in the query set.")
+    for (table, columns), names in suggestions.items():
+        print(f"Suggested for {', '.join(names)}:\n  {index_ddl(table, columns)};")
+    for name, row, problems in plans:
+        if problems and not any(name in names for names in suggestions.values()):
+            print(f"{name}: no index helps (no filter or already indexed)")
+
+
+def measure_latency(cursor, query_set=QUERY_SET, iterations=MEASURE_ITERATIONS):
+    histograms = {}
+    for name, (sql, sample_query, default) in query_set.items():
+        samples = sample_parameters(cursor, sample_query, default)
+        histogram = LatencyHistogram()
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            cursor.execute(sql, samples[iteration % len(samples)])
+            cursor.fetchall()
+            histogram.record((time.perf_counter() - start) * 1e6)
+        histograms[name] = histogram
+    return histograms
+
+
+def copy_database(cursor, source, scratch):
+    # CREATE TABLE ... LIKE keeps the indexes but not the foreign keys, which
+    # the read-only query set does not need
+    cursor.execute(f"DROP DATABASE IF EXISTS `{scratch}`")
+    cursor.execute(f"CREATE DATABASE `{scratch}`")
+    cursor.execute("SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s "
+                   "AND TABLE_TYPE = 'BASE TABLE'", (source,))
+    for row in cursor.fetchall():
+        table = row['TABLE_NAME']
+        cursor.execute(f"CREATE TABLE `{scratch}`.`{table}` LIKE `{source}`.`{table}`")
+        cursor.execute(f"INSERT INTO `{scratch}`.`{table}` SELECT * FROM `{source}`.`{table}`")
+
+
+def apply_suggestions(cursor, suggestions):
+    for table, columns in suggestions:
+        cursor.execute(index_ddl(table, columns))
+        cursor.execute(f"ANALYZE TABLE `{table}`")
+        cursor.fetchall()
+        print(f"Added index on {table} ({', '.join(columns)})")
+
+
+def compare_latency(before, after):
+    print(f"{'query':<20} {'p50 before':>11} {'p50 after':>11} {'p99 before':>11} {'p99 after':>11}")
+    for name in before:
+        b, a = before[name], after[name]
+        print(f"{name:<20} {b.percentile(50):>9.0f}us {a.percentile(50):>9.0f}us {b.percentile(99):>9.0f}us "
+              f"{a.percentile(99):>9.0f}us")
+
+
+def measure_on_scratch_copy(connection, database, suggestions):
+    scratch = f"{database}{SCRATCH_SUFFIX}"[:64]
+    with connection.cursor() as cursor:
+        copy_database(cursor, database, scratch)
+        connection.commit()
+        try:
+            cursor.execute(f"USE `{scratch}`")
+            before = measure_latency(cursor)
+            apply_suggestions(cursor, suggestions)
+            after = measure_latency(cursor)
+            compare_latency(before, after)
+        finally:
+            cursor.execute(f"USE `{database}`")
+            cursor.execute(f"DROP DATABASE IF EXISTS `{scratch}`")
+
+
+def advise_indexes(db, apply=False, measure=False):
+    # db: pymysql connection settings including the database. Returns the
+    # suggestions as {(table, columns): [query names]}.
+    connection = pymysql.connect(**db, cursorclass=pymysql.cursors.DictCursor, autocommit=True)
+    try:
+        with connection.cursor() as cursor:
+            plans = explain_queries(cursor)
+            suggestions = suggest_indexes(plans, existing_indexes(cursor, db['database']))
+        print_report(plans, suggestions)
+        if suggestions and measure:
+            measure_on_scratch_copy(connection, db['database'], suggestions)
+        if suggestions and apply:
+            with connection.cursor() as cursor:
+                apply_suggestions(cursor, suggestions)
+    finally:
+        connection.close()
+    return suggestions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="EXPLAIN-based index advisor for the accounts database")
+    parser.add_argument('--properties', default=DEFAULT_PROPERTIES_FILE,
+                        help="application.properties with the jdbc.* settings (used unless --host is given)")
+    parser.add_argument('--host', help="MySQL host, e.g. 127.0.0.1 for a local server")
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--database', default='accounts')
+    parser.add_argument('--measure', action='store_true',
+                        help="compare query latency before/after the suggestions on a scratch copy")
+    parser.add_argument('--apply', action='store_true', help="add the suggested indexes to the database")
+    args = parser.parse_args()
+
+    if args.host:
+        db = {'host': args.host, 'port': args.port, 'user': args.user, 'password': args.password,
+              'database': args.database, 'charset': 'utf8mb4'}
+    else:
+        db = db_settings_from_properties(read_properties(args.properties))
+    advise_indexes(db, args.apply, args.measure)
@@ -0,0 +1,243 @@
+import hashlib
+import struct
+import zipfile
+
+# Just enough of the Java object serialization format (java.io.ObjectOutputStream)
+# to write the model objects the app caches in memcached from Python.
+#
+# The app's classes do not declare a serialVersionUID, so the JVM derives one
+# from the compiled class (ObjectStreamClass.computeDefaultSUID). read_class()
+# parses the .class file - from target/classes or from inside the WAR - and
+# recomputes that value, so no JVM is needed to produce compatible objects.
+
+STREAM_MAGIC = 0xACED
+STREAM_VERSION = 5
+TC_NULL = 0x70
+TC_CLASSDESC = 0x72
+TC_OBJECT = 0x73
+TC_STRING = 0x74
+TC_ENDBLOCKDATA = 0x78
+TC_LONGSTRING = 0x7C
+SC_SERIALIZABLE = 0x02
+
+ACC_PUBLIC = 0x0001
+ACC_PRIVATE = 0x0002
+ACC_PROTECTED = 0x0004
+ACC_STATIC = 0x0008
+ACC_FINAL = 0x0010
+ACC_SYNCHRONIZED = 0x0020
+ACC_VOLATILE = 0x0040
+ACC_TRANSIENT = 0x0080
+ACC_NATIVE = 0x0100
+ACC_INTERFACE = 0x0200
+ACC_ABSTRACT = 0x0400
+ACC_STRICT = 0x0800
+CLASS_MODIFIERS = ACC_PUBLIC | ACC_FINAL | ACC_INTERFACE | ACC_ABSTRACT
+FIELD_MODIFIERS = ACC_PUBLIC | ACC_PRIVATE | ACC_PROTECTED | ACC_STATIC | ACC_FINAL | ACC_VOLATILE | ACC_TRANSIENT
+METHOD_MODIFIERS = (ACC_PUBLIC | ACC_PRIVATE | ACC_PROTECTED | ACC_STATIC | ACC_FINAL | ACC_SYNCHRONIZED
+                    | ACC_NATIVE | ACC_ABSTRACT | ACC_STRICT)
+
+# Constant pool tag -> size of the entry after the tag (Utf8 is variable)
+CONSTANT_SIZES = {3: 4, 4: 4, 5: 8, 6: 8, 7: 2, 8: 2, 9: 4, 10: 4, 11: 4, 12: 4, 15: 3, 16: 2, 17: 4, 18: 4,
+                  19: 2, 20: 2}
+
+JAVA_LANG_LONG_SUID = 4290774380558885855
+JAVA_LANG_NUMBER_SUID = -8742448824652078965
+
+
+def modified_utf8(value):
+    # Java's "modified UTF-8": NUL is two bytes and supplementary characters
+    # are written as two three-byte surrogates
+    data = bytearray()
+    units = value.encode('utf-16-be', 'surrogatepass')
+    for index in range(0, len(units), 2):
+        unit = (units[index] << 8) | units[index + 1]
+        if 0 < unit < 0x80:
+            data.append(unit)
+        elif unit < 0x800:
+            data += bytes([0xC0 | (unit >> 6), 0x80 | (unit & 0x3F)])
+        else:
+            data += bytes([0xE0 | (unit >> 12), 0x80 | ((unit >> 6) & 0x3F), 0x80 | (unit & 0x3F)])
+    return bytes(data)
+
+
+def write_utf(value):
+    data = modified_utf8(value)
+    return struct.pack('>H', len(data)) + data
+
+
+def load_class_bytes(path, class_name):
+    # path is either the .class file itself or a WAR/JAR containing it
+    if zipfile.is_zipfile(path):
+        entry = class_name.replace('.', '/') + '.class'
+        with zipfile.ZipFile(path) as archive:
+            for prefix in ('WEB-INF/classes/', ''):
+                if prefix + entry in archive.namelist():
+                    return archive.read(prefix + entry)
+        raise FileNotFoundError(f"{entry} not found in {path}")
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def parse_class(data):
+    # Returns the parts of a class file that serialization depends on
+    if data[:4] != b'\xca\xfe\xba\xbe':
+        raise ValueError("not a Java class file")
+    offset = 10
+    pool_count = struct.unpack_from('>H', data, 8)[0]
+    pool = {}
+    index = 1
+    while index < pool_count:
+        tag = data[offset]
+        if tag == 1:
+            length = struct.unpack_from('>H', data, offset + 1)[0]
+            raw = data[offset + 3:offset + 3 + length].replace(b'\xc0\x80', b'\x00')
+            pool[index] = raw.decode('utf-8', errors='surrogatepass')
+            offset += 3 + length
+        else:
+            if tag == 7:
+                pool[index] = ('class', struct.unpack_from('>H', data, offset + 1)[0])
+            offset += 1 + CONSTANT_SIZES[tag]
+        index += 2 if tag in (5, 6) else 1
+
+    def class_name(pool_index):
+        return pool[pool[pool_index][1]].replace('/', '.')
+
+    access_flags, this_class, super_class, interface_count = struct.unpack_from('>HHHH', data, offset)
+    offset += 8
+    interfaces = [class_name(struct.unpack_from('>H', data, offset + 2 * i)[0]) for i in range(interface_count)]
+    offset += 2 * interface_count
+
+    def read_members():
+        nonlocal offset
+        count = struct.unpack_from('>H', data, offset)[0]
+        offset += 2
+        members = []
+        for _ in range(count):
+            flags, name_index, descriptor_index, attribute_count = struct.unpack_from('>HHHH', data, offset)
+            offset += 8
+            for _ in range(attribute_count):
+                offset += 6 + struct.unpack_from('>I', data, offset + 2)[0]
+            members.append({'name': pool[name_index], 'descriptor': pool[descriptor_index], 'flags': flags})
+        return members
+
+    fields = read_members()
+    methods = read_members()
+    return {
+        'name': class_name(this_class),
+        'super': class_name(super_class) if super_class else None,
+        'flags': access_flags,
+        'interfaces': interfaces,
+        'fields': fields,
+        'methods': methods
+    }
+
+
+def default_serial_version_uid(parsed):
+    # Port of java.io.ObjectStreamClass.computeDefaultSUID
+    out = bytearray(write_utf(parsed['name']))
+    class_mods = parsed['flags'] & CLASS_MODIFIERS
+    methods = [m for m in parsed['methods'] if m['name'] not in ('<init>', '<clinit>')]
+    if class_mods & ACC_INTERFACE:
+        class_mods = class_mods | ACC_ABSTRACT if methods else class_mods & ~ACC_ABSTRACT
+    out += struct.pack('>i', class_mods)
+    for interface in sorted(parsed['interfaces']):
+        out += write_utf(interface)
+
+    for field in sorted(parsed['fields'], key=lambda f: f['name']):
+        mods = field['flags'] & FIELD_MODIFIERS
+        if not mods & ACC_PRIVATE or not mods & (ACC_STATIC | ACC_TRANSIENT):
+            out += write_utf(field['name']) + struct.pack('>i', mods) + write_utf(field['descriptor'])
+
+    if any(m['name'] == '<clinit>' for m in parsed['methods']):
+        out += write_utf('<clinit>') + struct.pack('>i', ACC_STATIC) + write_utf('()V')
+
+    constructors = [m for m in parsed['methods'] if m['name'] == '<init>']
+    for constructor in sorted(constructors, key=lambda m: m['descriptor']):
+        mods = constructor['flags'] & METHOD_MODIFIERS
+        if not mods & ACC_PRIVATE:
+            out += write_utf('<init>') + struct.pack('>i', mods) + write_utf(constructor['descriptor'].replace('/', '.'))
+
+    for method in sorted(methods, key=lambda m: (m['name'], m['descriptor'])):
+        mods = method['flags'] & METHOD_MODIFIERS
+        if not mods & ACC_PRIVATE:
+            out += write_utf(method['name']) + struct.pack('>i', mods) + write_utf(method['descriptor'].replace('/', '.'))
+
+    digest = hashlib.sha1(bytes(out)).digest()
+    return struct.unpack('<q', digest[:8])[0]
+
+
+def read_class(path, class_name, serial_version_uid=None):
+    # Returns the class descriptor used by JavaObjectWriter: name, SUID and the
+    # serializable fields ordered as ObjectStreamClass orders them
+    parsed = parse_class(load_class_bytes(path, class_name))
+    if parsed['name'] != class_name:
+        raise ValueError(f"{path} contains {parsed['name']}, expected {class_name}")
+    if serial_version_uid is None:
+        if any(f['name'] == 'serialVersionUID' for f in parsed['fields']):
+            raise ValueError(f"{class_name} declares serialVersionUID; pass its value explicitly")
+        serial_version_uid = default_serial_version_uid(parsed)
+    fields = [(f['name'], f['descriptor']) for f in parsed['fields']
+              if not f['flags'] & (ACC_STATIC | ACC_TRANSIENT)]
+    # Primitive fields first, then object fields, each sorted by name
+    fields.sort(key=lambda field: (field[1][0] in 'L[', field[0]))
+    return {'name': class_name, 'serial_version_uid': serial_version_uid, 'fields': fields}
+
+
+class JavaObjectWriter:
+    # Writes one serialized object graph. Supports objects whose fields are
+    # String, java.lang.Long or null, which covers the cached model objects.
+
+    def __init__(self):
+        self.out = bytearray(struct.pack('>HH', STREAM_MAGIC, STREAM_VERSION))
+
+    def _class_desc(self, name, serial_version_uid, fields, super_desc=None):
+        self.out += struct.pack('>B', TC_CLASSDESC) + write_utf(name)
+        self.out += struct.pack('>qBH', serial_version_uid, SC_SERIALIZABLE, len(fields))
+        for field_name, descriptor in fields:
+            self.out += descriptor[0].encode() + write_utf(field_name)
+            if descriptor[0] in 'L[':
+                self.write_string(descriptor)
+        self.out += struct.pack('>B', TC_ENDBLOCKDATA)
+        if super_desc:
+            self._class_desc(*super_desc)
+        else:
+            self.out += struct.pack('>B', TC_NULL)
+
+    def write_string(self, value):
+        data = modified_utf8(value)
+        if len(data) > 0xFFFF:
+            self.out += struct.pack('>BQ', TC_LONGSTRING, len(data)) + data
+        else:
+            self.out += struct.pack('>BH', TC_STRING, len(data)) + data
+
+    def write_long_object(self, value):
+        self.out += struct.pack('>B', TC_OBJECT)
+        self._class_desc('java.lang.Long', JAVA_LANG_LONG_SUID, [('value', 'J')],
+                         ('java.lang.Number', JAVA_LANG_NUMBER_SUID, []))
+        self.out += struct.pack('>q', value)
+
+    def write_value(self, value, descriptor):
+        if value is None:
+            self.out += struct.pack('>B', TC_NULL)
+        elif descriptor == 'Ljava/lang/String;':
+            self.write_string(str(value))
+        elif descriptor == 'Ljava/lang/Long;':
+            self.write_long_object(int(value))
+        else:
+            raise TypeError(f"Cannot serialize {type(value).__name__} as {descriptor}")
+
+    def write_object(self, class_desc, values):
+        # values maps field names to Python values; missing fields are null
+        self.out += struct.pack('>B', TC_OBJECT)
+        self._class_desc(class_desc['name'], class_desc['serial_version_uid'], class_desc['fields'])
+        for field_name, descriptor in class_desc['fields']:
+            self.write_value(values.get(field_name), descriptor)
+        return self
+
+    def getvalue(self):
+        return bytes(self.out)
+
+
+def serialize_object(class_desc, values):
+    return JavaObjectWriter().write_object(class_desc, values).getvalue()
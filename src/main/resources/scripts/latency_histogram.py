@@ -0,0 +1,50 @@
+import math
+
+# Log-bucketed latency histogram shared by the load benchmarks. Buckets grow by
+# HISTOGRAM_BASE, so memory stays bounded however many samples are recorded and
+# percentiles are accurate to within one bucket (10%).
+
+HISTOGRAM_BASE = 1.1
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, latency_us):
+        bucket = int(math.log(max(latency_us, 1.0), HISTOGRAM_BASE))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += latency_us
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, percent):
+        threshold = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return HISTOGRAM_BASE ** (bucket + 1)
+        return 0.0
+
+    def summary(self):
+        if not self.count:
+            return "no samples"
+        return (f"avg {self.total / self.count:8.1f} us  p50 {self.percentile(50):8.1f} us  "
+                f"p90 {self.percentile(90):8.1f} us  p99 {self.percentile(99):8.1f} us  "
+                f"p99.9 {self.percentile(99.9):8.1f} us")
+
+    def print_histogram(self, width=50):
+        peak = max(self.buckets.values())
+        for bucket in sorted(self.buckets):
+            count = self.buckets[bucket]
+            bar = '#' * max(1, int(width * count / peak))
+            print(f"  <= {HISTOGRAM_BASE ** (bucket + 1):10.1f} us {count:10d} {bar}")
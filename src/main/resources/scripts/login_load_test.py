@@ -0,0 +1,285 @@
+import argparse
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pymysql
+
+from latency_histogram import LatencyHistogram
+from properties_file import db_settings_from_properties, read_properties
+
+# Load harness for the login path of the accounts database. Replays the
+# statements Hibernate issues for the app against MySQL/RDS:
+#   login    - UserDetailsServiceImpl.loadUserByUsername: the user lookup by
+#              username, then the user_role/role join for the authorities
+#   register - UserValidator's username check, RoleRepository.findAll, the
+#              user insert and one user_role row per role, in one transaction
+#
+# Concurrency is ramped in stages (--ramp 4 8 16 32), each running for
+# --stage-duration seconds over a shared connection pool, and every stage
+# reports throughput and p50/p99 per operation plus the time spent waiting for
+# a pooled connection. Save a run with --output and compare a later one (new
+# instance class, changed parameters) with --baseline.
+#
+# Runs against a local MySQL loaded with db_backup.sql:
+#   python login_load_test.py --host 127.0.0.1 --user root --password ''
+#
+# Registered users are named loadtest-<run>-<n> and are deleted at the end
+# unless --keep is given.
+
+DEFAULT_PROPERTIES_FILE = 'src/main/resources/application.properties'
+USER_COLUMNS = ['id', 'username', 'userEmail', 'profileImg', 'profileImgPath', 'dateOfBirth', 'fatherName',
+                'motherName', 'gender', 'maritalStatus', 'permanentAddress', 'tempAddress', 'primaryOccupation',
+                'secondaryOccupation', 'skills', 'phoneNumber', 'secondaryPhoneNumber', 'nationality', 'language',
+                'workingExperience', 'password']
+FIND_BY_USERNAME = f"SELECT {', '.join(USER_COLUMNS)} FROM user WHERE username = %s"
+ROLES_OF_USER = "SELECT r.id, r.name FROM user_role ur INNER JOIN role r ON r.id = ur.role_id WHERE ur.user_id = %s"
+FIND_ALL_ROLES = "SELECT id, name FROM role"
+INSERT_USER = "INSERT INTO user (username, userEmail, password) VALUES (%s, %s, %s)"
+INSERT_USER_ROLE = "INSERT INTO user_role (user_id, role_id) VALUES (%s, %s)"
+# Registration stores a BCrypt hash; hashing is application CPU, not database
+# load, so a fixed cost-11 hash of the right length is inserted
+PASSWORD_HASH = '$2a$11$UgG9TkHcgl02LxlqxRHYhOf7Xv4CxFmFEgS0FpUdk42OeslI.6JAR'
+OPERATIONS = ('login', 'register')
+
+
+class ConnectionPool:
+    # Fixed-size pool of pymysql connections shared by the worker threads.
+    # Connections are opened up front so the stages measure queries, not
+    # connection setup.
+
+    def __init__(self, db, size):
+        self.db = db
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(self._connect())
+
+    def _connect(self):
+        return pymysql.connect(**self.db, autocommit=False)
+
+    @contextmanager
+    def connection(self):
+        connection = self.connections.get()
+        try:
+            yield connection
+        except pymysql.err.MySQLError:
+            # Roll back the failed transaction; a broken connection is replaced
+            # so the pool keeps its size
+            try:
+                connection.rollback()
+            except pymysql.err.MySQLError:
+                connection.close()
+                connection = self._connect()
+            raise
+        finally:
+            self.connections.put(connection)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+def login(cursor, username):
+    cursor.execute(FIND_BY_USERNAME, (username,))
+    user = cursor.fetchone()
+    if user:
+        cursor.execute(ROLES_OF_USER, (user[0],))
+        cursor.fetchall()
+    return user is not None
+
+
+def register(cursor, username):
+    cursor.execute(FIND_BY_USERNAME, (username,))
+    if cursor.fetchone():
+        return False
+    cursor.execute(FIND_ALL_ROLES)
+    roles = cursor.fetchall()
+    cursor.execute(INSERT_USER, (username, f"{username}@loadtest.invalid", PASSWORD_HASH))
+    user_id = cursor.lastrowid
+    cursor.executemany(INSERT_USER_ROLE, [(user_id, role_id) for role_id, _ in roles])
+    return True
+
+
+class StageResult:
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.latency = {operation: LatencyHistogram() for operation in OPERATIONS}
+        self.pool_wait = LatencyHistogram()
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def merge(self, latency, pool_wait, errors):
+        with self.lock:
+            for operation, histogram in latency.items():
+                self.latency[operation].merge(histogram)
+            self.pool_wait.merge(pool_wait)
+            self.errors += errors
+
+    def throughput(self, operation=None):
+        operations = [operation] if operation else OPERATIONS
+        return sum(self.latency[name].count for name in operations) / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'concurrency': self.concurrency,
+            'elapsed': self.elapsed,
+            'throughput': self.throughput(),
+            'errors': self.errors,
+            'operations': {name: {'count': histogram.count, 'throughput': self.throughput(name),
+                                  'p50': histogram.percentile(50), 'p99': histogram.percentile(99)}
+                           for name, histogram in self.latency.items()}
+        }
+
+
+def worker(pool, usernames, args, result, deadline, new_username):
+    rng = random.Random()
+    latency = {operation: LatencyHistogram() for operation in OPERATIONS}
+    pool_wait = LatencyHistogram()
+    errors = 0
+    while time.time() < deadline:
+        if rng.random() < args.register_ratio:
+            operation, username = 'register', new_username()
+        elif rng.random() < args.miss_ratio:
+            operation, username = 'login', f"unknown-{uuid.uuid4().hex[:12]}"
+        else:
+            operation, username = 'login', rng.choice(usernames)
+        requested = time.perf_counter()
+        try:
+            with pool.connection() as connection:
+                start = time.perf_counter()
+                pool_wait.record((start - requested) * 1e6)
+                with connection.cursor() as cursor:
+                    if operation == 'login':
+                        login(cursor, username)
+                    else:
+                        register(cursor, username)
+                connection.commit()
+                latency[operation].record((time.perf_counter() - start) * 1e6)
+        except pymysql.err.MySQLError as e:
+            errors += 1
+            if errors <= 3:
+                print(f"{operation} failed: {e}")
+            continue
+        if args.think_time:
+            time.sleep(rng.expovariate(1 / args.think_time))
+    result.merge(latency, pool_wait, errors)
+
+
+def load_usernames(pool, limit=100000):
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT username FROM user WHERE username IS NOT NULL "
+                           "AND username NOT LIKE 'loadtest-%%' LIMIT %s", (limit,))
+            usernames = [row[0] for row in cursor.fetchall()]
+        connection.commit()
+    if not usernames:
+        raise Exception("The user table is empty; load db_backup.sql before running the load test")
+    return usernames
+
+
+def delete_registered_users(pool, prefix):
+    # user_role rows go with the users (ON DELETE CASCADE)
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            deleted = cursor.execute("DELETE FROM user WHERE username LIKE %s", (f"{prefix}%",))
+        connection.commit()
+    print(f"Deleted {deleted} registered load test users.")
+
+
+def run_load_test(db, args):
+    # Returns one StageResult per concurrency level of the ramp
+    pool = ConnectionPool(db, args.pool_size or max(args.ramp))
+    prefix = f"loadtest-{uuid.uuid4().hex[:8]}-"
+    counter = iter(range(1, 1 << 62))
+    counter_lock = threading.Lock()
+
+    def new_username():
+        with counter_lock:
+            return f"{prefix}{next(counter)}"
+
+    results = []
+    try:
+        usernames = load_usernames(pool)
+        print(f"Loaded {len(usernames)} usernames; pool of {pool.connections.qsize()} connections")
+        for concurrency in args.ramp:
+            result = StageResult(concurrency)
+            deadline = time.time() + args.stage_duration
+            threads = [threading.Thread(target=worker, args=(pool, usernames, args, result, deadline, new_username))
+                       for _ in range(concurrency)]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            result.elapsed = time.time() - start
+            print_stage(result)
+            results.append(result)
+    finally:
+        if not args.keep:
+            delete_registered_users(pool, prefix)
+        pool.close()
+    return results
+
+
+def print_stage(result):
+    login_latency, register_latency = result.latency['login'], result.latency['register']
+    print(f"{result.concurrency:>5} threads: {result.throughput():>9,.0f} ops/s | "
+          f"login {result.throughput('login'):>8,.0f}/s p50 {login_latency.percentile(50):>8.0f} us "
+          f"p99 {login_latency.percentile(99):>8.0f} us | register {result.throughput('register'):>6,.0f}/s "
+          f"p50 {register_latency.percentile(50):>8.0f} us p99 {register_latency.percentile(99):>8.0f} us | "
+          f"pool wait p99 {result.pool_wait.percentile(99):>7.0f} us | errors {result.errors}")
+
+
+def compare_with_baseline(results, baseline):
+    # baseline: stage dicts saved by --output from an earlier run
+    previous = {stage['concurrency']: stage for stage in baseline}
+    print(f"{'threads':>7} {'ops/s before':>13} {'ops/s after':>12} {'login p99 before':>17} {'login p99 after':>16}")
+    for result in results:
+        before = previous.get(result.concurrency)
+        if not before:
+            continue
+        print(f"{result.concurrency:>7} {before['throughput']:>13,.0f} {result.throughput():>12,.0f} "
+              f"{before['operations']['login']['p99']:>14.0f} us "
+              f"{result.latency['login'].percentile(99):>13.0f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Login and registration load test for the accounts database")
+    parser.add_argument('--properties', default=DEFAULT_PROPERTIES_FILE,
+                        help="application.properties with the jdbc.* settings (used unless --host is given)")
+    parser.add_argument('--host', help="MySQL host, e.g. 127.0.0.1 for a local server")
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--database', default='accounts')
+    parser.add_argument('--ramp', type=int, nargs='+', default=[4, 8, 16, 32], help="concurrency of each stage")
+    parser.add_argument('--stage-duration', type=int, default=30, help="seconds per stage")
+    parser.add_argument('--pool-size', type=int, help="pooled connections (default: the highest concurrency)")
+    parser.add_argument('--register-ratio', type=float, default=0.05, help="share of operations that register")
+    parser.add_argument('--miss-ratio', type=float, default=0.0, help="share of logins with an unknown username")
+    parser.add_argument('--think-time', type=float, default=0.0, help="mean pause between operations in seconds")
+    parser.add_argument('--output', help="save the stage results as JSON")
+    parser.add_argument('--baseline', help="JSON from an earlier --output run to compare against")
+    parser.add_argument('--keep', action='store_true', help="keep the registered users")
+    args = parser.parse_args()
+
+    if args.host:
+        db = {'host': args.host, 'port': args.port, 'user': args.user, 'password': args.password,
+              'database': args.database, 'charset': 'utf8mb4'}
+    else:
+        db = db_settings_from_properties(read_properties(args.properties))
+
+    results = run_load_test(db, args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump([result.to_dict() for result in results], file, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare_with_baseline(results, json.load(file))
@@ -0,0 +1,215 @@
+import argparse
+import itertools
+import math
+import os
+import random
+import threading
+import time
+
+from latency_histogram import LatencyHistogram
+from memcached_client import MemcachedClient
+
+# Load generator and capacity planner for the memcached tier created by
+# create_elasticache.py.
+#
+#   bench - runs a multithreaded get/set load with a zipfian or uniform key
+#           distribution against an endpoint and reports throughput and a
+#           latency histogram. Works against a local memcached.
+#   plan  - recommends node_type and num_cache_nodes for create_elasticache.py
+#           from the working-set size and target ops/s, optionally using the
+#           ops/s per vCPU measured with bench.
+
+# Usable memory (GiB) and vCPUs of the memcached node types; burstable t3
+# nodes only sustain a fraction of their vCPU capacity.
+NODE_TYPES = {
+    'cache.t3.micro': {'memory_gib': 0.5, 'vcpus': 2, 'burstable': True},
+    'cache.t3.small': {'memory_gib': 1.37, 'vcpus': 2, 'burstable': True},
+    'cache.t3.medium': {'memory_gib': 3.09, 'vcpus': 2, 'burstable': True},
+    'cache.m5.large': {'memory_gib': 6.38, 'vcpus': 2, 'burstable': False},
+    'cache.m5.xlarge': {'memory_gib': 12.93, 'vcpus': 4, 'burstable': False},
+    'cache.m5.2xlarge': {'memory_gib': 26.04, 'vcpus': 8, 'burstable': False},
+    'cache.m5.4xlarge': {'memory_gib': 52.26, 'vcpus': 16, 'burstable': False},
+    'cache.r5.large': {'memory_gib': 13.07, 'vcpus': 2, 'burstable': False},
+    'cache.r5.xlarge': {'memory_gib': 26.32, 'vcpus': 4, 'burstable': False},
+    'cache.r5.2xlarge': {'memory_gib': 52.82, 'vcpus': 8, 'burstable': False},
+    'cache.r5.4xlarge': {'memory_gib': 105.81, 'vcpus': 16, 'burstable': False}
+}
+DEFAULT_OPS_PER_VCPU = 50000  # conservative for small values; measure with bench
+BURSTABLE_FACTOR = 0.2
+ITEM_OVERHEAD_BYTES = 56  # memcached item header
+MEMORY_HEADROOM = 0.8  # slab fragmentation and connection buffers
+MAX_NODES = 40
+
+
+def zipf_cum_weights(key_count, exponent):
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, key_count + 1)))
+
+
+def key_name(prefix, index):
+    return f"{prefix}{index}"
+
+
+def value_for(size):
+    return os.urandom(size // 2 + 1).hex()[:size].encode()
+
+
+def preload(host, port, args):
+    with MemcachedClient(host, port) as client:
+        batch = []
+        for index in range(args.keys):
+            batch.append((key_name(args.key_prefix, index), value_for(random.randint(args.min_value, args.max_value))))
+            if len(batch) == 500:
+                client.set_many(batch)
+                batch = []
+        if batch:
+            client.set_many(batch)
+    print(f"Preloaded {args.keys} keys.")
+
+
+def worker(host, port, args, cum_weights, deadline, results, lock):
+    get_histogram, set_histogram = LatencyHistogram(), LatencyHistogram()
+    hits = misses = 0
+    values = [value_for(size) for size in (args.min_value, (args.min_value + args.max_value) // 2, args.max_value)]
+    rng = random.Random()
+    population = range(args.keys)
+    with MemcachedClient(host, port) as client:
+        while time.time() < deadline:
+            indexes = rng.choices(population, cum_weights=cum_weights, k=1000)
+            for index in indexes:
+                key = key_name(args.key_prefix, index)
+                start = time.perf_counter()
+                if rng.random() < args.get_ratio:
+                    if client.get(key) is None:
+                        misses += 1
+                    else:
+                        hits += 1
+                    get_histogram.record((time.perf_counter() - start) * 1e6)
+                else:
+                    value = values[rng.randrange(len(values))]
+                    if args.min_value != args.max_value:
+                        value = value[:rng.randint(args.min_value, args.max_value)]
+                    client.set(key, value, expire=args.expire)
+                    set_histogram.record((time.perf_counter() - start) * 1e6)
+    with lock:
+        results['get'].merge(get_histogram)
+        results['set'].merge(set_histogram)
+        results['hits'] += hits
+        results['misses'] += misses
+
+
+def run_benchmark(args):
+    host, port = args.endpoint.rsplit(':', 1) if ':' in args.endpoint else (args.endpoint, 11211)
+    port = int(port)
+    if args.preload:
+        preload(host, port, args)
+
+    cum_weights = zipf_cum_weights(args.keys, args.zipf) if args.distribution == 'zipf' else None
+    results = {'get': LatencyHistogram(), 'set': LatencyHistogram(), 'hits': 0, 'misses': 0}
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+    threads = [threading.Thread(target=worker, args=(host, port, args, cum_weights, deadline, results, lock))
+               for _ in range(args.threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    total = results['get'].count + results['set'].count
+    ops_per_second = total / elapsed
+    lookups = results['hits'] + results['misses']
+    print(f"Endpoint {host}:{port}, {args.threads} threads, {args.duration}s, {args.keys} keys "
+          f"({args.distribution}), values {args.min_value}-{args.max_value} bytes, get ratio {args.get_ratio}")
+    print(f"Throughput: {ops_per_second:,.0f} ops/s ({total:,} ops)")
+    if lookups:
+        print(f"Hit ratio: {results['hits'] / lookups:.1%}")
+    for operation in ('get', 'set'):
+        histogram = results[operation]
+        print(f"{operation.upper()} {histogram.count:>10,} ops  {histogram.summary()}")
+    combined = LatencyHistogram()
+    combined.merge(results['get'])
+    combined.merge(results['set'])
+    if combined.count:
+        print("Latency histogram (all operations):")
+        combined.print_histogram()
+    return ops_per_second
+
+
+def plan_capacity(working_set_bytes, target_ops, ops_per_vcpu=DEFAULT_OPS_PER_VCPU, min_nodes=1,
+                  node_types=NODE_TYPES):
+    # Returns candidate (node_type, node_count, details) tuples sorted by
+    # provisioned memory, which tracks ElastiCache cost closely
+    candidates = []
+    for node_type, spec in node_types.items():
+        usable_bytes = spec['memory_gib'] * MEMORY_HEADROOM * 1024 ** 3
+        node_ops = spec['vcpus'] * ops_per_vcpu * (BURSTABLE_FACTOR if spec['burstable'] else 1)
+        nodes_for_memory = math.ceil(working_set_bytes / usable_bytes)
+        nodes_for_ops = math.ceil(target_ops / node_ops)
+        node_count = max(nodes_for_memory, nodes_for_ops, min_nodes)
+        if node_count > MAX_NODES:
+            continue
+        candidates.append((node_type, node_count, {
+            'nodes_for_memory': nodes_for_memory,
+            'nodes_for_ops': nodes_for_ops,
+            'provisioned_memory_gib': round(spec['memory_gib'] * node_count, 2),
+            'capacity_ops': int(node_ops * node_count)
+        }))
+    return sorted(candidates, key=lambda candidate: (candidate[2]['provisioned_memory_gib'], candidate[1]))
+
+
+def run_planner(args):
+    item_bytes = args.avg_key + args.avg_value + ITEM_OVERHEAD_BYTES
+    working_set = args.working_set_bytes or args.items * item_bytes
+    print(f"Working set: {working_set / 1024 ** 3:.2f} GiB, target {args.target_ops:,} ops/s, "
+          f"{args.ops_per_vcpu:,} ops/s per vCPU, at least {args.min_nodes} node(s)")
+    candidates = plan_capacity(working_set, args.target_ops, args.ops_per_vcpu, args.min_nodes)
+    if not candidates:
+        print(f"No node type fits within {MAX_NODES} nodes.")
+        return None
+    print(f"{'node_type':<18} {'nodes':>5} {'memory':>10} {'capacity ops/s':>15}  limited by")
+    for node_type, node_count, details in candidates[:args.top]:
+        limit = 'memory' if details['nodes_for_memory'] >= details['nodes_for_ops'] else 'throughput'
+        if node_count == args.min_nodes and max(details['nodes_for_memory'], details['nodes_for_ops']) < node_count:
+            limit = 'min nodes'
+        print(f"{node_type:<18} {node_count:>5} {details['provisioned_memory_gib']:>7.2f} GiB "
+              f"{details['capacity_ops']:>15,}  {limit}")
+    node_type, node_count, _ = candidates[0]
+    print(f"Recommendation for create_elasticache.py: node_type = '{node_type}', num_cache_nodes = {node_count}")
+    return candidates[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Memcached load benchmark and capacity planner")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bench = subparsers.add_parser('bench', help="run a load test against a memcached endpoint")
+    bench.add_argument('--endpoint', default='127.0.0.1:11211', help="host[:port]")
+    bench.add_argument('--threads', type=int, default=8)
+    bench.add_argument('--duration', type=int, default=30, help="seconds")
+    bench.add_argument('--keys', type=int, default=100000, help="size of the key space")
+    bench.add_argument('--key-prefix', default='bench:')
+    bench.add_argument('--distribution', choices=['zipf', 'uniform'], default='zipf')
+    bench.add_argument('--zipf', type=float, default=0.99, help="zipf exponent")
+    bench.add_argument('--min-value', type=int, default=100, help="bytes")
+    bench.add_argument('--max-value', type=int, default=1000, help="bytes")
+    bench.add_argument('--get-ratio', type=float, default=0.9, help="fraction of operations that are gets")
+    bench.add_argument('--expire', type=int, default=900, help="TTL of written keys in seconds")
+    bench.add_argument('--preload', action='store_true', help="write every key once before the run")
+
+    plan = subparsers.add_parser('plan', help="recommend node type and count")
+    plan.add_argument('--items', type=int, default=0, help="number of cached items")
+    plan.add_argument('--avg-key', type=int, default=16, help="average key size in bytes")
+    plan.add_argument('--avg-value', type=int, default=1024, help="average value size in bytes")
+    plan.add_argument('--working-set-bytes', type=int, default=0, help="overrides --items/--avg-*")
+    plan.add_argument('--target-ops', type=int, required=True, help="target operations per second")
+    plan.add_argument('--ops-per-vcpu', type=int, default=DEFAULT_OPS_PER_VCPU,
+                      help="measured ops/s per vCPU (bench throughput / node vCPUs)")
+    plan.add_argument('--min-nodes', type=int, default=2, help="minimum nodes for availability")
+    plan.add_argument('--top', type=int, default=5, help="number of candidates to show")
+
+    args = parser.parse_args()
+    if args.command == 'bench':
+        run_benchmark(args)
+    else:
+        run_planner(args)
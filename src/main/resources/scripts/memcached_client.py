@@ -0,0 +1,100 @@
+import socket
+
+# Minimal memcached text protocol client used by the benchmark and cache
+# warm-up tools. One instance wraps one TCP connection and is not thread safe;
+# give every thread its own client.
+
+
+class MemcachedError(Exception):
+    pass
+
+
+class MemcachedClient:
+
+    def __init__(self, host, port=11211, timeout=5):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = b''
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_line(self):
+        while b'\r\n' not in self.buffer:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise MemcachedError(f"connection to {self.host}:{self.port} closed")
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\r\n', 1)
+        if line.startswith((b'ERROR', b'SERVER_ERROR', b'CLIENT_ERROR')):
+            raise MemcachedError(line.decode(errors='replace'))
+        return line
+
+    def _read_exact(self, size):
+        while len(self.buffer) < size:
+            chunk = self.sock.recv(max(65536, size - len(self.buffer)))
+            if not chunk:
+                raise MemcachedError(f"connection to {self.host}:{self.port} closed")
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    @staticmethod
+    def _set_command(key, value, expire, flags, noreply=False):
+        return (f"set {key} {flags} {expire} {len(value)}{' noreply' if noreply else ''}\r\n".encode()
+                + value + b'\r\n')
+
+    def set(self, key, value, expire=0, flags=0):
+        self.sock.sendall(self._set_command(key, value, expire, flags))
+        return self._read_line() == b'STORED'
+
+    def set_many(self, items, expire=0, flags=0):
+        # Pipelines all sets in one write and then reads every reply, so a
+        # batch costs a single round trip. Returns the number of stored items.
+        items = list(items)
+        self.sock.sendall(b''.join(self._set_command(key, value, expire, flags) for key, value in items))
+        return sum(1 for _ in items if self._read_line() == b'STORED')
+
+    def get_many(self, keys):
+        # Returns {key: (flags, value)} for the keys that were found
+        self.sock.sendall(f"get {' '.join(keys)}\r\n".encode())
+        found = {}
+        while True:
+            line = self._read_line()
+            if line == b'END':
+                return found
+            _, key, flags, size = line.split()[:4]
+            found[key.decode()] = (int(flags), self._read_exact(int(size) + 2)[:-2])
+
+    def get(self, key):
+        found = self.get_many([key])
+        return found[key][1] if key in found else None
+
+    def config_get(self, name):
+        # ElastiCache auto-discovery command ('config get cluster'); plain
+        # memcached answers ERROR, which is raised as MemcachedError
+        self.sock.sendall(f"config get {name}\r\n".encode())
+        line = self._read_line()
+        if line == b'END':
+            return None
+        data = self._read_exact(int(line.split()[3]) + 2)[:-2]
+        self._read_line()
+        return data
+
+    def stats(self):
+        self.sock.sendall(b'stats\r\n')
+        stats = {}
+        while True:
+            line = self._read_line()
+            if line == b'END':
+                return stats
+            _, name, value = line.decode().split(' ', 2)
+            stats[name] = value
@@ -0,0 +1,549 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import boto3
+import pymysql
+
+from db_export import export_database, list_tables, load_manifest
+from secrets_cache import get_secret
+
+# Online migration of the accounts database from the vagrant MySQL/MariaDB
+# (vagrant/*/mysql.sh) to RDS, replacing a dump-and-reload with downtime:
+#
+#   copy      - records the source binlog position, then copies every table in
+#               parallel (db_export.py export + load through --workdir)
+#   replicate - tails the source binlog from the checkpoint and applies the row
+#               changes to the target, reporting rows/s and lag, until stopped
+#               or --until-caught-up
+#   cutover   - replicates until the lag is below --max-lag, makes the source
+#               read-only, drains the binlog up to its final position and
+#               compares row counts; writes are blocked only for the drain
+#   status    - checkpoint, source position and bytes behind
+#   selftest  - end-to-end run between two local servers on a scratch database
+#
+# The copy runs on several connections with their own snapshots, so tables
+# can be copied at slightly different points in time. That is fine here:
+# replication starts from the position taken before the copy and applies
+# changes idempotently (REPLACE for inserts and updates, DELETE by primary
+# key), so every row converges to its latest value. DDL is not replicated;
+# change the schema on both sides or before the copy.
+#
+# The source needs row-based binary logging, e.g. in /etc/my.cnf.d/server.cnf:
+#   [mysqld]
+#   server_id = 1
+#   log_bin = mysql-bin
+#   binlog_format = ROW
+#   binlog_row_image = FULL
+# and the user needs REPLICATION SLAVE, REPLICATION CLIENT and (for cutover)
+# SUPER. The binlog reader is the python-mysql-replication package
+# (pip install mysql-replication). binlog_row_metadata = FULL (MySQL 8.0.1+)
+# is not needed: without it the binlog carries no column names, and the rows
+# are mapped by position onto the target's columns, which the copy created
+# from the source's definitions. That also covers the vagrant MariaDB.
+#
+# Test with two local servers; the scratch database (migration_selftest) is
+# dropped and recreated on both, the source is made writable again at the end:
+#   python migrate_to_rds.py selftest --source-host 127.0.0.1 --source-port 3306 \
+#       --target-host 127.0.0.1 --target-port 3307
+
+try:
+    from pymysqlreplication import BinLogStreamReader
+    from pymysqlreplication.event import QueryEvent, XidEvent
+    from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
+except ImportError:
+    BinLogStreamReader = None
+
+DEFAULT_CHECKPOINT_FILE = 'migration-checkpoint.json'
+REPLICA_SERVER_ID = 4242  # must differ from the source's and any other replica's server_id
+REPORT_INTERVAL = 10
+POLL_INTERVAL = 1
+DRAIN_TIMEOUT = 120  # seconds the source may stay read-only during the cutover drain
+REQUIRED_SOURCE_SETTINGS = {'log_bin': 'ON', 'binlog_format': 'ROW', 'binlog_row_image': 'FULL'}
+UNKNOWN_COLUMN_PREFIX = 'UNKNOWN_COL'  # python-mysql-replication's key for a column without metadata
+SELFTEST_SCHEMA = [
+    "CREATE TABLE item (id INT PRIMARY KEY, name VARCHAR(64) NOT NULL, qty INT, updated DATETIME(6))",
+    "CREATE TABLE item_tag (item_id INT NOT NULL, tag VARCHAR(32) NOT NULL, weight DOUBLE, PRIMARY KEY (item_id, tag))"
+]
+SELFTEST_TAGS = ['red', 'green', 'blue']
+
+
+def rds_endpoint(db_instance_identifier, region):
+    rds = boto3.client('rds', region_name=region)
+    return rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0]['Endpoint'][
+        'Address']
+
+
+def check_source(source):
+    connection = pymysql.connect(**source)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW GLOBAL VARIABLES WHERE Variable_name IN ('log_bin', 'binlog_format', "
+                           "'binlog_row_image')")
+            settings = {name: value.upper() for name, value in cursor.fetchall()}
+    finally:
+        connection.close()
+    wrong = [f"{name} = {settings.get(name)} (needs {value})" for name, value in REQUIRED_SOURCE_SETTINGS.items()
+             if settings.get(name, value) != value]
+    if wrong:
+        raise Exception(f"The source binlog is not usable for the migration: {', '.join(wrong)}")
+
+
+def binlog_position(connection):
+    # Current (file, position) of the source binlog
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("SHOW MASTER STATUS")
+        except pymysql.err.ProgrammingError:
+            cursor.execute("SHOW BINARY LOG STATUS")  # MySQL 8.4 and later
+        row = cursor.fetchone()
+    if not row:
+        raise Exception("Binary logging is disabled on the source")
+    return row[0], row[1]
+
+
+def load_checkpoint(path):
+    with open(path) as file:
+        checkpoint = json.load(file)
+    return checkpoint['log_file'], checkpoint['log_pos']
+
+
+def save_checkpoint(path, position):
+    # Written to a temporary file and renamed, so a crash never leaves half a file
+    with open(f"{path}.tmp", 'w') as file:
+        json.dump({'log_file': position[0], 'log_pos': position[1], 'saved': time.time()}, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def bulk_copy(source, target, checkpoint_path, threads=4, workdir=None):
+    # Returns the binlog position replication has to start from
+    check_source(source)
+    connection = pymysql.connect(**source)
+    try:
+        position = binlog_position(connection)
+    finally:
+        connection.close()
+    save_checkpoint(checkpoint_path, position)
+    print(f"Source binlog position before the copy: {position[0]}:{position[1]}")
+    workdir = workdir or tempfile.mkdtemp(prefix='accounts-migration-')
+    start = time.time()
+    export_database(source, workdir, 'gzip', threads)
+    rows = load_manifest(workdir, target, threads)
+    print(f"Copied {rows:,} rows in {time.time() - start:.1f}s ({rows / (time.time() - start):,.0f} rows/s); "
+          f"replicate from {position[0]}:{position[1]}")
+    return position
+
+
+class ChangeApplier:
+    # Applies binlog row events to the target, one source transaction per
+    # target transaction
+
+    def __init__(self, target):
+        self.connection = pymysql.connect(**target)
+        with self.connection.cursor() as cursor:
+            # Rows copied at different times may not satisfy the foreign keys
+            # until replication catches up
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+            self.primary_keys = {table: key_columns for table, _, key_columns, _ in
+                                 list_tables(cursor, target['database'])}
+            cursor.execute("SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s "
+                           "ORDER BY TABLE_NAME, ORDINAL_POSITION", (target['database'],))
+            self.columns = {}
+            for table, column in cursor.fetchall():
+                self.columns.setdefault(table, []).append(column)
+        self.rows = 0
+        self.last_event_time = None
+        self.in_transaction = False
+
+    def named(self, table, values):
+        # Rows of a source without binlog_row_metadata = FULL come keyed
+        # UNKNOWN_COL0..n in column order
+        if not any(str(key).startswith(UNKNOWN_COLUMN_PREFIX) for key in values):
+            return values
+        columns = self.columns.get(table, [])
+        if len(columns) != len(values):
+            raise Exception(f"{table} has {len(columns)} columns on the target but {len(values)} in the binlog; "
+                            f"apply the schema change to the target first")
+        return dict(zip(columns, values.values()))
+
+    def key_condition(self, table, values):
+        columns = self.primary_keys.get(table) or list(values)
+        return ' AND '.join(f"`{column}` = %s" for column in columns), [values[column] for column in columns]
+
+    def replace(self, cursor, table, rows):
+        columns = list(rows[0])
+        cursor.executemany(f"REPLACE INTO `{table}` ({', '.join(f'`{column}`' for column in columns)}) "
+                           f"VALUES ({', '.join(['%s'] * len(columns))})",
+                           [[row[column] for column in columns] for row in rows])
+
+    def delete(self, cursor, table, row):
+        condition, parameters = self.key_condition(table, row)
+        cursor.execute(f"DELETE FROM `{table}` WHERE {condition}", parameters)
+
+    def apply(self, event):
+        # Returns True when the event ends a transaction. A statement event
+        # other than BEGIN (DDL, ANALYZE, GRANT, ...) is one on its own.
+        if isinstance(event, XidEvent):
+            self.connection.commit()
+            self.in_transaction = False
+            return True
+        if isinstance(event, QueryEvent):
+            query = event.query.strip().upper()
+            if query == 'BEGIN':
+                self.in_transaction = True
+                return False
+            if query != 'COMMIT':
+                print(f"Not replicated (statement event): {event.query.strip()[:200]}")
+            self.connection.commit()
+            self.in_transaction = False
+            return True
+        self.in_transaction = True
+        table = event.table
+        with self.connection.cursor() as cursor:
+            if isinstance(event, WriteRowsEvent):
+                self.replace(cursor, table, [self.named(table, row['values']) for row in event.rows])
+            elif isinstance(event, UpdateRowsEvent):
+                rows = [(self.named(table, row['before_values']), self.named(table, row['after_values']))
+                        for row in event.rows]
+                for before, after in rows:
+                    if self.key_condition(table, before)[1] != self.key_condition(table, after)[1]:
+                        self.delete(cursor, table, before)
+                self.replace(cursor, table, [after for _, after in rows])
+            elif isinstance(event, DeleteRowsEvent):
+                for row in event.rows:
+                    self.delete(cursor, table, self.named(table, row['values']))
+        self.rows += len(event.rows)
+        self.last_event_time = event.timestamp
+        return False
+
+    def abort(self):
+        # Drops the part of a transaction a stream ended in; it is read again
+        # from the checkpoint
+        self.connection.rollback()
+        self.in_transaction = False
+
+    def close(self):
+        self.connection.close()
+
+
+def bytes_behind(position, source_position):
+    # Only known while both are in the same binlog file
+    return source_position[1] - position[1] if position[0] == source_position[0] else None
+
+
+class ReplicationReport:
+
+    def __init__(self, applier):
+        self.applier = applier
+        self.start = time.time()
+        self.last_report = 0
+        self.last_rows = 0
+
+    def due(self):
+        return time.time() - self.last_report >= REPORT_INTERVAL
+
+    def report(self, position, source_position, force=False):
+        # Returns the lag in seconds: 0 once the checkpoint reaches the source
+        # position, else the age of the last applied change
+        now = time.time()
+        caught_up = position >= source_position
+        if caught_up or self.applier.last_event_time is None:
+            lag = 0 if caught_up else None
+        else:
+            lag = max(0, now - self.applier.last_event_time)
+        if force or self.due():
+            rate = (self.applier.rows - self.last_rows) / max(now - (self.last_report or self.start), 1e-6)
+            behind = bytes_behind(position, source_position)
+            print(f"Applied {self.applier.rows:,} rows ({rate:,.0f} rows/s), at {position[0]}:{position[1]}, "
+                  f"{'caught up' if caught_up else 'behind'} source {source_position[0]}:{source_position[1]}"
+                  f"{f' by {behind:,} bytes' if behind is not None and not caught_up else ''}, "
+                  f"lag {'unknown' if lag is None else f'{lag:.1f}s'}")
+            self.last_report = now
+            self.last_rows = self.applier.rows
+        return lag
+
+
+def replicate(source, target, checkpoint_path, until=None, max_lag=None, server_id=REPLICA_SERVER_ID, timeout=None):
+    # Applies changes from the checkpoint on. Returns the reached position once
+    # it is at or past `until`, or once the lag is at most max_lag; runs until
+    # interrupted when neither is given. Raises after `timeout` seconds.
+    if BinLogStreamReader is None:
+        raise Exception("Binlog replication needs the python-mysql-replication package "
+                        "(pip install mysql-replication)")
+    position = load_checkpoint(checkpoint_path)
+    applier = ChangeApplier(target)
+    report = ReplicationReport(applier)
+    status_connection = pymysql.connect(**source)
+    settings = {key: source[key] for key in ('host', 'port', 'user', 'password') if key in source}
+    deadline = time.time() + timeout if timeout is not None else None
+    try:
+        while True:
+            # Non-blocking streams end at the current end of the binlog; a new
+            # one is opened from the checkpoint on the next poll
+            stream = BinLogStreamReader(connection_settings=settings, server_id=server_id, resume_stream=True,
+                                        log_file=position[0], log_pos=position[1], blocking=False,
+                                        only_schemas=[source['database']],
+                                        only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, XidEvent,
+                                                     QueryEvent])
+            try:
+                for event in stream:
+                    if applier.apply(event):
+                        position = (stream.log_file, stream.log_pos)
+                        save_checkpoint(checkpoint_path, position)
+                    if report.due():
+                        report.report(position, binlog_position(status_connection))
+                # Outside a transaction the end of the stream is a safe point
+                # too; it is past events of other schemas and binlog rotations
+                if applier.in_transaction:
+                    applier.abort()
+                elif stream.log_file and (stream.log_file, stream.log_pos) > position:
+                    position = (stream.log_file, stream.log_pos)
+                    save_checkpoint(checkpoint_path, position)
+            finally:
+                stream.close()
+            source_position = binlog_position(status_connection)
+            lag = report.report(position, source_position, force=until is not None or max_lag is not None)
+            if until is not None and position >= until:
+                return position
+            if max_lag is not None and lag is not None and lag <= max_lag:
+                return position
+            if deadline is not None and time.time() > deadline:
+                goal = f"{until[0]}:{until[1]}" if until is not None else f"a lag of {max_lag}s"
+                raise Exception(f"Replication did not reach {goal} within {timeout}s; at {position[0]}:{position[1]}")
+            time.sleep(POLL_INTERVAL)
+    finally:
+        status_connection.close()
+        applier.close()
+
+
+def table_counts(db):
+    connection = pymysql.connect(**db)
+    try:
+        with connection.cursor() as cursor:
+            tables = [table for table, _, _, _ in list_tables(cursor, db['database'])]
+            counts = {}
+            for table in tables:
+                cursor.execute(f"SELECT COUNT(*) FROM `{table}`")
+                counts[table] = cursor.fetchone()[0]
+    finally:
+        connection.close()
+    return counts
+
+
+def set_read_only(connection, read_only):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SET GLOBAL read_only = {'ON' if read_only else 'OFF'}")
+    print(f"Source read_only = {'ON' if read_only else 'OFF'}")
+
+
+def cutover(source, target, checkpoint_path, max_lag=5, server_id=REPLICA_SERVER_ID, drain_timeout=DRAIN_TIMEOUT):
+    # Catches up with the source still writable, then blocks writes only for
+    # the last drain. The source stays read-only afterwards so nothing is
+    # written to the old database; it is made writable again if the drain
+    # takes longer than drain_timeout or the copies do not match.
+    print(f"Replicating until the lag is at most {max_lag}s")
+    replicate(source, target, checkpoint_path, max_lag=max_lag, server_id=server_id)
+    connection = pymysql.connect(**source)
+    try:
+        set_read_only(connection, True)
+        blocked = time.time()
+        try:
+            final_position = binlog_position(connection)
+            print(f"Draining up to the final source position {final_position[0]}:{final_position[1]}")
+            replicate(source, target, checkpoint_path, until=final_position, server_id=server_id,
+                      timeout=drain_timeout)
+            source_counts = table_counts(source)
+            target_counts = table_counts(target)
+            mismatched = {table: (count, target_counts.get(table)) for table, count in source_counts.items()
+                          if target_counts.get(table) != count}
+            if mismatched:
+                raise Exception(f"Row counts differ (source, target): {mismatched}")
+        except BaseException:
+            set_read_only(connection, False)
+            raise
+    finally:
+        connection.close()
+    print(f"Cutover complete: writes were blocked for {time.time() - blocked:.1f}s, row counts match "
+          f"({', '.join(f'{table} {count:,}' for table, count in source_counts.items())}).")
+    print("Point the application at RDS (update_application_properties.py) and restart it.")
+
+
+def reset_database(db, statements=None):
+    # Drops db['database'] and, unless statements is None, recreates it and
+    # runs them in it
+    connection = pymysql.connect(**{key: value for key, value in db.items() if key != 'database'})
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{db['database']}`")
+            if statements is not None:
+                cursor.execute(f"CREATE DATABASE `{db['database']}`")
+                cursor.execute(f"USE `{db['database']}`")
+                for statement in statements:
+                    cursor.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def write_changes(source, first_id, transactions, seed):
+    # Small transactions of inserts, updates (also of the primary key, and of
+    # several rows at once) and deletes, as the application would make them,
+    # followed by an ANALYZE TABLE and a binlog rotation
+    rng = random.Random(seed)
+    connection = pymysql.connect(**source)
+    next_id = first_id
+    try:
+        with connection.cursor() as cursor:
+            for _ in range(transactions):
+                for _ in range(5):
+                    cursor.execute("INSERT INTO item VALUES (%s, %s, %s, NOW(6))",
+                                   (next_id, f"item-{next_id}", rng.choice([None, rng.randrange(100)])))
+                    cursor.execute("INSERT INTO item_tag VALUES (%s, %s, %s)",
+                                   (next_id, rng.choice(SELFTEST_TAGS), rng.random()))
+                    next_id += 1
+                cursor.execute("UPDATE item SET qty = COALESCE(qty, 0) + 1, updated = NOW(6) WHERE id = %s",
+                               (rng.randrange(1, next_id),))
+                cursor.execute("UPDATE item_tag SET weight = %s WHERE item_id BETWEEN %s AND %s",
+                               (rng.random(), first_id, first_id + 20))
+                cursor.execute("UPDATE item SET id = %s WHERE id = %s", (next_id, rng.randrange(1, next_id)))
+                next_id += 1
+                cursor.execute("DELETE FROM item WHERE id = %s", (rng.randrange(1, next_id),))
+                cursor.execute("DELETE FROM item_tag WHERE item_id = %s AND tag = %s",
+                               (rng.randrange(1, next_id), rng.choice(SELFTEST_TAGS)))
+                connection.commit()
+            # The binlog then ends in a statement event and a rotation rather
+            # than a commit, which replication has to get past as well
+            cursor.execute("ANALYZE TABLE item")
+            cursor.fetchall()
+            cursor.execute("FLUSH LOGS")
+    finally:
+        connection.close()
+
+
+def table_contents(db):
+    connection = pymysql.connect(**db)
+    try:
+        with connection.cursor() as cursor:
+            contents = {}
+            for table, _, key_columns, _ in list_tables(cursor, db['database']):
+                cursor.execute(f"SELECT * FROM `{table}` ORDER BY {', '.join(f'`{key}`' for key in key_columns)}")
+                contents[table] = cursor.fetchall()
+    finally:
+        connection.close()
+    return contents
+
+
+def selftest(source, target, rows=1000, transactions=200, keep=False):
+    # Seeds a scratch database on the source, copies it while changes are
+    # being written, writes more, cuts over and compares every row
+    checkpoint_path = os.path.join(tempfile.mkdtemp(prefix='migration-selftest-'), DEFAULT_CHECKPOINT_FILE)
+    reset_database(source, SELFTEST_SCHEMA)
+    reset_database(target, [])
+    connection = pymysql.connect(**source)
+    try:
+        with connection.cursor() as cursor:
+            cursor.executemany("INSERT INTO item VALUES (%s, %s, %s, NOW(6))",
+                               [(index, f"item-{index}", index % 100) for index in range(1, rows + 1)])
+            cursor.executemany("INSERT INTO item_tag VALUES (%s, %s, %s)",
+                               [(index, tag, index / 7) for index in range(1, rows + 1) for tag in SELFTEST_TAGS])
+        connection.commit()
+
+        # Changes made during the copy are both in the copy and in the binlog
+        # after the checkpoint, so they exercise the idempotent apply
+        writer = threading.Thread(target=write_changes, args=(source, rows + 1, transactions, 1))
+        writer.start()
+        try:
+            bulk_copy(source, target, checkpoint_path, threads=2)
+        finally:
+            writer.join()
+        write_changes(source, rows + transactions * 7 + 1, transactions, 2)
+        cutover(source, target, checkpoint_path, max_lag=1)
+        set_read_only(connection, False)
+
+        source_contents = table_contents(source)
+        target_contents = table_contents(target)
+        different = [table for table in source_contents if source_contents[table] != target_contents.get(table)]
+        if different:
+            raise Exception(f"Self-test failed: the contents of {', '.join(different)} differ")
+        summary = ', '.join(f"{table} {len(content):,} rows" for table, content in source_contents.items())
+        print(f"Self-test passed: {summary} identical on both servers")
+    finally:
+        connection.close()
+    if not keep:
+        reset_database(source)
+        reset_database(target)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Online migration of the accounts database to RDS")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('copy', 'replicate', 'cutover', 'status', 'selftest'):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument('--source-host', required=True, help="the vagrant MySQL, e.g. 192.168.56.15")
+        subparser.add_argument('--source-port', type=int, default=3306)
+        subparser.add_argument('--source-user', default='root')
+        subparser.add_argument('--source-password', default='admin123')
+        subparser.add_argument('--target-host', help="target MySQL; defaults to the --target-instance endpoint")
+        subparser.add_argument('--target-port', type=int, default=3306)
+        subparser.add_argument('--target-user', default='root')
+        subparser.add_argument('--target-password', default='')
+        subparser.add_argument('--target-instance', default='dmanup-aws-codecomit-demo-rdsdb',
+                               help="RDS instance used when --target-host is not given")
+        subparser.add_argument('--target-secret', default='RDSDB_Credentials1',
+                               help="Secrets Manager secret with the RDS master credentials")
+        subparser.add_argument('--database', default='migration_selftest' if name == 'selftest' else 'accounts')
+        subparser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT_FILE)
+        subparser.add_argument('--server-id', type=int, default=REPLICA_SERVER_ID)
+        subparser.add_argument('--region', default='ap-south-1')
+        if name == 'copy':
+            subparser.add_argument('--threads', type=int, default=4)
+            subparser.add_argument('--workdir', help="directory for the export files (default: a temp directory)")
+        if name == 'replicate':
+            subparser.add_argument('--until-caught-up', action='store_true', help="stop once the lag is zero")
+        if name == 'cutover':
+            subparser.add_argument('--max-lag', type=float, default=5,
+                                   help="seconds of lag at which the source is made read-only")
+            subparser.add_argument('--drain-timeout', type=float, default=DRAIN_TIMEOUT,
+                                   help="seconds after which the drain gives up and the source is writable again")
+        if name == 'selftest':
+            subparser.add_argument('--rows', type=int, default=1000, help="items before the copy")
+            subparser.add_argument('--transactions', type=int, default=200, help="per batch of changes")
+            subparser.add_argument('--keep', action='store_true', help="keep the scratch databases")
+    args = parser.parse_args()
+    if args.command == 'selftest' and not args.target_host:
+        parser.error("selftest needs a local --target-host; it drops and recreates the scratch database")
+
+    source = {'host': args.source_host, 'port': args.source_port, 'user': args.source_user,
+              'password': args.source_password, 'database': args.database, 'charset': 'utf8mb4'}
+    if args.target_host:
+        target = {'host': args.target_host, 'port': args.target_port, 'user': args.target_user,
+                  'password': args.target_password, 'database': args.database, 'charset': 'utf8mb4'}
+    else:
+        credentials = get_secret(args.target_secret, args.region)
+        target = {'host': rds_endpoint(args.target_instance, args.region), 'port': 3306,
+                  'user': credentials['username'], 'password': credentials['password'], 'database': args.database,
+                  'charset': 'utf8mb4'}
+
+    if args.command == 'copy':
+        bulk_copy(source, target, args.checkpoint, args.threads, args.workdir)
+    elif args.command == 'replicate':
+        replicate(source, target, args.checkpoint, max_lag=0 if args.until_caught_up else None,
+                  server_id=args.server_id)
+    elif args.command == 'cutover':
+        cutover(source, target, args.checkpoint, args.max_lag, args.server_id, args.drain_timeout)
+    elif args.command == 'selftest':
+        selftest(source, target, args.rows, args.transactions, args.keep)
+    else:
+        position = load_checkpoint(args.checkpoint)
+        status_connection = pymysql.connect(**source)
+        try:
+            source_position = binlog_position(status_connection)
+        finally:
+            status_connection.close()
+        behind = bytes_behind(position, source_position)
+        print(f"Checkpoint {position[0]}:{position[1]}, source {source_position[0]}:{source_position[1]}"
+              f"{f', {behind:,} bytes behind' if behind is not None else ''}")
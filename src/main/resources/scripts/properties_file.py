@@ -0,0 +1,154 @@
+import os
+import tempfile
+from urllib.parse import urlparse
+
+# Minimal reader/writer for Java .properties files. Comments, blank lines,
+# ordering and formatting of untouched entries are preserved; only the values
+# of changed keys are rewritten.
+
+
+def _logical_lines(lines):
+    # Yields (first_index, last_index, text) with backslash line continuations joined
+    index = 0
+    while index < len(lines):
+        start = index
+        text = lines[index].rstrip('\r\n')
+        is_comment = text.lstrip()[:1] in ('#', '!')
+        while not is_comment and _has_continuation(text) and index + 1 < len(lines):
+            index += 1
+            text = text[:-1] + lines[index].rstrip('\r\n').lstrip()
+        yield start, index, text
+        index += 1
+
+
+def _has_continuation(text):
+    backslashes = len(text) - len(text.rstrip('\\'))
+    return backslashes % 2 == 1
+
+
+def _split_entry(text):
+    # Returns (key, separator_end, value) following java.util.Properties rules
+    stripped = text.lstrip()
+    if not stripped or stripped[0] in '#!':
+        return None
+    offset = len(text) - len(stripped)
+    index = offset
+    while index < len(text):
+        char = text[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char in '=: \t\f':
+            break
+        index += 1
+    key = _unescape(text[offset:index])
+
+    # Skip whitespace, at most one '=' or ':', then whitespace again
+    while index < len(text) and text[index] in ' \t\f':
+        index += 1
+    if index < len(text) and text[index] in '=:':
+        index += 1
+    while index < len(text) and text[index] in ' \t\f':
+        index += 1
+    return key, index, _unescape(text[index:])
+
+
+def _unescape(text):
+    result = []
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char == '\\' and index + 1 < len(text):
+            index += 1
+            char = text[index]
+            if char == 'u' and index + 4 < len(text):
+                result.append(chr(int(text[index + 1:index + 5], 16)))
+                index += 5
+                continue
+            char = {'t': '\t', 'n': '\n', 'r': '\r', 'f': '\f'}.get(char, char)
+        result.append(char)
+        index += 1
+    return ''.join(result)
+
+
+def escape_value(value):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+    if value.startswith(' '):
+        value = '\\' + value
+    return value
+
+
+def read_properties(file_path):
+    with open(file_path, 'r') as file:
+        lines = file.readlines()
+    properties = {}
+    for _, _, text in _logical_lines(lines):
+        entry = _split_entry(text)
+        if entry:
+            properties[entry[0]] = entry[2]
+    return properties
+
+
+def render_properties(lines, updates):
+    # Returns (new_lines, changed_keys) with the values in updates applied
+    found = set()
+    changed = []
+    new_lines = []
+    for start, end, text in _logical_lines(lines):
+        entry = _split_entry(text)
+        if entry and entry[0] in updates:
+            key, value_start, value = entry
+            found.add(key)
+            new_value = str(updates[key])
+            if new_value != value:
+                newline = lines[end][len(lines[end].rstrip('\r\n')):]
+                new_lines.append(f"{text[:value_start]}{escape_value(new_value)}{newline}")
+                if key not in changed:
+                    changed.append(key)
+                continue
+        new_lines.extend(lines[start:end + 1])
+
+    missing = [key for key in updates if key not in found]
+    if missing:
+        if new_lines and not new_lines[-1].endswith('\n'):
+            new_lines[-1] += '\n'
+        for key in missing:
+            new_lines.append(f"{key}={escape_value(updates[key])}\n")
+            changed.append(key)
+    return new_lines, changed
+
+
+def write_properties(file_path, updates):
+    # Applies updates to file_path and returns the list of changed keys. The file
+    # is replaced atomically and left untouched when nothing changed.
+    with open(file_path, 'r', newline='') as file:
+        lines = file.readlines()
+    new_lines, changed = render_properties(lines, updates)
+    if not changed:
+        return []
+
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', newline='') as file:
+            file.writelines(new_lines)
+        if os.path.exists(file_path):
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o777)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return changed
+
+
+def db_settings_from_properties(properties):
+    # pymysql.connect arguments from the jdbc.* entries of application.properties
+    jdbc_url = urlparse(properties['jdbc.url'][len('jdbc:'):])
+    return {
+        'host': jdbc_url.hostname,
+        'port': jdbc_url.port or 3306,
+        'user': properties['jdbc.username'],
+        'password': properties['jdbc.password'],
+        'database': jdbc_url.path.lstrip('/'),
+        'charset': 'utf8mb4'
+    }
@@ -0,0 +1,278 @@
+import argparse
+import json
+import math
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+from rds_tuning import apply_parameter_changes, diff_parameters, get_current_parameters, print_diff
+
+# Observability for the RDS instance: Performance Insights, enhanced
+# monitoring and the slow query log, and a report of the hot queries behind
+# latency spikes.
+#
+# create-rds-db.py enables them through monitoring_arguments (new instances)
+# and apply_monitoring (existing ones); the slow query log is switched on in
+# the parameter group with enable_slow_query_log and exported to CloudWatch
+# Logs.
+#
+#   top-sql  - top SQL by database load (average active sessions) from the
+#              Performance Insights API, with the top wait events
+#   slow-log - digest of a MySQL slow query log: statements normalized into
+#              fingerprints (literals replaced by ?), with count, total, avg
+#              and p95 time, rows examined and sent. Works offline on a local
+#              file, or downloads the log from the instance with --db-instance.
+
+MONITORING_ROLE_NAME = 'rds-monitoring-role'
+MONITORING_POLICY_ARN = 'arn:aws:iam::aws:policy/service-role/AmazonRDSEnhancedMonitoringRole'
+PERFORMANCE_INSIGHTS_RETENTION = 7  # days; the free tier
+LOG_EXPORTS = ['error', 'slowquery']
+SLOW_LOG_FILE = 'slowquery/mysql-slowquery.log'
+SLOW_LOG_PARAMETERS = {'slow_query_log': '1', 'log_output': 'FILE', 'log_slow_admin_statements': '1'}
+HEADER_PATTERN = re.compile(r'#\s*Query_time:\s*([\d.]+)\s+Lock_time:\s*([\d.]+)\s+Rows_sent:\s*(\d+)'
+                            r'\s+Rows_examined:\s*(\d+)')
+# Lines the server writes when it (re)opens the log file
+LOG_PREAMBLE = re.compile(r'^(\S+, Version: |Tcp port: |Time\s+Id\s+Command\s+Argument)')
+FINGERPRINT_RULES = [
+    (re.compile(r'/\*.*?\*/', re.S), ' '),  # comments
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),  # quoted strings
+    (re.compile(r'"(?:[^"\\]|\\.|"")*"'), '?'),
+    (re.compile(r'\b0x[0-9a-f]+\b'), '?'),
+    (re.compile(r'(?<![\w.`])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b'), '?'),  # numbers, not digits inside names
+    (re.compile(r'\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)'), 'in (?+)'),
+    # Row tuples of an INSERT (one level of nested parentheses for function
+    # calls); not VALUES(col) in ON DUPLICATE KEY UPDATE
+    (re.compile(r'(?<!=)(?<!= )\bvalues\s*(?:\((?:[^()]|\([^()]*\))*\)(?:\s*,\s*)?)+'), 'values (?+) '),
+    (re.compile(r'\s+'), ' ')
+]
+
+
+def create_monitoring_role(region):
+    # Role that enhanced monitoring uses to publish OS metrics to CloudWatch
+    iam = boto3.client('iam', region_name=region)
+    try:
+        iam.create_role(
+            RoleName=MONITORING_ROLE_NAME,
+            AssumeRolePolicyDocument=json.dumps({
+                'Version': '2012-10-17',
+                'Statement': [{
+                    'Effect': 'Allow',
+                    'Principal': {'Service': 'monitoring.rds.amazonaws.com'},
+                    'Action': 'sts:AssumeRole'
+                }]
+            })
+        )
+        iam.attach_role_policy(RoleName=MONITORING_ROLE_NAME, PolicyArn=MONITORING_POLICY_ARN)
+        print(f"Created IAM Role: {MONITORING_ROLE_NAME}")
+        # A new role takes a few seconds before RDS can assume it
+        time.sleep(10)
+    except iam.exceptions.EntityAlreadyExistsException:
+        print(f"IAM Role {MONITORING_ROLE_NAME} already exists.")
+    return iam.get_role(RoleName=MONITORING_ROLE_NAME)['Role']['Arn']
+
+
+def supported_features(instance_class, engine, region):
+    # {'performance_insights': bool, 'enhanced_monitoring': bool} for the class
+    rds = boto3.client('rds', region_name=region)
+    options = []
+    for page in rds.get_paginator('describe_orderable_db_instance_options').paginate(Engine=engine,
+                                                                                      DBInstanceClass=instance_class):
+        options += page['OrderableDBInstanceOptions']
+    return {'performance_insights': any(option.get('SupportsPerformanceInsights') for option in options),
+            'enhanced_monitoring': any(option.get('SupportsEnhancedMonitoring') for option in options)}
+
+
+def monitoring_arguments(instance_class, region, performance_insights=True, monitoring_interval=60,
+                         export_logs=True, engine='mysql'):
+    # Returns the create_db_instance/modify_db_instance arguments; features the
+    # instance class does not support are skipped with a note
+    features = supported_features(instance_class, engine, region)
+    arguments = {}
+    if performance_insights and features['performance_insights']:
+        arguments['EnablePerformanceInsights'] = True
+        arguments['PerformanceInsightsRetentionPeriod'] = PERFORMANCE_INSIGHTS_RETENTION
+    elif performance_insights:
+        print(f"Performance Insights is not available for {instance_class}; skipping it.")
+    if monitoring_interval and features['enhanced_monitoring']:
+        arguments['MonitoringInterval'] = monitoring_interval
+        arguments['MonitoringRoleArn'] = create_monitoring_role(region)
+    elif monitoring_interval:
+        print(f"Enhanced monitoring is not available for {instance_class}; skipping it.")
+    if export_logs:
+        arguments['EnableCloudwatchLogsExports'] = LOG_EXPORTS
+    return arguments
+
+
+def apply_monitoring(db_instance_identifier, arguments, region):
+    # Brings an existing instance to the monitoring_arguments settings;
+    # returns True when a modification was requested
+    rds = boto3.client('rds', region_name=region)
+    instance = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0]
+    changes = {}
+    if arguments.get('EnablePerformanceInsights') and not instance.get('PerformanceInsightsEnabled'):
+        changes['EnablePerformanceInsights'] = True
+        changes['PerformanceInsightsRetentionPeriod'] = arguments['PerformanceInsightsRetentionPeriod']
+    if 'MonitoringInterval' in arguments and arguments['MonitoringInterval'] != instance.get('MonitoringInterval', 0):
+        changes['MonitoringInterval'] = arguments['MonitoringInterval']
+        changes['MonitoringRoleArn'] = arguments['MonitoringRoleArn']
+    missing_logs = [log for log in arguments.get('EnableCloudwatchLogsExports', [])
+                    if log not in instance.get('EnabledCloudwatchLogsExports', [])]
+    if missing_logs:
+        changes['CloudwatchLogsExportConfiguration'] = {'EnableLogTypes': missing_logs}
+    if not changes:
+        print(f"Monitoring of {db_instance_identifier} is already up to date.")
+        return False
+    rds.modify_db_instance(DBInstanceIdentifier=db_instance_identifier, ApplyImmediately=True, **changes)
+    print(f"Updating monitoring of {db_instance_identifier}: {', '.join(sorted(changes))}")
+    return True
+
+
+def enable_slow_query_log(parameter_group_name, region, long_query_time=0.5):
+    # All dynamic, so they apply without a reboot
+    desired = dict(SLOW_LOG_PARAMETERS, long_query_time=str(long_query_time))
+    changes = diff_parameters(get_current_parameters(parameter_group_name, region), desired)
+    print(f"Slow query log on {parameter_group_name} (long_query_time {long_query_time}s):")
+    print_diff(changes)
+    if changes:
+        apply_parameter_changes(parameter_group_name, changes, region)
+    return changes
+
+
+def top_sql(db_instance_identifier, region, minutes=60, limit=10):
+    # Returns ([(average active sessions, statement)], [(average active sessions, wait event)])
+    rds = boto3.client('rds', region_name=region)
+    instance = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0]
+    if not instance.get('PerformanceInsightsEnabled'):
+        raise Exception(f"Performance Insights is not enabled on {db_instance_identifier}")
+    pi = boto3.client('pi', region_name=region)
+    end = datetime.now(timezone.utc)
+    window = {'ServiceType': 'RDS', 'Identifier': instance['DbiResourceId'], 'StartTime': end - timedelta(
+        minutes=minutes), 'EndTime': end, 'Metric': 'db.load.avg'}
+    statements = pi.describe_dimension_keys(GroupBy={'Group': 'db.sql_tokenized', 'Limit': limit}, **window)['Keys']
+    waits = pi.describe_dimension_keys(GroupBy={'Group': 'db.wait_event', 'Limit': limit}, **window)['Keys']
+    return ([(key['Total'], key['Dimensions'].get('db.sql_tokenized.statement', '')) for key in statements],
+            [(key['Total'], key['Dimensions'].get('db.wait_event.name', '')) for key in waits])
+
+
+def print_top_sql(statements, waits, minutes):
+    print(f"Top SQL by load over the last {minutes} minutes (average active sessions):")
+    for load, statement in statements:
+        print(f"  {load:8.3f}  {' '.join(statement.split())[:150]}")
+    print("Top wait events:")
+    for load, wait in waits:
+        print(f"  {load:8.3f}  {wait}")
+
+
+def download_slow_log(db_instance_identifier, path, region, log_file=SLOW_LOG_FILE):
+    rds = boto3.client('rds', region_name=region)
+    marker = '0'
+    with open(path, 'w') as file:
+        while True:
+            portion = rds.download_db_log_file_portion(DBInstanceIdentifier=db_instance_identifier,
+                                                       LogFileName=log_file, Marker=marker)
+            file.write(portion.get('LogFileData') or '')
+            marker = portion['Marker']
+            if not portion['AdditionalDataPending']:
+                break
+    print(f"Downloaded {log_file} of {db_instance_identifier} to {path}")
+
+
+def fingerprint(statement):
+    normalized = statement.strip().rstrip(';').lower()
+    for pattern, replacement in FINGERPRINT_RULES:
+        normalized = pattern.sub(replacement, normalized)
+    return normalized.strip()
+
+
+def iter_slow_log(lines):
+    # Yields (query seconds, lock seconds, rows sent, rows examined, statement)
+    header = None
+    statement = []
+    for line in lines:
+        if line.startswith('#') or LOG_PREAMBLE.match(line):
+            if header and statement:
+                yield header + (''.join(statement),)
+                header, statement = None, []
+            match = HEADER_PATTERN.match(line)
+            if match:
+                header = (float(match.group(1)), float(match.group(2)), int(match.group(3)), int(match.group(4)))
+            continue
+        if header is None:
+            continue
+        # Context the server adds before each statement
+        stripped = line.strip()
+        if not statement and (stripped.lower().startswith('use ') or stripped.lower().startswith('set timestamp=')):
+            continue
+        statement.append(line)
+    if header and statement:
+        yield header + (''.join(statement),)
+
+
+def digest_slow_log(lines):
+    # Returns the digest entries ordered by total query time
+    digest = {}
+    for query_time, lock_time, rows_sent, rows_examined, statement in iter_slow_log(lines):
+        key = fingerprint(statement)
+        entry = digest.get(key)
+        if entry is None:
+            entry = digest[key] = {'fingerprint': key, 'example': ' '.join(statement.split()),
+                                   'times': [], 'lock_time': 0.0, 'rows_sent': 0, 'rows_examined': 0}
+        entry['times'].append(query_time)
+        entry['lock_time'] += lock_time
+        entry['rows_sent'] += rows_sent
+        entry['rows_examined'] += rows_examined
+    # Slow logs are small enough to keep every time, so p95 is exact
+    # (nearest rank) rather than a histogram bucket bound
+    entries = []
+    for entry in digest.values():
+        times = sorted(entry.pop('times'))
+        total_time = sum(times)
+        entry.update(count=len(times), total_time=total_time, avg_time=total_time / len(times),
+                     p95_time=times[math.ceil(len(times) * 0.95) - 1])
+        entries.append(entry)
+    return sorted(entries, key=lambda entry: entry['total_time'], reverse=True)
+
+
+def print_digest(entries, limit=20):
+    total = sum(entry['total_time'] for entry in entries) or 1
+    print(f"{sum(entry['count'] for entry in entries)} slow queries, {len(entries)} fingerprints, "
+          f"{total:.3f}s in total")
+    print(f"{'rank':>4} {'count':>7} {'total s':>9} {'share':>6} {'avg s':>8} {'p95 s':>8} {'rows exam/call':>15}"
+          f"  fingerprint")
+    for rank, entry in enumerate(entries[:limit], 1):
+        print(f"{rank:>4} {entry['count']:>7} {entry['total_time']:>9.3f} {entry['total_time'] / total:>6.1%} "
+              f"{entry['avg_time']:>8.4f} {entry['p95_time']:>8.4f} "
+              f"{entry['rows_examined'] / entry['count']:>15,.0f}  {entry['fingerprint'][:120]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hot queries of the RDS instance from Performance Insights and "
+                                                 "the slow query log")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    top_parser = subparsers.add_parser('top-sql')
+    top_parser.add_argument('--db-instance', default='dmanup-aws-codecomit-demo-rdsdb')
+    top_parser.add_argument('--minutes', type=int, default=60, help="window ending now")
+    top_parser.add_argument('--limit', type=int, default=10)
+    top_parser.add_argument('--region', default='ap-south-1')
+    slow_parser = subparsers.add_parser('slow-log')
+    slow_parser.add_argument('--file', required=True, help="slow query log to read (written first with --db-instance)")
+    slow_parser.add_argument('--db-instance', help="download the instance's slow query log into --file first")
+    slow_parser.add_argument('--limit', type=int, default=20)
+    slow_parser.add_argument('--output', help="write the full digest as JSON")
+    slow_parser.add_argument('--region', default='ap-south-1')
+    args = parser.parse_args()
+
+    if args.command == 'top-sql':
+        print_top_sql(*top_sql(args.db_instance, args.region, args.minutes, args.limit), args.minutes)
+    else:
+        if args.db_instance:
+            download_slow_log(args.db_instance, args.file, args.region)
+        with open(args.file, errors='replace') as log:
+            entries = digest_slow_log(log)
+        print_digest(entries, args.limit)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(entries, file, indent=2)
+            print(f"Saved the digest to {args.output}")
@@ -0,0 +1,242 @@
+import argparse
+import math
+import time
+
+import boto3
+
+from rds_tuning import (INSTANCE_FAMILIES, INSTANCE_SIZES, WORKLOAD_PROFILES, compute_parameters, apply_tuning_profile,
+                        GIB)
+
+# Sizing calculator for the RDS instance: picks the instance class and the
+# storage (gp3 or io2 with provisioned IOPS/throughput) from the data size,
+# its growth and the IOPS/throughput targets, and sets storage autoscaling
+# limits. gp2 ties IOPS to the volume size and runs on burst credits, so it is
+# never chosen.
+#
+#   plan  - print the recommendation and the create_db_instance arguments
+#   apply - diff against an existing instance and modify it (--dry-run to
+#           only preview), then re-tune its parameter group for the class
+
+# RDS storage rules
+GP3_MIN_GIB = 20
+GP3_STRIPED_GIB = 400  # below this gp3 is fixed at 3000 IOPS / 125 MiB/s
+GP3_BASELINE = {'small': (3000, 125), 'striped': (12000, 500)}
+GP3_MAX_IOPS = 64000
+GP3_MAX_THROUGHPUT = 4000
+GP3_MAX_THROUGHPUT_PER_IOPS = 0.25
+IO2_MIN_GIB = 100
+IO2_MIN_IOPS = 1000
+IO2_MAX_IOPS = 256000
+IO2_MAX_IOPS_PER_GIB = 1000
+MAX_STORAGE_GIB = 65536
+
+# Approximate baseline EBS IOPS and MiB/s per instance size; burstable sizes
+# can only exceed these on credits
+EBS_BASELINE = {
+    'burstable': {'micro': (500, 11), 'small': (1000, 22), 'medium': (2000, 43), 'large': (4000, 87),
+                  'xlarge': (4000, 87), '2xlarge': (4000, 87)},
+    'general': {'large': (3600, 81), 'xlarge': (6000, 143), '2xlarge': (12000, 287), '4xlarge': (18750, 593),
+                '8xlarge': (30000, 850)},
+    'memory': {'large': (3600, 81), 'xlarge': (6000, 143), '2xlarge': (12000, 287), '4xlarge': (18750, 593),
+               '8xlarge': (30000, 850)}
+}
+FREE_SPACE_FRACTION = 0.2
+AUTOSCALING_HEADROOM = 1.5
+
+
+def projected_size_gib(data_gib, annual_growth, months):
+    return data_gib * (1 + annual_growth) ** (months / 12)
+
+
+def size_storage(data_gib, annual_growth, target_iops, target_throughput, horizon_months=12):
+    # Returns the storage part of the sizing for create/modify_db_instance
+    needed_gib = math.ceil(projected_size_gib(data_gib, annual_growth, horizon_months) * (1 + FREE_SPACE_FRACTION))
+    storage = {'StorageType': 'gp3', 'AllocatedStorage': max(GP3_MIN_GIB, needed_gib)}
+
+    if target_iops <= GP3_BASELINE['small'][0] and target_throughput <= GP3_BASELINE['small'][1]:
+        iops, throughput = GP3_BASELINE['small' if storage['AllocatedStorage'] < GP3_STRIPED_GIB else 'striped']
+    elif target_iops <= GP3_MAX_IOPS and target_throughput <= GP3_MAX_THROUGHPUT:
+        # Provisioned IOPS/throughput on gp3 need the striped (>= 400 GiB) volume
+        storage['AllocatedStorage'] = max(storage['AllocatedStorage'], GP3_STRIPED_GIB)
+        iops = max(GP3_BASELINE['striped'][0], target_iops)
+        throughput = max(GP3_BASELINE['striped'][1], target_throughput)
+        throughput = min(throughput, math.floor(iops * GP3_MAX_THROUGHPUT_PER_IOPS))
+        if throughput < target_throughput:
+            iops = math.ceil(target_throughput / GP3_MAX_THROUGHPUT_PER_IOPS)
+            throughput = target_throughput
+        storage.update({'Iops': iops, 'StorageThroughput': throughput})
+    else:
+        # Beyond gp3 limits: io2, throughput follows the provisioned IOPS
+        iops = min(IO2_MAX_IOPS, max(IO2_MIN_IOPS, target_iops))
+        storage = {
+            'StorageType': 'io2',
+            'AllocatedStorage': max(IO2_MIN_GIB, needed_gib, math.ceil(iops / IO2_MAX_IOPS_PER_GIB)),
+            'Iops': iops
+        }
+        throughput = None
+
+    # Autoscaling: room for three horizons of growth and at least double the
+    # allocation (RDS needs 10% above it)
+    ceiling = math.ceil(projected_size_gib(data_gib, annual_growth, horizon_months * 3) * AUTOSCALING_HEADROOM)
+    storage['MaxAllocatedStorage'] = min(MAX_STORAGE_GIB, max(ceiling, storage['AllocatedStorage'] * 2))
+    return storage, iops, throughput
+
+
+def size_instance(working_set_gib, target_iops, target_throughput, target_connections, families=('t3', 'm5', 'r5'),
+                  profile='read-heavy'):
+    # Smallest class (by memory) whose tuned buffer pool holds the working set
+    # and whose EBS baseline and connection limit cover the targets
+    candidates = []
+    for family in families:
+        category = INSTANCE_FAMILIES[family]
+        for size, (memory_gib, _) in INSTANCE_SIZES[category].items():
+            candidates.append((memory_gib, families.index(family), f"db.{family}.{size}", category, size))
+    for _, _, instance_class, category, size in sorted(candidates):
+        parameters = compute_parameters(instance_class, profile, max(target_iops, 3000))
+        ebs_iops, ebs_throughput = EBS_BASELINE[category][size]
+        if int(parameters['innodb_buffer_pool_size']) >= working_set_gib * GIB \
+                and int(parameters['max_connections']) >= target_connections \
+                and ebs_iops >= target_iops and ebs_throughput >= target_throughput:
+            return instance_class
+    raise ValueError(f"No instance class in {', '.join(families)} holds a {working_set_gib:.1f} GiB working set "
+                     f"with {target_iops} IOPS, {target_throughput} MiB/s and {target_connections} connections")
+
+
+def size_database(data_gib, annual_growth=0.5, target_iops=500, target_throughput=10, target_connections=50,
+                  working_set_fraction=0.3, horizon_months=12, families=('t3', 'm5', 'r5'), profile='read-heavy'):
+    # Returns the keyword arguments for create_db_instance plus 'SizedIops' and
+    # 'SizedThroughput' (informational, used for parameter tuning)
+    storage, iops, throughput = size_storage(data_gib, annual_growth, target_iops, target_throughput, horizon_months)
+    working_set = projected_size_gib(data_gib, annual_growth, horizon_months) * working_set_fraction
+    instance_class = size_instance(working_set, target_iops, target_throughput, target_connections, families, profile)
+    return dict(storage, DBInstanceClass=instance_class, SizedIops=iops, SizedThroughput=throughput)
+
+
+def create_arguments(sizing):
+    return {key: value for key, value in sizing.items() if not key.startswith('Sized')}
+
+
+def grown_storage(arguments, allocated_gib):
+    # create_db_instance arguments with at least allocated_gib: RDS cannot
+    # shrink a volume or restore a snapshot onto a smaller one
+    arguments = dict(arguments, AllocatedStorage=max(arguments['AllocatedStorage'], allocated_gib))
+    if arguments['AllocatedStorage'] >= GP3_STRIPED_GIB and arguments['StorageType'] == 'gp3':
+        # A grown gp3 volume is striped and needs explicit IOPS/throughput
+        arguments.setdefault('Iops', GP3_BASELINE['striped'][0])
+        arguments.setdefault('StorageThroughput', GP3_BASELINE['striped'][1])
+    return arguments
+
+
+def diff_instance(instance, sizing):
+    # Returns {argument: (current, new)} for the modify_db_instance call.
+    # Storage never shrinks: RDS cannot reduce AllocatedStorage.
+    current = {
+        'DBInstanceClass': instance['DBInstanceClass'],
+        'StorageType': instance['StorageType'],
+        'AllocatedStorage': instance['AllocatedStorage'],
+        'Iops': instance.get('Iops'),
+        'StorageThroughput': instance.get('StorageThroughput'),
+        'MaxAllocatedStorage': instance.get('MaxAllocatedStorage')
+    }
+    desired = grown_storage(create_arguments(sizing), current['AllocatedStorage'])
+    # Nor is a larger autoscaling ceiling set on the instance lowered
+    desired['MaxAllocatedStorage'] = max(desired['MaxAllocatedStorage'], current['MaxAllocatedStorage'] or 0,
+                                         math.ceil(desired['AllocatedStorage'] * 1.1))
+    return {key: (current[key], value) for key, value in desired.items() if current.get(key) != value}
+
+
+def print_instance_diff(db_instance_identifier, changes):
+    if not changes:
+        print(f"RDS instance {db_instance_identifier} already matches the sizing.")
+        return
+    print(f"Sizing changes for {db_instance_identifier}:")
+    for key, (old, new) in changes.items():
+        print(f"  {key:<20} {str(old):>14} -> {new}")
+
+
+def wait_for_instance_class(db_instance_identifier, instance_class, region):
+    # The available waiter can return before the modification has started, so
+    # poll until the new class is in effect and nothing is pending
+    rds = boto3.client('rds', region_name=region)
+    while True:
+        instance = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0]
+        if instance['DBInstanceClass'] == instance_class and instance['DBInstanceStatus'] == 'available' and \
+                not instance.get('PendingModifiedValues'):
+            break
+        print(f"Waiting for {db_instance_identifier} to become {instance_class} "
+              f"(status {instance['DBInstanceStatus']})")
+        time.sleep(30)
+
+
+def apply_sizing(db_instance_identifier, sizing, region, dry_run=False, apply_immediately=True, tuning_profile=None):
+    # Previews and applies the sizing to an existing instance. Storage changes
+    # are subject to the six-hour storage optimization cooldown. With a
+    # tuning_profile the parameter groups are re-tuned for the class in effect,
+    # only after a class change has finished: innodb_buffer_pool_size is
+    # dynamic and would otherwise hit the old class.
+    rds = boto3.client('rds', region_name=region)
+    instance = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)['DBInstances'][0]
+    changes = diff_instance(instance, sizing)
+    print_instance_diff(db_instance_identifier, changes)
+    instance_class = instance['DBInstanceClass']
+    if not dry_run and changes:
+        rds.modify_db_instance(DBInstanceIdentifier=db_instance_identifier, ApplyImmediately=apply_immediately,
+                               **{key: new for key, (_, new) in changes.items()})
+        print(f"Requested modification of {db_instance_identifier}"
+              f"{'' if apply_immediately else ' in the next maintenance window'}.")
+        if apply_immediately:
+            instance_class = sizing['DBInstanceClass']
+            wait_for_instance_class(db_instance_identifier, instance_class, region)
+    if tuning_profile:
+        for group in instance['DBParameterGroups']:
+            apply_tuning_profile(group['DBParameterGroupName'], instance_class, tuning_profile, region,
+                                 storage_iops=sizing['SizedIops'], dry_run=dry_run)
+        if instance_class != sizing['DBInstanceClass']:
+            print(f"Re-run the tuning for {sizing['DBInstanceClass']} once the class change has been applied.")
+    return changes
+
+
+def print_sizing(sizing):
+    print(f"Instance class:        {sizing['DBInstanceClass']}")
+    print(f"Storage:               {sizing['StorageType']} {sizing['AllocatedStorage']} GiB, "
+          f"autoscaling up to {sizing['MaxAllocatedStorage']} GiB")
+    throughput = f", {sizing['SizedThroughput']} MiB/s" if sizing['SizedThroughput'] else ""
+    provisioned = ' (provisioned)' if 'Iops' in sizing else ' (baseline)'
+    print(f"Performance:           {sizing['SizedIops']} IOPS{throughput}{provisioned}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="RDS instance class and storage sizing")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('plan', 'apply'):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument('--data-gib', type=float, required=True, help="current data size")
+        subparser.add_argument('--annual-growth', type=float, default=0.5, help="e.g. 0.5 for +50%% a year")
+        subparser.add_argument('--horizon-months', type=int, default=12)
+        subparser.add_argument('--target-iops', type=int, default=500)
+        subparser.add_argument('--target-throughput', type=int, default=10, help="MiB/s")
+        subparser.add_argument('--target-connections', type=int, default=50)
+        subparser.add_argument('--working-set-fraction', type=float, default=0.3,
+                               help="share of the data that must fit in the buffer pool")
+        subparser.add_argument('--families', nargs='+', default=['t3', 'm5', 'r5'])
+        if name == 'apply':
+            subparser.add_argument('--db-instance', required=True)
+            subparser.add_argument('--region', default='ap-south-1')
+            subparser.add_argument('--dry-run', action='store_true', help="only preview the changes")
+            subparser.add_argument('--next-maintenance-window', action='store_true')
+            subparser.add_argument('--tuning-profile', choices=sorted(WORKLOAD_PROFILES), default='read-heavy',
+                                   help="profile the parameter group is re-tuned with, see rds_tuning.py")
+    args = parser.parse_args()
+
+    try:
+        sizing = size_database(args.data_gib, args.annual_growth, args.target_iops, args.target_throughput,
+                               args.target_connections, args.working_set_fraction, args.horizon_months,
+                               tuple(args.families))
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print_sizing(sizing)
+    if args.command == 'plan':
+        print(f"create_db_instance arguments: {create_arguments(sizing)}")
+    else:
+        apply_sizing(args.db_instance, sizing, args.region, args.dry_run, not args.next_maintenance_window,
+                     args.tuning_profile)
@@ -0,0 +1,320 @@
+import argparse
+import random
+import threading
+import time
+
+import boto3
+import pymysql
+
+from latency_histogram import LatencyHistogram
+
+# Workload-aware tuning for the RDS MySQL parameter group. Parameters are
+# computed from the memory and vCPUs of the instance class and a workload
+# profile, compared against the parameter group and only the differences are
+# applied: dynamic parameters immediately, static ones at the next reboot.
+#
+#   plan  - print the parameters for an instance class and profile
+#   apply - diff and apply them to a parameter group, report pending reboots
+#   bench - run the login query set against a local MySQL before and after
+#           setting the dynamic parameters with SET GLOBAL
+
+MIB = 1024 ** 2
+GIB = 1024 ** 3
+
+# Memory (GiB) and vCPUs per size; the families share the same shapes
+INSTANCE_SIZES = {
+    'burstable': {'micro': (1, 2), 'small': (2, 2), 'medium': (4, 2), 'large': (8, 2), 'xlarge': (16, 4),
+                  '2xlarge': (32, 8)},
+    'general': {'large': (8, 2), 'xlarge': (16, 4), '2xlarge': (32, 8), '4xlarge': (64, 16), '8xlarge': (128, 32)},
+    'memory': {'large': (16, 2), 'xlarge': (32, 4), '2xlarge': (64, 8), '4xlarge': (128, 16), '8xlarge': (256, 32)}
+}
+INSTANCE_FAMILIES = {'t3': 'burstable', 't4g': 'burstable', 'm5': 'general', 'm6g': 'general', 'm6i': 'general',
+                     'r5': 'memory', 'r6g': 'memory', 'r6i': 'memory'}
+
+# buffer_pool_fraction - share of the memory left after the OS reserve
+# connection_mib       - average memory per connection (thread stack, sort/join buffers)
+# redo_fraction        - innodb_log_file_size relative to the buffer pool
+# tmp_table_fraction   - tmp_table_size / max_heap_table_size relative to memory
+WORKLOAD_PROFILES = {
+    'read-heavy': {'buffer_pool_fraction': 0.8, 'connection_mib': 4, 'max_connections': 2000,
+                   'redo_fraction': 0.0625, 'tmp_table_fraction': 1 / 64},
+    'balanced': {'buffer_pool_fraction': 0.75, 'connection_mib': 6, 'max_connections': 1500,
+                 'redo_fraction': 0.125, 'tmp_table_fraction': 1 / 64},
+    'write-heavy': {'buffer_pool_fraction': 0.7, 'connection_mib': 8, 'max_connections': 1000,
+                    'redo_fraction': 0.25, 'tmp_table_fraction': 1 / 128}
+}
+BATCH_SIZE = 20  # modify_db_parameter_group accepts at most 20 parameters per call
+BUFFER_POOL_CHUNK = 128 * MIB
+
+BENCHMARK_QUERIES = {
+    'login_by_username': "SELECT * FROM user WHERE username = %s",
+    'roles_of_user': "SELECT r.id, r.name FROM role r JOIN user_role ur ON ur.role_id = r.id WHERE ur.user_id = %s",
+    'lookup_by_email': "SELECT id FROM user WHERE userEmail = %s"
+}
+
+
+def instance_resources(instance_class):
+    # 'db.r5.xlarge' -> (memory GiB, vCPUs)
+    _, family, size = instance_class.split('.')
+    try:
+        return INSTANCE_SIZES[INSTANCE_FAMILIES[family]][size]
+    except KeyError:
+        raise ValueError(f"Unknown instance class {instance_class}")
+
+
+def _clamp(value, low, high):
+    return int(max(low, min(high, value)))
+
+
+def compute_parameters(instance_class, profile='balanced', storage_iops=3000):
+    # Returns {parameter name: value as string}
+    memory_gib, vcpus = instance_resources(instance_class)
+    settings = WORKLOAD_PROFILES[profile]
+    memory = memory_gib * GIB
+    reserved = _clamp(memory * 0.1, 512 * MIB, 4 * GIB)  # OS, RDS agents, monitoring
+
+    buffer_pool_instances = _clamp((memory - reserved) * settings['buffer_pool_fraction'] // GIB, 1, min(8, vcpus * 2))
+    chunk = BUFFER_POOL_CHUNK * buffer_pool_instances
+    buffer_pool = max(chunk, int((memory - reserved) * settings['buffer_pool_fraction']) // chunk * chunk)
+
+    max_connections = _clamp((memory - reserved - buffer_pool) / (settings['connection_mib'] * MIB), 50,
+                             settings['max_connections'])
+    table_open_cache = _clamp(max_connections * 4, 2000, 16000)
+    tmp_table_size = _clamp(memory * settings['tmp_table_fraction'], 16 * MIB, 256 * MIB)
+    log_file_size = _clamp(buffer_pool * settings['redo_fraction'], 128 * MIB, 4 * GIB) // MIB * MIB
+    io_threads = _clamp(vcpus, 4, 16)
+
+    return {
+        'innodb_buffer_pool_size': str(buffer_pool),
+        'innodb_buffer_pool_instances': str(buffer_pool_instances),
+        'innodb_log_file_size': str(log_file_size),
+        'max_connections': str(max_connections),
+        'table_open_cache': str(table_open_cache),
+        'table_open_cache_instances': str(_clamp(vcpus, 1, 16)),
+        'table_definition_cache': str(_clamp(table_open_cache // 2, 1400, 8000)),
+        'thread_cache_size': str(_clamp(max_connections // 10, 16, 200)),
+        'tmp_table_size': str(tmp_table_size),
+        'max_heap_table_size': str(tmp_table_size),
+        'innodb_read_io_threads': str(io_threads),
+        'innodb_write_io_threads': str(io_threads),
+        'innodb_io_capacity': str(_clamp(storage_iops // 2, 200, 20000)),
+        'innodb_io_capacity_max': str(_clamp(storage_iops, 400, 40000))
+    }
+
+
+def get_current_parameters(parameter_group_name, region):
+    # Returns {name: {'value', 'apply_type', 'modifiable'}} for the whole group
+    rds = boto3.client('rds', region_name=region)
+    current = {}
+    for page in rds.get_paginator('describe_db_parameters').paginate(DBParameterGroupName=parameter_group_name):
+        for parameter in page['Parameters']:
+            current[parameter['ParameterName']] = {
+                'value': parameter.get('ParameterValue'),
+                'apply_type': parameter.get('ApplyType', 'static'),
+                'modifiable': parameter.get('IsModifiable', False)
+            }
+    return current
+
+
+def diff_parameters(current, desired):
+    # Returns [(name, current value, desired value, apply type), ...]
+    changes = []
+    for name, value in sorted(desired.items()):
+        existing = current.get(name)
+        if existing is None or not existing['modifiable']:
+            print(f"Skipping {name}: not modifiable in this parameter group family.")
+            continue
+        if existing['value'] != value:
+            changes.append((name, existing['value'], value, existing['apply_type']))
+    return changes
+
+
+def print_diff(changes):
+    if not changes:
+        print("Parameter group already matches the tuning profile.")
+        return
+    print(f"{'parameter':<32} {'current':>36} {'new':>14}  apply")
+    for name, old, new, apply_type in changes:
+        print(f"{name:<32} {str(old or '(engine default)'):>36} {new:>14}  {apply_type}")
+
+
+def apply_parameter_changes(parameter_group_name, changes, region):
+    rds = boto3.client('rds', region_name=region)
+    parameters = [{
+        'ParameterName': name,
+        'ParameterValue': new,
+        'ApplyMethod': 'immediate' if apply_type == 'dynamic' else 'pending-reboot'
+    } for name, _, new, apply_type in changes]
+    for index in range(0, len(parameters), BATCH_SIZE):
+        batch = parameters[index:index + BATCH_SIZE]
+        rds.modify_db_parameter_group(DBParameterGroupName=parameter_group_name, Parameters=batch)
+        print(f"Applied {len(batch)} parameter(s) to {parameter_group_name}")
+
+
+def pending_reboot_instances(parameter_group_name, region):
+    # Instances using the group whose static changes only apply after a reboot
+    rds = boto3.client('rds', region_name=region)
+    pending = []
+    for page in rds.get_paginator('describe_db_instances').paginate():
+        for instance in page['DBInstances']:
+            for group in instance['DBParameterGroups']:
+                if group['DBParameterGroupName'] == parameter_group_name and \
+                        group['ParameterApplyStatus'] == 'pending-reboot':
+                    pending.append(instance['DBInstanceIdentifier'])
+    return pending
+
+
+def instances_of_other_classes(parameter_group_name, instance_class, region):
+    # The values are absolute, so instances of another class sharing the group
+    # (e.g. replicas left at the old class) get a buffer pool sized for this one
+    rds = boto3.client('rds', region_name=region)
+    return [instance['DBInstanceIdentifier']
+            for page in rds.get_paginator('describe_db_instances').paginate() for instance in page['DBInstances']
+            if instance['DBInstanceClass'] != instance_class and
+            any(group['DBParameterGroupName'] == parameter_group_name for group in instance['DBParameterGroups'])]
+
+
+def apply_tuning_profile(parameter_group_name, instance_class, profile, region, storage_iops=3000, dry_run=False,
+                         reboot=False):
+    desired = compute_parameters(instance_class, profile, storage_iops)
+    mismatched = instances_of_other_classes(parameter_group_name, instance_class, region)
+    if mismatched:
+        print(f"Warning: {parameter_group_name} is also used by {', '.join(mismatched)} of another class than "
+              f"{instance_class}; give them their own parameter group or the same class.")
+    changes = diff_parameters(get_current_parameters(parameter_group_name, region), desired)
+    print(f"Tuning profile '{profile}' for {instance_class} on {parameter_group_name}:")
+    print_diff(changes)
+    if dry_run or not changes:
+        return changes
+    apply_parameter_changes(parameter_group_name, changes, region)
+
+    # Give RDS a moment to propagate the group status to its instances
+    time.sleep(5)
+    pending = pending_reboot_instances(parameter_group_name, region)
+    if pending:
+        static = [name for name, _, _, apply_type in changes if apply_type != 'dynamic']
+        print(f"Pending reboot for {', '.join(static)} on: {', '.join(pending)}")
+        if reboot:
+            rds = boto3.client('rds', region_name=region)
+            for instance_id in pending:
+                rds.reboot_db_instance(DBInstanceIdentifier=instance_id)
+                print(f"Rebooting {instance_id}")
+            rds.get_waiter('db_instance_available').wait(
+                Filters=[{'Name': 'db-instance-id', 'Values': pending}])
+    return changes
+
+
+def _benchmark_worker(connection_args, samples, deadline, histograms, lock):
+    local = {name: LatencyHistogram() for name in BENCHMARK_QUERIES}
+    connection = pymysql.connect(**connection_args)
+    rng = random.Random()
+    try:
+        with connection.cursor() as cursor:
+            while time.time() < deadline:
+                user_id, username, email = rng.choice(samples)
+                for name, query in BENCHMARK_QUERIES.items():
+                    argument = {'login_by_username': username, 'roles_of_user': user_id}.get(name, email)
+                    start = time.perf_counter()
+                    cursor.execute(query, (argument,))
+                    cursor.fetchall()
+                    local[name].record((time.perf_counter() - start) * 1e6)
+    finally:
+        connection.close()
+    with lock:
+        for name, histogram in local.items():
+            histograms[name].merge(histogram)
+
+
+def run_query_benchmark(connection_args, threads=8, duration=20):
+    # Runs the login query set from `threads` connections; returns
+    # {query name: LatencyHistogram}
+    connection = pymysql.connect(**connection_args)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, username, userEmail FROM user LIMIT 10000")
+        samples = cursor.fetchall()
+    connection.close()
+    if not samples:
+        raise Exception("The user table is empty; seed it before benchmarking")
+
+    histograms = {name: LatencyHistogram() for name in BENCHMARK_QUERIES}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+    workers = [threading.Thread(target=_benchmark_worker, args=(connection_args, samples, deadline, histograms, lock))
+               for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return histograms
+
+
+def set_global_parameters(connection_args, parameters):
+    # Applies the dynamic parameters to a local server; returns the previous
+    # values of the ones that were changed so they can be restored
+    connection = pymysql.connect(**connection_args)
+    previous = {}
+    try:
+        with connection.cursor() as cursor:
+            for name, value in parameters.items():
+                cursor.execute("SELECT @@GLOBAL." + name)
+                previous[name] = cursor.fetchone()[0]
+                try:
+                    cursor.execute(f"SET GLOBAL {name} = %s", (int(value),))
+                except pymysql.err.OperationalError as e:
+                    # Read-only variables need a restart
+                    print(f"Not set {name}: {e.args[1]}")
+                    previous.pop(name)
+    finally:
+        connection.close()
+    return previous
+
+
+def compare_benchmarks(before, after, duration):
+    print(f"{'query':<20} {'qps before':>11} {'qps after':>11} {'p50 before':>11} {'p50 after':>11} "
+          f"{'p99 before':>11} {'p99 after':>11}")
+    for name in BENCHMARK_QUERIES:
+        b, a = before[name], after[name]
+        print(f"{name:<20} {b.count / duration:>11,.0f} {a.count / duration:>11,.0f} {b.percentile(50):>9.0f}us "
+              f"{a.percentile(50):>9.0f}us {b.percentile(99):>9.0f}us {a.percentile(99):>9.0f}us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Workload-aware MySQL parameter tuning for RDS")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('plan', 'apply', 'bench'):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument('--instance-class', default='db.t3.micro')
+        subparser.add_argument('--profile', choices=sorted(WORKLOAD_PROFILES), default='read-heavy')
+        subparser.add_argument('--storage-iops', type=int, default=3000, help="baseline IOPS of the volume")
+        if name == 'apply':
+            subparser.add_argument('--parameter-group', required=True)
+            subparser.add_argument('--region', default='ap-south-1')
+            subparser.add_argument('--dry-run', action='store_true', help="only print the diff")
+            subparser.add_argument('--reboot', action='store_true', help="reboot instances with pending changes")
+        if name == 'bench':
+            subparser.add_argument('--host', default='127.0.0.1')
+            subparser.add_argument('--port', type=int, default=3306)
+            subparser.add_argument('--user', default='root')
+            subparser.add_argument('--password', default='')
+            subparser.add_argument('--database', default='accounts')
+            subparser.add_argument('--threads', type=int, default=8)
+            subparser.add_argument('--duration', type=int, default=20, help="seconds per run")
+            subparser.add_argument('--keep', action='store_true', help="keep the tuned values afterwards")
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        for name, value in compute_parameters(args.instance_class, args.profile, args.storage_iops).items():
+            print(f"{name} = {value}")
+    elif args.command == 'apply':
+        apply_tuning_profile(args.parameter_group, args.instance_class, args.profile, args.region, args.storage_iops,
+                             args.dry_run, args.reboot)
+    else:
+        connection_args = {'host': args.host, 'port': args.port, 'user': args.user, 'password': args.password,
+                           'database': args.database}
+        before = run_query_benchmark(connection_args, args.threads, args.duration)
+        previous = set_global_parameters(connection_args,
+                                         compute_parameters(args.instance_class, args.profile, args.storage_iops))
+        after = run_query_benchmark(connection_args, args.threads, args.duration)
+        compare_benchmarks(before, after, args.duration)
+        if not args.keep:
+            set_global_parameters(connection_args, previous)
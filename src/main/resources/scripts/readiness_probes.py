@@ -0,0 +1,251 @@
+import argparse
+import socket
+import ssl
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import pymysql
+
+from properties_file import read_properties
+
+# Data-plane readiness probes for the backend services. The creators only wait
+# for the control-plane status ('available', 'RUNNING'); these check that the
+# endpoints actually accept connections at protocol level:
+#   MySQL     - handshake + login + SELECT 1
+#   Memcached - version and stats commands
+#   RabbitMQ  - AMQP 0-9-1 connection open (TLS on 5671 / amqps://)
+# Run directly to check the endpoints in an application.properties file.
+
+DEFAULT_PROPERTIES_FILE = 'src/main/resources/application.properties'
+CONNECT_TIMEOUT = 5
+
+
+def probe_mysql(host, port, username, password, database):
+    start = time.perf_counter()
+    connection = pymysql.connect(host=host, port=port, user=username, password=password, database=database,
+                                 connect_timeout=CONNECT_TIMEOUT)
+    connected = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        version = connection.get_server_info()
+    finally:
+        connection.close()
+    end = time.perf_counter()
+    return {
+        'connect_ms': (connected - start) * 1000,
+        'query_ms': (end - connected) * 1000,
+        'detail': f"MySQL {version}"
+    }
+
+
+def _memcached_command(sock, command, terminator):
+    sock.sendall(command)
+    data = b''
+    while not data.endswith(terminator):
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError("memcached closed the connection")
+        data += chunk
+        if data.startswith((b'ERROR', b'SERVER_ERROR', b'CLIENT_ERROR')):
+            raise ConnectionError(data.decode(errors='replace').strip())
+    return data
+
+
+def probe_memcached(host, port):
+    start = time.perf_counter()
+    with socket.create_connection((host, port), timeout=CONNECT_TIMEOUT) as sock:
+        connected = time.perf_counter()
+        version = _memcached_command(sock, b'version\r\n', b'\r\n').decode().strip()
+        stats = _memcached_command(sock, b'stats\r\n', b'END\r\n').decode()
+    end = time.perf_counter()
+    stats = dict(line.split(' ')[1:3] for line in stats.splitlines() if line.startswith('STAT '))
+    return {
+        'connect_ms': (connected - start) * 1000,
+        'query_ms': (end - connected) * 1000,
+        'detail': f"{version}, {stats.get('curr_connections', '?')} connections, uptime {stats.get('uptime', '?')}s"
+    }
+
+
+def _amqp_shortstr(value):
+    value = value.encode()
+    return struct.pack('B', len(value)) + value
+
+
+def _amqp_longstr(value):
+    return struct.pack('>I', len(value)) + value
+
+
+def _amqp_send_method(sock, class_id, method_id, arguments):
+    payload = struct.pack('>HH', class_id, method_id) + arguments
+    sock.sendall(struct.pack('>BHI', 1, 0, len(payload)) + payload + b'\xce')
+
+
+def _amqp_recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("broker closed the connection")
+        data += chunk
+    return data
+
+
+def _amqp_recv_method(sock):
+    while True:
+        frame_type, channel, size = struct.unpack('>BHI', _amqp_recv_exact(sock, 7))
+        payload = _amqp_recv_exact(sock, size + 1)[:-1]
+        if frame_type == 8:
+            continue  # heartbeat
+        if frame_type != 1:
+            raise ConnectionError(f"unexpected AMQP frame type {frame_type}")
+        class_id, method_id = struct.unpack('>HH', payload[:4])
+        if (class_id, method_id) == (10, 50):
+            reply_code = struct.unpack('>H', payload[4:6])[0]
+            reply_text = payload[7:7 + payload[6]].decode(errors='replace')
+            raise ConnectionError(f"broker closed the connection: {reply_code} {reply_text}")
+        return class_id, method_id, payload[4:]
+
+
+def _amqp_expect(sock, class_id, method_id):
+    received = _amqp_recv_method(sock)
+    if received[:2] != (class_id, method_id):
+        raise ConnectionError(f"expected AMQP method {class_id}.{method_id}, got {received[0]}.{received[1]}")
+    return received[2]
+
+
+def probe_amqp(host, port, username, password, use_tls=True, virtual_host='/'):
+    start = time.perf_counter()
+    sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+    try:
+        if use_tls:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        connected = time.perf_counter()
+        sock.sendall(b'AMQP\x00\x00\x09\x01')
+
+        # Connection.Start -> Start-Ok (PLAIN auth)
+        _amqp_expect(sock, 10, 10)
+        credentials = f"\0{username}\0{password}".encode()
+        _amqp_send_method(sock, 10, 11, struct.pack('>I', 0) + _amqp_shortstr('PLAIN')
+                          + _amqp_longstr(credentials) + _amqp_shortstr('en_US'))
+
+        # Connection.Tune -> Tune-Ok, heartbeats disabled for the probe
+        channel_max, frame_max, heartbeat = struct.unpack('>HIH', _amqp_expect(sock, 10, 30)[:8])
+        _amqp_send_method(sock, 10, 31, struct.pack('>HIH', channel_max, frame_max, 0))
+
+        # Connection.Open -> Open-Ok
+        _amqp_send_method(sock, 10, 40, _amqp_shortstr(virtual_host) + _amqp_shortstr('') + b'\x00')
+        _amqp_expect(sock, 10, 41)
+        opened = time.perf_counter()
+
+        # Connection.Close -> Close-Ok
+        _amqp_send_method(sock, 10, 50, struct.pack('>H', 200) + _amqp_shortstr('OK') + struct.pack('>HH', 0, 0))
+        _amqp_expect(sock, 10, 51)
+    finally:
+        sock.close()
+    return {
+        'connect_ms': (connected - start) * 1000,
+        'query_ms': (opened - connected) * 1000,
+        'detail': f"AMQP connection opened on vhost {virtual_host}"
+    }
+
+
+def probes_from_properties(properties):
+    # Builds {name: (probe function, args)} from the endpoints that
+    # update_application_properties.py writes into application.properties
+    probes = {}
+    jdbc_url = urlparse(properties['jdbc.url'][len('jdbc:'):])
+    probes['mysql'] = (probe_mysql, (jdbc_url.hostname, jdbc_url.port or 3306, properties['jdbc.username'],
+                                     properties['jdbc.password'], jdbc_url.path.lstrip('/')))
+    probes['memcached'] = (probe_memcached, (properties['memcached.active.host'],
+                                             int(properties['memcached.active.port'])))
+    # The standby host defaults to a loopback placeholder until a standby pool exists
+    if properties.get('memcached.standBy.host') and not properties['memcached.standBy.host'].startswith('127.'):
+        probes['memcached-standby'] = (probe_memcached, (properties['memcached.standBy.host'],
+                                                         int(properties['memcached.standBy.port'])))
+
+    address = properties['rabbitmq.address']
+    if '://' in address:
+        amqp_url = urlparse(address)
+        use_tls = amqp_url.scheme == 'amqps'
+        host, port = amqp_url.hostname, amqp_url.port or (5671 if use_tls else 5672)
+    else:
+        host, port = address, int(properties.get('rabbitmq.port', 5672))
+        use_tls = port == 5671
+    probes['rabbitmq'] = (probe_amqp, (host, port, properties['rabbitmq.username'],
+                                       properties['rabbitmq.password'], use_tls))
+    return probes
+
+
+def _run_probe(name, probe, args):
+    try:
+        result = probe(*args)
+        result.update({'name': name, 'ok': True})
+    except Exception as e:
+        result = {'name': name, 'ok': False, 'detail': f"{type(e).__name__}: {e}"}
+    return result
+
+
+def run_probes(probes):
+    # Runs all probes in parallel and returns one result dict per probe
+    with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+        futures = [executor.submit(_run_probe, name, probe, args) for name, (probe, args) in probes.items()]
+        return [future.result() for future in futures]
+
+
+def print_results(results):
+    for result in results:
+        status = 'OK  ' if result['ok'] else 'FAIL'
+        if result['ok']:
+            print(f"[{status}] {result['name']:<18} connect {result['connect_ms']:7.1f} ms, "
+                  f"protocol {result['query_ms']:7.1f} ms - {result['detail']}")
+        else:
+            print(f"[{status}] {result['name']:<18} {result['detail']}")
+
+
+def wait_until_ready(probes, timeout=600, interval=10):
+    # Gate for the orchestration: retries the failing probes until all pass or
+    # the timeout expires. Returns True when every endpoint is ready.
+    deadline = time.time() + timeout
+    pending = dict(probes)
+    while True:
+        results = run_probes(pending)
+        print_results(results)
+        for result in results:
+            if result['ok']:
+                pending.pop(result['name'])
+        if not pending:
+            print("All endpoints are ready.")
+            return True
+        if time.time() >= deadline:
+            print(f"Endpoints not ready after {timeout}s: {', '.join(pending)}")
+            return False
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Protocol-level health check of the vprofile backend endpoints")
+    parser.add_argument('--properties', default=DEFAULT_PROPERTIES_FILE,
+                        help="application.properties with the endpoints to probe")
+    parser.add_argument('--only', nargs='+', help="probe only these services (mysql, memcached, rabbitmq, ...)")
+    parser.add_argument('--wait', type=int, default=0, help="retry for up to this many seconds until ready")
+    parser.add_argument('--interval', type=int, default=10, help="seconds between retries with --wait")
+    args = parser.parse_args()
+
+    probes = probes_from_properties(read_properties(args.properties))
+    if args.only:
+        selected = {name: probe for name, probe in probes.items() if name in args.only}
+        if not selected:
+            raise SystemExit(f"No probes match --only {' '.join(args.only)}; "
+                             f"valid service names: {', '.join(probes) or 'none configured'}")
+        probes = selected
+    if args.wait:
+        ready = wait_until_ready(probes, args.wait, args.interval)
+    else:
+        results = run_probes(probes)
+        print_results(results)
+        ready = all(result['ok'] for result in results)
+    raise SystemExit(0 if ready else 1)
@@ -0,0 +1,106 @@
+import boto3
+import time
+
+# Publishes application properties to a running Beanstalk environment instead
+# of baking them into application.properties. Spring's property placeholder
+# resolves system properties and environment variables before the bundled
+# file, so the values set here override the ones in the WAR and only need a
+# configuration update of the environment, not a rebuild and redeploy.
+
+ENV_PROPERTIES_NAMESPACE = 'aws:elasticbeanstalk:application:environment'
+ENV_SECRETS_NAMESPACE = 'aws:elasticbeanstalk:application:environmentsecrets'
+SECRET_PROPERTIES = ('jdbc.password', 'rabbitmq.password')
+
+
+def get_environment_options(eb, app_name, env_name, namespace):
+    settings = eb.describe_configuration_settings(ApplicationName=app_name,
+                                                  EnvironmentName=env_name)['ConfigurationSettings'][0]
+    return {option['OptionName']: option.get('Value')
+            for option in settings['OptionSettings'] if option['Namespace'] == namespace}
+
+
+def wait_for_environment_ready(eb, env_name):
+    while True:
+        env_status = eb.describe_environments(EnvironmentNames=[env_name])['Environments'][0]['Status']
+        print(f"Current Environment Status: {env_status}")
+        if env_status == "Ready":
+            break
+        time.sleep(15)
+
+
+def apply_environment_options(eb, app_name, env_name, option_settings):
+    # Config-only update: no VersionLabel, so the running WAR is kept
+    eb.update_environment(ApplicationName=app_name, EnvironmentName=env_name, OptionSettings=option_settings)
+    print(f"Applied {len(option_settings)} option(s) to Beanstalk environment {env_name}.")
+    wait_for_environment_ready(eb, env_name)
+
+
+def publish_environment_properties(app_name, env_name, properties, region):
+    # Sets every property as a Beanstalk environment property
+    eb = boto3.client('elasticbeanstalk', region_name=region)
+    current = get_environment_options(eb, app_name, env_name, ENV_PROPERTIES_NAMESPACE)
+    option_settings = [
+        {'Namespace': ENV_PROPERTIES_NAMESPACE, 'OptionName': key, 'Value': str(value)}
+        for key, value in properties.items() if current.get(key) != str(value)
+    ]
+    if not option_settings:
+        print(f"Beanstalk environment {env_name} is already up to date.")
+        return []
+    apply_environment_options(eb, app_name, env_name, option_settings)
+    return [option['OptionName'] for option in option_settings]
+
+
+def put_ssm_parameters(parameter_prefix, properties, region):
+    # Stores properties under parameter_prefix (passwords as SecureString) and
+    # returns {property: parameter ARN, ...} plus the list of changed properties
+    ssm = boto3.client('ssm', region_name=region)
+    names = {key: f"{parameter_prefix}/{key}" for key in properties}
+
+    current = {}
+    name_list = list(names.values())
+    for index in range(0, len(name_list), 10):
+        response = ssm.get_parameters(Names=name_list[index:index + 10], WithDecryption=True)
+        current.update({parameter['Name']: parameter for parameter in response['Parameters']})
+
+    changed = []
+    arns = {}
+    for key, value in properties.items():
+        name = names[key]
+        if name in current and current[name]['Value'] == str(value):
+            arns[key] = current[name]['ARN']
+            continue
+        ssm.put_parameter(
+            Name=name,
+            Value=str(value),
+            Type='SecureString' if key in SECRET_PROPERTIES else 'String',
+            Overwrite=True
+        )
+        arns[key] = ssm.get_parameter(Name=name)['Parameter']['ARN']
+        changed.append(key)
+        print(f"Updated SSM parameter {name}")
+    return arns, changed
+
+
+def publish_ssm_parameters(app_name, env_name, parameter_prefix, properties, region):
+    # Stores properties in SSM Parameter Store and references them from the
+    # environment as environment secrets, which Beanstalk resolves at startup.
+    # The instance profile needs ssm:GetParameters on parameter_prefix.
+    arns, changed = put_ssm_parameters(parameter_prefix, properties, region)
+
+    eb = boto3.client('elasticbeanstalk', region_name=region)
+    current = get_environment_options(eb, app_name, env_name, ENV_SECRETS_NAMESPACE)
+    option_settings = [
+        {'Namespace': ENV_SECRETS_NAMESPACE, 'OptionName': key, 'Value': arn}
+        for key, arn in arns.items() if current.get(key) != arn
+    ]
+    if not option_settings and not changed:
+        print(f"SSM parameters and Beanstalk environment {env_name} are already up to date.")
+        return []
+    if not option_settings:
+        # Secrets are only read when the instances restart the application
+        eb.restart_app_server(EnvironmentName=env_name)
+        print(f"Restarted app server of Beanstalk environment {env_name} to pick up new parameter values.")
+        wait_for_environment_ready(eb, env_name)
+    else:
+        apply_environment_options(eb, app_name, env_name, option_settings)
+    return changed
@@ -0,0 +1,172 @@
+import boto3
+import json
+import os
+import secrets
+import threading
+import time
+
+# Shared Secrets Manager access for the provisioning and deploy scripts.
+# Secrets are cached in-process for SECRETS_CACHE_TTL seconds and, when
+# SECRETS_CACHE_KEY holds a Fernet key and the cryptography package is
+# installed, in an encrypted file so later runs can skip the fetch. Entries
+# loaded from disk are checked against the AWSCURRENT version reported by
+# ListSecrets, so a rotated secret is always fetched again.
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+SECRETS_CACHE_TTL = int(os.environ.get("SECRETS_CACHE_TTL", "900"))
+SECRETS_CACHE_FILE = os.environ.get("SECRETS_CACHE_FILE",
+                                    os.path.join(os.path.expanduser("~"), ".vprofile", "secrets_cache.enc"))
+SECRETS_CACHE_KEY = os.environ.get("SECRETS_CACHE_KEY")
+PASSWORD_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*+,-./:;<=>?@[]^_`{|}~'
+BATCH_SIZE = 20
+
+# secret name -> {'secret': dict, 'version_id': str, 'expires_at': float, 'verified': bool}
+_cache = {}
+_cache_lock = threading.Lock()
+_disk_loaded = False
+
+
+def _client(region):
+    return boto3.session.Session().client('secretsmanager', region_name=region)
+
+
+def _fernet():
+    if not SECRETS_CACHE_KEY:
+        return None
+    if Fernet is None:
+        print("cryptography is not installed, on-disk secrets cache disabled.")
+        return None
+    return Fernet(SECRETS_CACHE_KEY.encode())
+
+
+def _load_disk_cache():
+    global _disk_loaded
+    if _disk_loaded:
+        return
+    _disk_loaded = True
+    fernet = _fernet()
+    if not fernet or not os.path.exists(SECRETS_CACHE_FILE):
+        return
+    try:
+        with open(SECRETS_CACHE_FILE, 'rb') as file:
+            entries = json.loads(fernet.decrypt(file.read()))
+    except (InvalidToken, ValueError) as e:
+        print(f"Ignoring unreadable secrets cache {SECRETS_CACHE_FILE}: {e}")
+        return
+    now = time.time()
+    for name, entry in entries.items():
+        if entry['expires_at'] > now and name not in _cache:
+            entry['verified'] = False
+            _cache[name] = entry
+
+
+def _save_disk_cache():
+    fernet = _fernet()
+    if not fernet:
+        return
+    now = time.time()
+    entries = {name: {key: value for key, value in entry.items() if key != 'verified'}
+               for name, entry in _cache.items() if entry['expires_at'] > now}
+    os.makedirs(os.path.dirname(SECRETS_CACHE_FILE), exist_ok=True)
+    temp_path = f"{SECRETS_CACHE_FILE}.tmp"
+    with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as file:
+        file.write(fernet.encrypt(json.dumps(entries).encode()))
+    os.replace(temp_path, SECRETS_CACHE_FILE)
+
+
+def _verify_versions(client, names):
+    # One ListSecrets call checks every disk-cached entry for rotation
+    response = client.list_secrets(Filters=[{'Key': 'name', 'Values': names}])
+    current_versions = {}
+    for entry in response['SecretList']:
+        for version_id, stages in entry.get('SecretVersionsToStages', {}).items():
+            if 'AWSCURRENT' in stages:
+                current_versions[entry['Name']] = version_id
+    for name in names:
+        if current_versions.get(name) == _cache[name]['version_id']:
+            _cache[name]['verified'] = True
+        else:
+            print(f"Secret {name} was rotated, refreshing cached value.")
+            del _cache[name]
+
+
+def invalidate(secret_name=None):
+    with _cache_lock:
+        if secret_name is None:
+            _cache.clear()
+        else:
+            _cache.pop(secret_name, None)
+        _save_disk_cache()
+
+
+def get_secrets(secret_names, region, ttl=SECRETS_CACHE_TTL):
+    # Returns {name: secret dict or None}, fetching all cache misses with
+    # BatchGetSecretValue (up to 20 secrets per call).
+    with _cache_lock:
+        _load_disk_cache()
+        client = _client(region)
+        now = time.time()
+        for name in secret_names:
+            if name in _cache and _cache[name]['expires_at'] <= now:
+                del _cache[name]
+
+        unverified = [name for name in secret_names if name in _cache and not _cache[name]['verified']]
+        if unverified:
+            _verify_versions(client, unverified)
+
+        missing = [name for name in dict.fromkeys(secret_names) if name not in _cache]
+        results = {name: _cache[name]['secret'] for name in secret_names if name in _cache}
+        for name in results:
+            print(f"Using cached secret {name}.")
+
+        for index in range(0, len(missing), BATCH_SIZE):
+            response = client.batch_get_secret_value(SecretIdList=missing[index:index + BATCH_SIZE])
+            for value in response['SecretValues']:
+                secret = json.loads(value['SecretString'])
+                _cache[value['Name']] = {
+                    'secret': secret,
+                    'version_id': value['VersionId'],
+                    'expires_at': now + ttl,
+                    'verified': True
+                }
+                results[value['Name']] = secret
+                print(f"Fetched secret {value['Name']} from AWS Secrets Manager.")
+            for error in response.get('Errors', []):
+                if error['ErrorCode'] != 'ResourceNotFoundException':
+                    raise Exception(f"Failed to fetch secret {error['SecretId']}: {error['Message']}")
+                print(f"Secret {error['SecretId']} not found.")
+
+        if missing:
+            _save_disk_cache()
+        return {name: results.get(name) for name in secret_names}
+
+
+def get_secret(secret_name, region):
+    return get_secrets([secret_name], region)[secret_name]
+
+
+def get_or_create_secret(secret_name, region, description):
+    secret = get_secret(secret_name, region)
+    if secret is not None:
+        print(f"Secret {secret_name} already exists.")
+        return secret
+
+    # Generate a secure password
+    password = ''.join(secrets.choice(PASSWORD_ALPHABET) for i in range(16))
+    secret = {
+        "username": "admin",
+        "password": password
+    }
+    # Store the secret in AWS Secrets Manager
+    _client(region).create_secret(
+        Name=secret_name,
+        Description=description,
+        SecretString=json.dumps(secret)
+    )
+    invalidate(secret_name)
+    print(f"Stored new secret {secret_name} in AWS Secrets Manager.")
+    return secret
@@ -0,0 +1,303 @@
+import argparse
+import base64
+import csv
+import datetime
+import io
+import json
+import os
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pymysql.converters import escape_string
+
+from db_export import CHUNK_HEADER, MANIFEST_NAME, MANIFEST_VERSION
+from dump_storage import COMPRESSION_SUFFIXES, CompressedWriter, is_s3, join_location, write_bytes
+from golden_snapshot import DEFAULT_SQL_FILE
+from login_load_test import USER_COLUMNS
+from vpc_seed_loader import iter_statements
+
+# Synthetic accounts data for load tests: millions of user, role and user_role
+# rows consistent with the schema in db_backup.sql.
+#
+#   usernames - first.last<id>, unique because the id is part of the name
+#   emails    - <username>@<domain>, unique for the same reason
+#   passwords - BCrypt-shaped hashes ($2a$11$ + 53 characters of the BCrypt
+#               alphabet) of no particular password
+#   nulls     - like the app's data: most accounts only ever set username,
+#               email and password at registration (--profile-ratio complete
+#               their profile), and in a completed profile the secondary
+#               fields are often empty
+#   roles     - every user has ROLE_USER, --admin-ratio also ROLE_ADMIN
+#
+# Rows are generated a column at a time for a whole chunk (random.choices with
+# k=rows, one randbytes call for all password hashes) rather than field by
+# field, and chunks are generated by --workers processes, each seeded from
+# --seed and the chunk number so the output is reproducible.
+#
+#   --format sql - a db_export.py export: schema files from db_backup.sql and
+#                  chunks of multi-row INSERTs with manifest.json, loaded in
+#                  parallel with `db_export.py load` or by create-rds-db.py
+#                  (dump_manifest)
+#   --format csv - one CSV file per chunk and load_data.sql with the schema and
+#                  the LOAD DATA LOCAL INFILE statements:
+#                  cd <output> && mysql --local-infile=1 accounts < load_data.sql
+#                  LOAD DATA LOCAL reads files next to the client, so CSV
+#                  output has to be a local directory
+
+INSERT_ROWS = 1000  # rows per INSERT statement
+ROLES = ['ROLE_USER', 'ROLE_ADMIN']
+TABLES = ['role', 'user', 'user_role']
+PASSWORD_PREFIX = '$2a$11$'
+BCRYPT_TRANSLATION = bytes.maketrans(b'+/', b'./')
+FIRST_NAMES = ['aarav', 'aditi', 'amit', 'ananya', 'arjun', 'deepa', 'divya', 'farhan', 'gaurav', 'isha', 'james',
+               'kavya', 'kiran', 'maria', 'meera', 'mohan', 'neha', 'nikhil', 'olivia', 'pooja', 'priya', 'rahul',
+               'rajesh', 'riya', 'rohan', 'sanjay', 'sara', 'shreya', 'sneha', 'suresh', 'tanvi', 'vikram', 'wei',
+               'yusuf', 'zara']
+LAST_NAMES = ['agarwal', 'bose', 'chopra', 'das', 'deshpande', 'fernandes', 'gupta', 'iyer', 'jain', 'joshi',
+              'kapoor', 'khan', 'kulkarni', 'menon', 'mehta', 'nair', 'patel', 'pillai', 'rao', 'reddy', 'sharma',
+              'singh', 'smith', 'thomas', 'verma', 'wang']
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.com', 'outlook.com', 'hotmail.com', 'example.com', 'hkhinfo.com']
+GENDERS = ['Male', 'Female']
+MARITAL_STATUSES = ['Single', 'Married', 'Married', 'Divorced', 'Widowed']
+CITIES = ['Pune', 'Mumbai', 'Bengaluru', 'Hyderabad', 'Chennai', 'Delhi', 'Kolkata', 'Ahmedabad', 'Jaipur', 'Kochi']
+STREETS = ['MG Road', 'FC Road', 'Park Street', 'Linking Road', 'Brigade Road', 'Anna Salai', 'Ring Road',
+           'Station Road', 'Church Street', 'Nehru Nagar']
+OCCUPATIONS = ['Software Engineer', 'DevOps Engineer', 'Data Analyst', 'Teacher', 'Accountant', 'Doctor', 'Nurse',
+               'Architect', 'Consultant', 'Designer', 'Sales Manager', 'Student']
+SKILLS = ['Java', 'Python', 'AWS', 'Docker', 'Kubernetes', 'Jenkins', 'MySQL', 'Linux', 'Terraform', 'Ansible',
+          'Spring', 'React']
+NATIONALITIES = ['Indian', 'Indian', 'Indian', 'American', 'British', 'Canadian', 'Australian']
+LANGUAGES = ['English', 'Hindi', 'Marathi', 'Tamil', 'Telugu', 'Kannada', 'Bengali']
+# Chance that a column is NULL in a completed profile
+PROFILE_NULL_RATES = {
+    'profileImg': 0.4, 'profileImgPath': 0.4, 'dateOfBirth': 0.05, 'fatherName': 0.2, 'motherName': 0.25,
+    'gender': 0.02, 'maritalStatus': 0.1, 'permanentAddress': 0.05, 'tempAddress': 0.6, 'primaryOccupation': 0.1,
+    'secondaryOccupation': 0.8, 'skills': 0.3, 'phoneNumber': 0.05, 'secondaryPhoneNumber': 0.7,
+    'nationality': 0.05, 'language': 0.1, 'workingExperience': 0.3
+}
+BIRTH_DATES = (datetime.date(1960, 1, 1).toordinal(), datetime.date(2005, 12, 31).toordinal())
+CSV_NULL = '\\N'
+
+
+def schema_statements(sql_file_path=DEFAULT_SQL_FILE):
+    # CREATE TABLE statements of the tables in the dump, without the dump's
+    # AUTO_INCREMENT counters
+    statements = {}
+    with open(sql_file_path) as file:
+        for statement in iter_statements(file):
+            match = re.match(r'\s*CREATE TABLE `(\w+)`', statement)
+            if match:
+                statements[match.group(1)] = re.sub(r' AUTO_INCREMENT=\d+', '', statement.strip())
+    return statements
+
+
+def password_hashes(rng, count):
+    # 42 random bytes encode to 56 base64 characters without padding, so one
+    # encoding of all the bytes splits into per-hash slices; BCrypt uses ./
+    # for +/
+    encoded = base64.b64encode(rng.randbytes(42 * count)).translate(BCRYPT_TRANSLATION).decode()
+    return [PASSWORD_PREFIX + encoded[offset:offset + 53] for offset in range(0, 56 * count, 56)]
+
+
+def with_nulls(rng, values, completed, null_rate):
+    return [value if done and rng.random() >= null_rate else None
+            for value, done in zip(values, completed)]
+
+
+def generate_users(rng, first_id, count, profile_ratio):
+    # Returns the user rows of ids first_id .. first_id + count - 1 as columns
+    # in USER_COLUMNS order
+    ids = list(range(first_id, first_id + count))
+    first_names = rng.choices(FIRST_NAMES, k=count)
+    last_names = rng.choices(LAST_NAMES, k=count)
+    usernames = [f"{first}.{last}{user_id}" for first, last, user_id in zip(first_names, last_names, ids)]
+    emails = [f"{username}@{domain}" for username, domain in zip(usernames, rng.choices(EMAIL_DOMAINS, k=count))]
+    completed = [rng.random() < profile_ratio for _ in ids]
+    images = [f"avatar{number}.jpg" for number in rng.choices(range(1, 1000), k=count)]
+    streets = [f"{number} {street}, {city}" for number, street, city in
+               zip(rng.choices(range(1, 500), k=count), rng.choices(STREETS, k=count), rng.choices(CITIES, k=count))]
+    profile = {
+        'profileImg': images,
+        'profileImgPath': [f"/resources/Images/{image}" for image in images],
+        'dateOfBirth': [datetime.date.fromordinal(day).isoformat() for day in
+                        rng.choices(range(*BIRTH_DATES), k=count)],
+        'fatherName': [f"{first.title()} {last.title()}" for first, last in
+                       zip(rng.choices(FIRST_NAMES, k=count), last_names)],
+        'motherName': [f"{first.title()} {last.title()}" for first, last in
+                       zip(rng.choices(FIRST_NAMES, k=count), last_names)],
+        'gender': rng.choices(GENDERS, k=count),
+        'maritalStatus': rng.choices(MARITAL_STATUSES, k=count),
+        'permanentAddress': streets,
+        'tempAddress': streets[1:] + streets[:1],
+        'primaryOccupation': rng.choices(OCCUPATIONS, k=count),
+        'secondaryOccupation': rng.choices(OCCUPATIONS, k=count),
+        'skills': [', '.join(rng.sample(SKILLS, 3)) for _ in ids],
+        'phoneNumber': [str(number) for number in rng.choices(range(7000000000, 9999999999), k=count)],
+        'secondaryPhoneNumber': [str(number) for number in rng.choices(range(7000000000, 9999999999), k=count)],
+        'nationality': rng.choices(NATIONALITIES, k=count),
+        'language': rng.choices(LANGUAGES, k=count),
+        'workingExperience': [f"{years} years" for years in rng.choices(range(0, 35), k=count)]
+    }
+    columns = {'id': ids, 'username': usernames, 'userEmail': emails, 'password': password_hashes(rng, count)}
+    for column, values in profile.items():
+        columns[column] = with_nulls(rng, values, completed, PROFILE_NULL_RATES[column])
+    return [columns[column] for column in USER_COLUMNS]
+
+
+def generate_user_roles(rng, first_id, count, admin_ratio):
+    user_ids = []
+    role_ids = []
+    for user_id in range(first_id, first_id + count):
+        user_ids.append(user_id)
+        role_ids.append(1)
+        if rng.random() < admin_ratio:
+            user_ids.append(user_id)
+            role_ids.append(2)
+    return [user_ids, role_ids]
+
+
+def sql_value(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, int):
+        return str(value)
+    return f"'{escape_string(value)}'"
+
+
+def sql_chunk(table, column_names, columns):
+    prefix = f"INSERT INTO `{table}` ({', '.join(f'`{column}`' for column in column_names)}) VALUES\n"
+    rows = [f"({','.join(map(sql_value, row))})" for row in zip(*columns)]
+    statements = [prefix + ',\n'.join(rows[start:start + INSERT_ROWS]) + ';\n'
+                  for start in range(0, len(rows), INSERT_ROWS)]
+    return CHUNK_HEADER + ''.join(statements)
+
+
+def csv_chunk(columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerows([CSV_NULL if value is None else value for value in row] for row in zip(*columns))
+    return buffer.getvalue()
+
+
+def write_chunk(output, table, index, first_id, count, options):
+    # Runs in a worker process; returns the manifest entry of the chunk
+    rng = random.Random(f"{options['seed']}-{table}-{index}")
+    if table == 'role':
+        column_names = ['id', 'name']
+        columns = [list(range(1, len(ROLES) + 1)), ROLES]
+    elif table == 'user':
+        column_names = USER_COLUMNS
+        columns = generate_users(rng, first_id, count, options['profile_ratio'])
+    else:
+        column_names = ['user_id', 'role_id']
+        columns = generate_user_roles(rng, first_id, count, options['admin_ratio'])
+    if options['format'] == 'sql':
+        name = f"{table}.{index:05d}.sql{COMPRESSION_SUFFIXES[options['compression']]}"
+        content = sql_chunk(table, column_names, columns)
+        compression = options['compression']
+    else:
+        name = f"{table}.{index:05d}.csv"
+        content = csv_chunk(columns)
+        compression = 'none'
+    writer = CompressedWriter(join_location(output, name), compression, options['region'])
+    try:
+        writer.write(content.encode())
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return {'file': name, 'rows': len(columns[0]), 'bytes': writer.size,
+            'range': [first_id, first_id + count] if table != 'role' else None, 'columns': column_names}
+
+
+def load_data_script(manifest, schemas):
+    # Schema and LOAD DATA statements for the mysql client, run from the
+    # output directory
+    lines = ["SET NAMES utf8mb4;", "SET foreign_key_checks = 0;", "SET unique_checks = 0;"]
+    for table in manifest['tables']:
+        lines += [f"DROP TABLE IF EXISTS `{table['name']}`;", f"{schemas[table['name']]};"]
+    for table in manifest['tables']:
+        for chunk in table['chunks']:
+            columns = ', '.join(f"`{column}`" for column in chunk['columns'])
+            lines.append(f"LOAD DATA LOCAL INFILE '{chunk['file']}' INTO TABLE `{table['name']}` CHARACTER SET utf8mb4 "
+                         f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' ({columns});")
+    return '\n'.join(lines) + '\n'
+
+
+def generate_dataset(output, users, chunk_rows=100000, data_format='sql', compression='gzip', workers=None,
+                     profile_ratio=0.3, admin_ratio=0.001, seed=1, region=None, sql_file_path=DEFAULT_SQL_FILE):
+    # Writes the chunks and manifest.json (plus load_data.sql for CSV);
+    # returns the manifest
+    if data_format == 'csv' and is_s3(output):
+        raise ValueError("CSV output is loaded with LOAD DATA LOCAL INFILE from a local directory; "
+                         "write it locally or use --format sql for s3://")
+    schemas = schema_statements(sql_file_path)
+    options = {'format': data_format, 'compression': compression, 'profile_ratio': profile_ratio,
+               'admin_ratio': admin_ratio, 'seed': seed, 'region': region}
+    suffix = COMPRESSION_SUFFIXES[compression] if data_format == 'sql' else ''
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {'role': [executor.submit(write_chunk, output, 'role', 0, 1, len(ROLES), options)]}
+        for table in ('user', 'user_role'):
+            futures[table] = [executor.submit(write_chunk, output, table, index, first_id,
+                                              min(chunk_rows, users - first_id + 1), options)
+                              for index, first_id in enumerate(range(1, users + 1, chunk_rows))]
+        tables = []
+        rows = 0
+        for table in TABLES:
+            chunks = []
+            for future in futures[table]:
+                chunks.append(future.result())
+                rows += chunks[-1]['rows']
+                print(f"Generated {chunks[-1]['file']}: {chunks[-1]['rows']} rows "
+                      f"({rows / (time.time() - start):,.0f} rows/s)")
+            tables.append({'name': table, 'schema': f"{table}-schema.sql{suffix}", 'chunks': chunks,
+                           'rows': sum(chunk['rows'] for chunk in chunks)})
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'database': 'accounts',
+        'source': f"synthetic_data.py --users {users} --seed {seed}",
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'compression': compression if data_format == 'sql' else 'none',
+        'tables': tables
+    }
+    if data_format == 'sql':
+        for table in tables:
+            writer = CompressedWriter(join_location(output, table['schema']), compression, region)
+            writer.write((f"SET NAMES utf8mb4;\nSET foreign_key_checks = 0;\nDROP TABLE IF EXISTS `{table['name']}`;\n"
+                          f"{schemas[table['name']]};\n").encode())
+            writer.close()
+    else:
+        write_bytes(join_location(output, 'load_data.sql'), load_data_script(manifest, schemas).encode(), region)
+    write_bytes(join_location(output, MANIFEST_NAME), json.dumps(manifest, indent=2).encode(), region)
+    rows = sum(table['rows'] for table in tables)
+    size = sum(chunk['bytes'] for table in tables for chunk in table['chunks'])
+    elapsed = time.time() - start
+    print(f"Generated {rows:,} rows ({size / 1024 / 1024:,.1f} MiB) in {elapsed:.1f}s "
+          f"({rows / elapsed:,.0f} rows/s) to {output}")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Synthetic user/role/user_role data for load tests")
+    parser.add_argument('--output', required=True, help="directory or s3://bucket/prefix")
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--chunk-rows', type=int, default=100000, help="users per chunk file")
+    parser.add_argument('--format', choices=['sql', 'csv'], default='sql')
+    parser.add_argument('--compression', choices=sorted(COMPRESSION_SUFFIXES), default='gzip',
+                        help="of the SQL chunks; CSV files are written uncompressed for LOAD DATA")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="generator processes")
+    parser.add_argument('--profile-ratio', type=float, default=0.3, help="share of users with a completed profile")
+    parser.add_argument('--admin-ratio', type=float, default=0.001, help="share of users that also have ROLE_ADMIN")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sql-file', default=DEFAULT_SQL_FILE, help="dump the table definitions are taken from")
+    parser.add_argument('--region', default='ap-south-1')
+    args = parser.parse_args()
+    if args.format == 'csv' and is_s3(args.output):
+        parser.error("--format csv needs a local --output directory: LOAD DATA LOCAL INFILE cannot read s3://")
+
+    generate_dataset(args.output, args.users, args.chunk_rows, args.format, args.compression, args.workers,
+                     args.profile_ratio, args.admin_ratio, args.seed, args.region, args.sql_file)
@@ -1,23 +1,16 @@
 import boto3
-import json
+from concurrent.futures import ThreadPoolExecutor
+from properties_file import write_properties
+from secrets_cache import get_secrets
+from runtime_config import publish_environment_properties, publish_ssm_parameters
 
-
-def get_secret(secret_name, region):
-    client = boto3.client('secretsmanager', region_name=region)
-
-    try:
-        # Fetch the secret value
-        secret_response = client.get_secret_value(SecretId=secret_name)
-        secret = json.loads(secret_response['SecretString'])
-        print(f"Fetched secret {secret_name} from AWS Secrets Manager.")
-        return secret
-    except client.exceptions.ResourceNotFoundException:
-        print(f"Secret {secret_name} not found.")
-        return None
+JDBC_URL_OPTIONS = 'useUnicode=true&characterEncoding=UTF-8&zeroDateTimeBehavior=convertToNull'
 
 
+# The lookups below run concurrently from resolve_properties. The default
+# boto3 session is not thread safe, so each one builds its own session.
 def get_rds_endpoint(db_instance_identifier, region):
-    rds = boto3.client('rds', region_name=region)
+    rds = boto3.session.Session().client('rds', region_name=region)
     try:
         response = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)
         endpoint = response['DBInstances'][0]['Endpoint']['Address']
@@ -28,23 +21,46 @@ def get_rds_endpoint(db_instance_identifier, region):
         return None
 
 
-def get_mq_endpoint(broker_name, region):
-    mq = boto3.client('mq', region_name=region)
+def get_rds_replica_endpoints(db_instance_identifier, region):
+    # Endpoints of the available read replicas of the primary
+    rds = boto3.session.Session().client('rds', region_name=region)
+    try:
+        response = rds.describe_db_instances(DBInstanceIdentifier=db_instance_identifier)
+    except rds.exceptions.DBInstanceNotFoundFault:
+        return []
+    replica_ids = response['DBInstances'][0]['ReadReplicaDBInstanceIdentifiers']
+    if not replica_ids:
+        return []
+    replicas = rds.describe_db_instances(Filters=[{'Name': 'db-instance-id', 'Values': replica_ids}])['DBInstances']
+    endpoints = sorted(replica['Endpoint']['Address'] for replica in replicas
+                       if replica['DBInstanceStatus'] == 'available' and replica.get('Endpoint'))
+    if endpoints:
+        print(f"Fetched RDS read replica endpoints: {', '.join(endpoints)}")
+    return endpoints
+
+
+def get_mq_endpoints(broker_name, region):
+    # Every AMQP endpoint of the broker; a CLUSTER_MULTI_AZ broker is reached
+    # through a single load-balanced endpoint, so the first one is used
+    mq = boto3.session.Session().client('mq', region_name=region)
     try:
         response = mq.describe_broker(BrokerId=broker_name)
-        endpoint = response['BrokerInstances'][0]['Endpoints'][0]
-        print(f"Fetched MQ endpoint: {endpoint}")
-        return endpoint
+        endpoints = [endpoint for instance in response['BrokerInstances'] for endpoint in instance['Endpoints']
+                     if endpoint.startswith(('amqp://', 'amqps://'))]
+        print(f"Fetched MQ endpoints: {', '.join(endpoints)}")
+        return endpoints
     except mq.exceptions.NotFoundException:
         print(f"MQ broker {broker_name} not found.")
         return None
 
 
 def get_cache_endpoint(cluster_id, region):
-    elasticache = boto3.client('elasticache', region_name=region)
+    elasticache = boto3.session.Session().client('elasticache', region_name=region)
     try:
         response = elasticache.describe_cache_clusters(CacheClusterId=cluster_id, ShowCacheNodeInfo=True)
-        endpoint = response['CacheClusters'][0]['CacheNodes'][0]['Endpoint']
+        cluster = response['CacheClusters'][0]
+        # The configuration endpoint lets the cluster client discover every node
+        endpoint = cluster.get('ConfigurationEndpoint') or cluster['CacheNodes'][0]['Endpoint']
         print(f"Fetched Cache endpoint: {endpoint['Address']}:{endpoint['Port']}")
         return endpoint
     except elasticache.exceptions.CacheClusterNotFoundFault:
@@ -52,51 +68,91 @@ def get_cache_endpoint(cluster_id, region):
         return None
 
 
-def update_properties_file(file_path, db_instance_identifier, broker_name, cache_cluster_id, region):
-    rds_secret = get_secret('RDSDB_Credentials1', region)
-    mq_secret = get_secret('RabbitMQ_Credentials', region)
+def resolve_properties(db_instance_identifier, broker_name, cache_cluster_id, region):
+    # The lookups are independent, so they are resolved concurrently. Both
+    # secrets come back from a single BatchGetSecretValue call.
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        secrets_future = executor.submit(get_secrets, ['RDSDB_Credentials1', 'RabbitMQ_Credentials'], region)
+        db_endpoint_future = executor.submit(get_rds_endpoint, db_instance_identifier, region)
+        replica_endpoints_future = executor.submit(get_rds_replica_endpoints, db_instance_identifier, region)
+        mq_endpoints_future = executor.submit(get_mq_endpoints, broker_name, region)
+        cache_endpoint_future = executor.submit(get_cache_endpoint, cache_cluster_id, region)
+        standby_endpoint_future = executor.submit(get_cache_endpoint, f"{cache_cluster_id}-standby", region)
+
+    fetched_secrets = secrets_future.result()
+    rds_secret = fetched_secrets['RDSDB_Credentials1']
+    mq_secret = fetched_secrets['RabbitMQ_Credentials']
     if not rds_secret or not mq_secret:
         print("Required secrets not found. Exiting.")
-        return
-
-    db_endpoint = get_rds_endpoint(db_instance_identifier, region)
-    mq_endpoint = get_mq_endpoint(broker_name, region)
-    cache_endpoint = get_cache_endpoint(cache_cluster_id, region)
+        return None
 
-    if not db_endpoint or not mq_endpoint or not cache_endpoint:
+    db_endpoint = db_endpoint_future.result()
+    mq_endpoints = mq_endpoints_future.result()
+    cache_endpoint = cache_endpoint_future.result()
+    if not db_endpoint or not mq_endpoints or not cache_endpoint:
         print("Required components not found. Exiting.")
+        return None
+
+    properties = {
+        'jdbc.url': f"jdbc:mysql://{db_endpoint}:3306/accounts?{JDBC_URL_OPTIONS}",
+        'jdbc.username': rds_secret['username'],
+        'jdbc.password': rds_secret['password'],
+        'memcached.active.host': cache_endpoint['Address'],
+        'memcached.active.port': cache_endpoint['Port'],
+        'rabbitmq.address': mq_endpoints[0],
+        'rabbitmq.username': mq_secret['username'],
+        'rabbitmq.password': mq_secret['password']
+    }
+
+    # Reads are routed to the replicas: the DataSource connects with
+    # jdbc.read.url, a Connector/J replication URL (primary first) that sends
+    # read-only transactions to the replicas. Without replicas it is jdbc.url,
+    # so a removed replica never stays in the file.
+    replica_endpoints = replica_endpoints_future.result()
+    properties['jdbc.read.hosts'] = ','.join(f"{endpoint}:3306" for endpoint in replica_endpoints)
+    properties['jdbc.read.url'] = properties['jdbc.url']
+    if replica_endpoints:
+        properties['jdbc.read.url'] = (f"jdbc:mysql:replication://{db_endpoint}:3306,{properties['jdbc.read.hosts']}"
+                                       f"/accounts?{JDBC_URL_OPTIONS}")
+
+    # The standby pool is optional; without it the standby host is left as is
+    standby_endpoint = standby_endpoint_future.result()
+    if standby_endpoint:
+        properties['memcached.standBy.host'] = standby_endpoint['Address']
+        properties['memcached.standBy.port'] = standby_endpoint['Port']
+    return properties
+
+
+def update_properties_file(file_path, db_instance_identifier, broker_name, cache_cluster_id, region):
+    updates = resolve_properties(db_instance_identifier, broker_name, cache_cluster_id, region)
+    if updates is None:
+        return
+
+    # Only changed keys are rewritten; an unchanged file is left untouched so
+    # it does not dirty the tree and trigger a pipeline run.
+    changed = write_properties(file_path, updates)
+    if changed:
+        print(f"Updated {file_path} with new properties: {', '.join(changed)}")
+    else:
+        print(f"{file_path} is already up to date.")
+
+
+def publish_runtime_properties(mode, app_name, env_name, parameter_prefix, db_instance_identifier, broker_name,
+                               cache_cluster_id, region):
+    # Pushes the values straight to the running environment with a config-only
+    # update, so endpoint or credential changes skip the build and redeploy.
+    updates = resolve_properties(db_instance_identifier, broker_name, cache_cluster_id, region)
+    if updates is None:
         return
 
-    with open(file_path, 'r') as file:
-        properties = file.readlines()
-
-    # Update the properties
-    new_properties = []
-    for line in properties:
-        if line.startswith("jdbc.url"):
-            new_properties.append(
-                f"jdbc.url=jdbc:mysql://{db_endpoint}:3306/accounts?useUnicode=true&characterEncoding=UTF-8&zeroDateTimeBehavior=convertToNull\n")
-        elif line.startswith("jdbc.username"):
-            new_properties.append(f"jdbc.username={rds_secret['username']}\n")
-        elif line.startswith("jdbc.password"):
-            new_properties.append(f"jdbc.password={rds_secret['password']}\n")
-        elif line.startswith("memcached.active.host"):
-            new_properties.append(f"memcached.active.host={cache_endpoint['Address']}\n")
-        elif line.startswith("memcached.active.port"):
-            new_properties.append(f"memcached.active.port={cache_endpoint['Port']}\n")
-        elif line.startswith("rabbitmq.address"):
-            new_properties.append(f"rabbitmq.address={mq_endpoint}\n")
-        elif line.startswith("rabbitmq.username"):
-            new_properties.append(f"rabbitmq.username={mq_secret['username']}\n")
-        elif line.startswith("rabbitmq.password"):
-            new_properties.append(f"rabbitmq.password={mq_secret['password']}\n")
-        else:
-            new_properties.append(line)
-
-    with open(file_path, 'w') as file:
-        file.writelines(new_properties)
-
-    print(f"Updated {file_path} with new properties.")
+    if mode == 'beanstalk':
+        changed = publish_environment_properties(app_name, env_name, updates, region)
+    elif mode == 'ssm':
+        changed = publish_ssm_parameters(app_name, env_name, parameter_prefix, updates, region)
+    else:
+        raise ValueError(f"Unknown publish mode: {mode}")
+    if changed:
+        print(f"Published runtime properties to {env_name}: {', '.join(changed)}")
 
 
 region = 'ap-south-1'
@@ -105,5 +161,18 @@ broker_name = 'dmanup-aws-codecomit-demo-mq-broker'  # Replace with your actual
 cache_cluster_id = 'dmanup-aws-codecomit-demo-elasticache'  # Replace with your actual Cache cluster ID
 file_path = 'D:/devops_articles/aws-code-commit/vprofile-project/src/main/resources/application.properties'
 
-# Update the application properties file
-update_properties_file(file_path, db_instance_identifier, broker_name, cache_cluster_id, region)
+# Where the values go: 'file' rewrites application.properties (needs a commit,
+# build and redeploy), 'beanstalk' sets Beanstalk environment properties and
+# 'ssm' stores them in SSM Parameter Store referenced as environment secrets.
+# Both runtime modes apply with a config-only update of the environment.
+publish_mode = 'file'
+app_name = 'dmanup-aws-codecomit-demo-app'
+env_name = 'dmanup-aws-codecomit-demo-env'
+parameter_prefix = '/vprofile/application'
+
+if publish_mode == 'file':
+    # Update the application properties file
+    update_properties_file(file_path, db_instance_identifier, broker_name, cache_cluster_id, region)
+else:
+    publish_runtime_properties(publish_mode, app_name, env_name, parameter_prefix, db_instance_identifier,
+                               broker_name, cache_cluster_id, region)
@@ -0,0 +1,91 @@
+import re
+import time
+
+import pymysql
+
+from dump_storage import iter_lines, open_input
+
+# Lambda handler that loads a SQL dump from S3 into the RDS instance from
+# inside the VPC; deployed and invoked by vpc_seeding.py. The dump is streamed
+# from S3 in ranged GETs (gunzipped on the fly for .gz keys) and executed
+# statement by statement, so its size is not limited by the function's memory
+# or /tmp. Its duration is not limited by the function timeout either: an
+# invocation stops before the timeout, commits and returns the number of
+# statements done as 'next'; the caller invokes again with it as 'skip'. The
+# skipped statements are read again but not executed, except for the session
+# settings (SET NAMES, FOREIGN_KEY_CHECKS, ...) the rest of the dump relies on.
+#
+# Event: {'bucket', 'key', 'skip', 'host', 'port', 'user', 'password',
+#         'database', 'apply_indexes'}; db_export.py manifests are loaded with
+# one invocation per file.
+
+CONNECT_TIMEOUT = 300
+TIME_MARGIN_MS = 60000  # left for the statement in flight and the commit
+SESSION_SETTING = re.compile(r'\s*(/\*!\d+\s+)?SET\s', re.I)
+
+
+def iter_statements(lines):
+    # mysqldump ends every statement with ';' at the end of a line
+    statement = []
+    for line in lines:
+        stripped = line.strip()
+        if not statement and (not stripped or stripped.startswith('--')):
+            continue
+        statement.append(line)
+        if stripped.endswith(';'):
+            yield ''.join(statement)
+            statement = []
+    if ''.join(statement).strip():
+        yield ''.join(statement)
+
+
+def connect(event):
+    # The instance may still be finishing its start-up when the job runs
+    deadline = time.time() + CONNECT_TIMEOUT
+    while True:
+        try:
+            return pymysql.connect(host=event['host'], port=int(event.get('port', 3306)), user=event['user'],
+                                   password=event['password'], database=event['database'], charset='utf8mb4')
+        except pymysql.err.OperationalError:
+            if time.time() > deadline:
+                raise
+            time.sleep(10)
+
+
+def handler(event, context):
+    # Without a key only the index advisor runs (after a parallel manifest load)
+    connection = connect(event)
+    skip = int(event.get('skip') or 0)
+    index = executed = 0
+    done = True
+    try:
+        with connection.cursor() as cursor:
+            if event.get('key'):
+                stream = open_input(f"s3://{event['bucket']}/{event['key']}")
+                for index, statement in enumerate(iter_statements(iter_lines(stream))):
+                    if index < skip:
+                        if SESSION_SETTING.match(statement):
+                            cursor.execute(statement)
+                        continue
+                    if context is not None and context.get_remaining_time_in_millis() < TIME_MARGIN_MS:
+                        done = False
+                        break
+                    cursor.execute(statement)
+                    executed += 1
+                stream.close()
+                connection.commit()
+                print(f"Executed {executed} statements from s3://{event['bucket']}/{event['key']}"
+                      f"{'' if done else f', continuing at statement {index}'}")
+            cursor.execute("SHOW TABLES")
+            tables = [row[0] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+    indexes = []
+    if done and event.get('apply_indexes') is not None:
+        from index_advisor import advise_indexes
+        db = {'host': event['host'], 'port': int(event.get('port', 3306)), 'user': event['user'],
+              'password': event['password'], 'database': event['database'], 'charset': 'utf8mb4'}
+        suggestions = advise_indexes(db, apply=event['apply_indexes'])
+        indexes = [f"{table}({', '.join(columns)})" for table, columns in suggestions]
+    return {'statements': executed, 'next': None if done else index, 'tables': tables, 'indexes': indexes}
@@ -0,0 +1,267 @@
+import io
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pymysql
+from botocore.config import Config
+
+from db_export import read_manifest, manifest_hash
+from dump_storage import is_s3, join_location, split_s3
+from golden_snapshot import dump_hash
+
+# Seeds the accounts database from inside the VPC instead of opening the RDS
+# instance to the internet. The dump is uploaded to S3 (keyed by its hash, so
+# an unchanged dump is not uploaded again) and a Lambda function attached to
+# the VPC in the backend security group streams it into the database
+# (vpc_seed_loader.handler). The instance stays private, no inbound rule for
+# the caller's IP is needed, and the data moves at in-VPC bandwidth. Dumps
+# that take longer than the function timeout are loaded over several
+# invocations (see vpc_seed_loader).
+#
+# A Lambda function is used rather than a VPC CodeBuild project because the
+# default VPC has no NAT gateway: the function ships with its dependencies
+# (pymysql is pure Python) and reaches S3 through a gateway endpoint, which
+# this module adds to the VPC's route tables when missing.
+
+DUMP_BUCKET = "dmanup-aws-codeartifact-bucket"
+DUMP_PREFIX = "db-dumps"
+FUNCTION_NAME = "dmanup-aws-rds-seed-loader"
+ROLE_NAME = "rds-seed-loader-role"
+LAMBDA_RUNTIME = "python3.12"
+LAMBDA_TIMEOUT = 900
+LAMBDA_MEMORY = 512
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# The handler and the index advisor with the modules it imports
+LOADER_MODULES = ['vpc_seed_loader.py', 'dump_storage.py', 'index_advisor.py', 'login_load_test.py',
+                  'properties_file.py', 'latency_histogram.py']
+
+
+def check_seedable(sql_file_path=None, manifest_location=None, region=None):
+    # The Lambda runtime has no zstandard module, so zstd dumps and exports are
+    # rejected here, before create-rds-db.py creates any resources
+    if manifest_location:
+        if read_manifest(manifest_location, region)[0]['compression'] == 'zstd':
+            raise Exception("The seeding function reads gzip or plain exports; re-export with --compression gzip "
+                            "or use seeding_mode 'public'")
+    elif sql_file_path.endswith('.zst'):
+        raise Exception("The seeding function reads .sql and .sql.gz dumps; recompress the dump with gzip "
+                        "or use seeding_mode 'public'")
+
+
+def upload_dump(sql_file_path, region, bucket=DUMP_BUCKET):
+    # Returns the S3 key of the dump, uploading it if this version is missing.
+    # A dump already in S3 is copied server-side, never through this machine.
+    check_seedable(sql_file_path)
+    s3 = boto3.client('s3', region_name=region)
+    extension = '.sql.gz' if sql_file_path.endswith('.gz') else '.sql'
+    key = f"{DUMP_PREFIX}/{dump_hash(sql_file_path, region)}{extension}"
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        print(f"Dump already in s3://{bucket}/{key}")
+    except s3.exceptions.ClientError:
+        if is_s3(sql_file_path):
+            source_bucket, source_key = split_s3(sql_file_path)
+            s3.copy({'Bucket': source_bucket, 'Key': source_key}, bucket, key)
+        else:
+            s3.upload_file(sql_file_path, bucket, key)
+        print(f"Uploaded {sql_file_path} to s3://{bucket}/{key}")
+    return key
+
+
+def ensure_s3_gateway_endpoint(vpc_id, region):
+    ec2 = boto3.client('ec2', region_name=region)
+    service_name = f"com.amazonaws.{region}.s3"
+    endpoints = ec2.describe_vpc_endpoints(Filters=[
+        {'Name': 'vpc-id', 'Values': [vpc_id]},
+        {'Name': 'service-name', 'Values': [service_name]},
+        {'Name': 'vpc-endpoint-type', 'Values': ['Gateway']}
+    ])['VpcEndpoints']
+    if endpoints:
+        print(f"S3 gateway endpoint {endpoints[0]['VpcEndpointId']} already exists.")
+        return endpoints[0]['VpcEndpointId']
+    route_tables = ec2.describe_route_tables(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['RouteTables']
+    endpoint_id = ec2.create_vpc_endpoint(
+        VpcEndpointType='Gateway',
+        VpcId=vpc_id,
+        ServiceName=service_name,
+        RouteTableIds=[route_table['RouteTableId'] for route_table in route_tables]
+    )['VpcEndpoint']['VpcEndpointId']
+    print(f"Created S3 gateway endpoint {endpoint_id} for VPC {vpc_id}")
+    return endpoint_id
+
+
+def create_loader_role(region, bucket=DUMP_BUCKET):
+    iam = boto3.client('iam', region_name=region)
+    try:
+        iam.create_role(
+            RoleName=ROLE_NAME,
+            AssumeRolePolicyDocument=json.dumps({
+                'Version': '2012-10-17',
+                'Statement': [{
+                    'Effect': 'Allow',
+                    'Principal': {'Service': 'lambda.amazonaws.com'},
+                    'Action': 'sts:AssumeRole'
+                }]
+            })
+        )
+        # VPC network interfaces and CloudWatch logs
+        iam.attach_role_policy(RoleName=ROLE_NAME,
+                               PolicyArn='arn:aws:iam::aws:policy/service-role/AWSLambdaVPCAccessExecutionRole')
+        print(f"Created IAM Role: {ROLE_NAME}")
+    except iam.exceptions.EntityAlreadyExistsException:
+        print(f"IAM Role {ROLE_NAME} already exists.")
+    iam.put_role_policy(
+        RoleName=ROLE_NAME,
+        PolicyName='ReadDatabaseDumps',
+        PolicyDocument=json.dumps({
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Effect': 'Allow',
+                'Action': 's3:GetObject',
+                'Resource': f"arn:aws:s3:::{bucket}/{DUMP_PREFIX}/*"
+            }]
+        })
+    )
+    return iam.get_role(RoleName=ROLE_NAME)['Role']['Arn']
+
+
+def build_loader_package():
+    # Zip of the loader modules and pymysql; boto3 is part of the Lambda runtime
+    buffer = io.BytesIO()
+    pymysql_dir = os.path.dirname(pymysql.__file__)
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+        for module in LOADER_MODULES:
+            package.write(os.path.join(SCRIPTS_DIR, module), module)
+        for root, _, files in os.walk(pymysql_dir):
+            for name in files:
+                if name.endswith('.py'):
+                    path = os.path.join(root, name)
+                    package.write(path, os.path.join('pymysql', os.path.relpath(path, pymysql_dir)))
+    return buffer.getvalue()
+
+
+def deploy_loader_function(role_arn, subnet_ids, security_group_id, region):
+    lambda_client = boto3.client('lambda', region_name=region)
+    package = build_loader_package()
+    vpc_config = {'SubnetIds': subnet_ids, 'SecurityGroupIds': [security_group_id]}
+    try:
+        lambda_client.get_function(FunctionName=FUNCTION_NAME)
+        lambda_client.update_function_code(FunctionName=FUNCTION_NAME, ZipFile=package)
+        lambda_client.get_waiter('function_updated_v2').wait(FunctionName=FUNCTION_NAME)
+        lambda_client.update_function_configuration(FunctionName=FUNCTION_NAME, VpcConfig=vpc_config)
+        lambda_client.get_waiter('function_updated_v2').wait(FunctionName=FUNCTION_NAME)
+        print(f"Updated Lambda function {FUNCTION_NAME}")
+        return
+    except lambda_client.exceptions.ResourceNotFoundException:
+        pass
+
+    # A freshly created role takes a few seconds before Lambda can assume it
+    for attempt in range(6):
+        try:
+            lambda_client.create_function(
+                FunctionName=FUNCTION_NAME,
+                Runtime=LAMBDA_RUNTIME,
+                Role=role_arn,
+                Handler='vpc_seed_loader.handler',
+                Code={'ZipFile': package},
+                Timeout=LAMBDA_TIMEOUT,
+                MemorySize=LAMBDA_MEMORY,
+                VpcConfig=vpc_config,
+                Description="Loads SQL dumps from S3 into the RDS DB from inside the VPC"
+            )
+            break
+        except lambda_client.exceptions.InvalidParameterValueException:
+            if attempt == 5:
+                raise
+            time.sleep(10)
+    # Attaching the VPC network interfaces takes a minute or two
+    lambda_client.get_waiter('function_active_v2').wait(FunctionName=FUNCTION_NAME)
+    print(f"Created Lambda function {FUNCTION_NAME} in the backend security group")
+
+
+def run_loader(bucket, key, endpoint, username, password, db_name, region, apply_indexes=None):
+    # apply_indexes: None skips the index advisor, False only reports. With no
+    # key only the advisor runs. A dump that does not fit in one invocation is
+    # continued from the statement the previous one stopped at.
+    lambda_client = boto3.client('lambda', region_name=region,
+                                 config=Config(read_timeout=LAMBDA_TIMEOUT + 60, retries={'max_attempts': 0}))
+    payload = {'bucket': bucket, 'key': key, 'skip': 0, 'host': endpoint, 'port': 3306, 'user': username,
+               'password': password, 'database': db_name, 'apply_indexes': apply_indexes}
+    start = time.time()
+    statements = 0
+    while True:
+        response = lambda_client.invoke(FunctionName=FUNCTION_NAME, InvocationType='RequestResponse',
+                                        Payload=json.dumps(payload).encode())
+        result = json.loads(response['Payload'].read())
+        if 'FunctionError' in response:
+            raise Exception(f"Seeding job failed for {key}: {result.get('errorMessage', result)}")
+        statements += result['statements']
+        if result.get('next') is None:
+            break
+        if result['next'] <= payload['skip']:
+            raise Exception(f"Seeding job for {key} made no progress at statement {payload['skip']}")
+        print(f"Loaded {statements} statements of s3://{bucket}/{key} so far, continuing")
+        payload['skip'] = result['next']
+    if key:
+        print(f"Loaded s3://{bucket}/{key} in the VPC in {time.time() - start:.1f}s: {statements} statements")
+    if result['indexes']:
+        print(f"Index suggestions: {', '.join(result['indexes'])}")
+    result['statements'] = statements
+    return result
+
+
+def upload_manifest(manifest_path, region, bucket=DUMP_BUCKET):
+    # Copies a local db_export.py export to S3 under its manifest hash;
+    # returns the S3 location of the manifest
+    manifest, base = read_manifest(manifest_path)
+    prefix = f"s3://{bucket}/{DUMP_PREFIX}/{manifest_hash(manifest_path)}"
+    s3 = boto3.client('s3', region_name=region)
+    files = [table['schema'] for table in manifest['tables']]
+    files += [chunk['file'] for table in manifest['tables'] for chunk in table['chunks']]
+    for name in files + ['manifest.json']:
+        s3.upload_file(os.path.join(base, name), bucket, split_s3(join_location(prefix, name))[1])
+    print(f"Uploaded {len(files)} export files to {prefix}")
+    return join_location(prefix, 'manifest.json')
+
+
+def seed_manifest_in_vpc(manifest_location, endpoint, username, password, db_name, vpc_id, subnet_ids,
+                         security_group_id, region, apply_indexes=None, parallelism=8):
+    # Loads a db_export.py export: schema files one by one, then one Lambda
+    # invocation per chunk, up to `parallelism` at a time
+    if not is_s3(manifest_location):
+        manifest_location = upload_manifest(manifest_location, region)
+    check_seedable(manifest_location=manifest_location, region=region)
+    manifest, base = read_manifest(manifest_location, region)
+    bucket = split_s3(base)[0]
+    ensure_s3_gateway_endpoint(vpc_id, region)
+    deploy_loader_function(create_loader_role(region, bucket), subnet_ids, security_group_id, region)
+    start = time.time()
+    for table in manifest['tables']:
+        run_loader(bucket, split_s3(join_location(base, table['schema']))[1], endpoint, username, password, db_name,
+                   region)
+    keys = [split_s3(join_location(base, chunk['file']))[1] for table in manifest['tables'] for chunk in
+            table['chunks']]
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for future in [executor.submit(run_loader, bucket, key, endpoint, username, password, db_name, region)
+                       for key in keys]:
+            future.result()
+    rows = sum(table['rows'] for table in manifest['tables'])
+    print(f"Seeded {rows:,} rows into {db_name} in the VPC in {time.time() - start:.1f}s "
+          f"({rows / (time.time() - start):,.0f} rows/s)")
+    if apply_indexes is not None:
+        run_loader(bucket, None, endpoint, username, password, db_name, region, apply_indexes)
+
+
+def seed_in_vpc(sql_file_path, endpoint, username, password, db_name, vpc_id, subnet_ids, security_group_id, region,
+                apply_indexes=None):
+    key = upload_dump(sql_file_path, region)
+    ensure_s3_gateway_endpoint(vpc_id, region)
+    role_arn = create_loader_role(region)
+    deploy_loader_function(role_arn, subnet_ids, security_group_id, region)
+    result = run_loader(DUMP_BUCKET, key, endpoint, username, password, db_name, region, apply_indexes)
+    print(f"Seeded {db_name} in the VPC: tables {', '.join(result['tables'])}")
+    return result